@@ -1,36 +1,144 @@
 
 import os
 import json
-from flask import Flask, abort, Response
+from functools import partial
+from itertools import chain
+from flask import Flask, abort, request, Response
 
+from base_client import RequestTimeout
 from battle_client import BattleClient
+from client_pool import ClientPool
 from query_client import QueryClient
+from single_flight import SingleFlight
+import wire
 
 app = Flask(__name__)
 
 mq_url = os.getenv("MQ_URL")
 battle_queue = os.getenv("BATTLE_QUEUE")
 query_queue = os.getenv("QUERY_QUEUE")
+pool_size = int(os.getenv("MQ_POOL_SIZE", 4))
+client_options = {
+    'direct_reply_to': os.getenv("MQ_DIRECT_REPLY_TO", "").lower() in [
+        '1', 't', 'true'
+    ],
+    'timeout': float(os.getenv("MQ_TIMEOUT", 10)),
+    'wire_format': wire.FORMATS.get(os.getenv("MQ_WIRE_FORMAT", "").lower())
+}
+
+query_pool = ClientPool(
+    QueryClient, mq_url, query_queue, pool_size, **client_options
+)
+battle_pool = ClientPool(
+    BattleClient, mq_url, battle_queue, pool_size, **client_options
+)
+
+# identical queries in flight at the same time share one MQ round trip
+single_flight = None
+if os.getenv("COALESCE_REQUESTS", "").lower() in ['1', 't', 'true']:
+    single_flight = SingleFlight()
+
+
+def _query(method, ident, **options):
+    def send():
+        with query_pool.client() as client:
+            return getattr(client, method)(ident, **options)
+
+    if single_flight is None:
+        return send()
+    return single_flight.do(
+        (method, ident.strip().lower()) + tuple(sorted(options.items())),
+        send
+    )
+
+
+def _stream(method, ident, **options):
+    # the pooled client is held until the last message has been read
+    with query_pool.client() as client:
+        for message in getattr(client, method)(ident, stream=True, **options):
+            yield message
+
+
+def _query_options(paged=False):
+    # ?fields=name,stats.attack trims every pokemon to those fields
+    options = {'fields': request.args.get('fields')}
+    if paged:
+        options['limit'] = request.args.get('limit')
+        options['cursor'] = request.args.get('cursor')
+    return options
+
+
+def _is_valid(result):
+    return result and isinstance(result, dict) and \
+        'code' in result and 'data' in result
 
 
 def _handle_request(func, ident):
 
     try:
         result = func(ident)
+    except RequestTimeout:
+        abort(504)
     except:
         abort(500)
     else:
-        if not result or not isinstance(result, dict):
+        if not _is_valid(result):
             abort(500)
 
-        if 'code' not in result or 'data' not in result:
-            abort(500)
-
-        return Response(
+        response = Response(
             status=result['code'],
             response=json.dumps(result['data']),
             mimetype='application/json'
         )
+        if result.get('cursor'):
+            response.headers['X-Next-Cursor'] = result['cursor']
+        return response
+
+
+def _handle_stream(messages):
+    # the first message decides the status, after that every result is
+    # written out as one line of NDJSON as its message arrives
+    try:
+        first = next(messages)
+    except RequestTimeout:
+        abort(504)
+    except:
+        abort(500)
+
+    if not _is_valid(first):
+        messages.close()
+        abort(500)
+
+    if first['code'] != 200:
+        messages.close()
+        return Response(
+            status=first['code'],
+            response=json.dumps(first['data']),
+            mimetype='application/json'
+        )
+
+    def lines():
+        try:
+            for message in chain([first], messages):
+                for item in message['data']:
+                    yield json.dumps(item) + "\n"
+        finally:
+            messages.close()
+
+    return Response(lines(), mimetype='application/x-ndjson')
+
+
+def _handle_list_request(method, ident):
+    # the routes that can return most of the pokedex take ?limit=&cursor=
+    # for a page or ?stream=true for the whole result as NDJSON
+    if request.args.get('stream', '').lower() in ['1', 't', 'true']:
+        return _handle_stream(
+            _stream(method, ident, **_query_options(paged=True))
+        )
+
+    return _handle_request(
+        partial(_query, method, **_query_options(paged=True)), ident
+    )
 
 
 @app.route("/id/<ident>")
@@ -38,10 +146,9 @@ def id(ident=None):
     if not ident:
         abort(403)
 
-    with QueryClient(mq_url, query_queue) as client:
-        return _handle_request(
-            client.get_by_id, ident
-        )
+    return _handle_request(
+        partial(_query, 'get_by_id', **_query_options()), ident
+    )
 
 
 @app.route("/name/<ident>")
@@ -49,10 +156,13 @@ def name(ident=None):
     if not ident:
         abort(403)
 
-    with QueryClient(mq_url, query_queue) as client:
+    if request.args.get('fuzzy', '').lower() in ['1', 't', 'true']:
         return _handle_request(
-            client.get_by_name, ident
+            partial(_query, 'get_by_fuzzy_name', **_query_options()), ident
         )
+    return _handle_request(
+        partial(_query, 'get_by_name', **_query_options()), ident
+    )
 
 
 @app.route("/type/<ident>")
@@ -60,10 +170,7 @@ def p_type(ident=None):
     if not ident:
         abort(403)
 
-    with QueryClient(mq_url, query_queue) as client:
-        return _handle_request(
-            client.get_by_type, ident
-        )
+    return _handle_list_request('get_by_type', ident)
 
 
 @app.route("/gen/<ident>")
@@ -71,10 +178,7 @@ def gen(ident=None):
     if not ident:
         abort(403)
 
-    with QueryClient(mq_url, query_queue) as client:
-        return _handle_request(
-            client.get_by_generation, ident
-        )
+    return _handle_list_request('get_by_generation', ident)
 
 
 @app.route("/legend/<ident>")
@@ -82,10 +186,7 @@ def legend(ident=None):
     if not ident:
         abort(403)
 
-    with QueryClient(mq_url, query_queue) as client:
-        return _handle_request(
-            client.get_by_legendary, ident
-        )
+    return _handle_list_request('get_by_legendary', ident)
 
 
 @app.route("/stats/<ident>")
@@ -93,10 +194,14 @@ def stats(ident=None):
     if not ident:
         abort(403)
 
-    with QueryClient(mq_url, query_queue) as client:
-        return _handle_request(
-            client.get_by_stats, ident
-        )
+    return _handle_list_request('get_by_stats', ident)
+
+
+def _battle(method, *args, **options):
+    # the client is borrowed inside _handle_request, so a pool with none
+    # free in time is a 504 like any other timeout
+    with battle_pool.client() as client:
+        return getattr(client, method)(*args, **options)
 
 
 @app.route("/battle/<ident>")
@@ -104,7 +209,57 @@ def battle(ident=None):
     if not ident:
         abort(403)
 
-    with BattleClient(mq_url, battle_queue) as client:
-        return _handle_request(
-            client.do_battle, ident
-        )
+    # ?log=false answers with just the outcome, without the turn log, and
+    # ?seed=<n> settles speed ties the same way every time
+    log = None
+    if request.args.get('log', '').lower() in ['0', 'f', 'false']:
+        log = False
+
+    return _handle_request(
+        partial(_battle, 'do_battle', log=log, seed=request.args.get('seed')),
+        ident
+    )
+
+
+def _battle_pairs():
+    # {"pairs": [[pid1, pid2], ...], "seed": <n>}, the seed is optional
+    body = request.get_json(silent=True)
+    pairs = body.get('pairs') if isinstance(body, dict) else None
+    if not pairs or not isinstance(pairs, list):
+        abort(403)
+    if not all(isinstance(pair, list) and len(pair) == 2 for pair in pairs):
+        abort(403)
+    return pairs, body.get('seed')
+
+
+@app.route("/battles", methods=['POST'])
+def battles():
+    pairs, seed = _battle_pairs()
+
+    return _handle_request(partial(_battle, 'do_battles', seed=seed), pairs)
+
+
+@app.route("/tournament/<q_type>/<ident>")
+def tournament(q_type=None, ident=None):
+    # ?format=bracket for single elimination, ?stream=true for the
+    # standings after every chunk of battles as NDJSON
+    if not q_type or not ident:
+        abort(403)
+
+    options = {
+        'format': request.args.get('format'),
+        'seed': request.args.get('seed')
+    }
+    if request.args.get('stream', '').lower() in ['1', 't', 'true']:
+        return _handle_stream(_tournament_stream(q_type, ident, **options))
+
+    return _handle_request(
+        partial(_battle, 'tournament', q_type, **options), ident
+    )
+
+
+def _tournament_stream(q_type, ident, **options):
+    with battle_pool.client() as client:
+        for message in client.tournament(q_type, ident, stream=True,
+                                         **options):
+            yield message
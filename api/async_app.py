@@ -0,0 +1,238 @@
+import asyncio
+import json
+import os
+import uuid
+
+import aio_pika
+from aiohttp import web
+
+import wire
+from base_client import DEFAULT_TIMEOUT, format_query
+
+mq_url = os.getenv("MQ_URL")
+battle_queue = os.getenv("BATTLE_QUEUE")
+query_queue = os.getenv("QUERY_QUEUE")
+
+
+class AsyncRpcClient(object):
+    # One connection and reply queue for the whole process, every request
+    # in flight waits on its own future keyed by correlation id
+
+    def __init__(self, url, timeout=DEFAULT_TIMEOUT, coalesce=False,
+                 wire_format=None):
+        self.url = url
+        self.timeout = timeout
+        self.futures = {}
+        # same meaning as for BaseClient
+        if wire_format is not None and wire_format not in wire.CODECS:
+            wire_format = wire.JSON
+        self.wire_format = wire_format
+
+        # identical shared calls in flight at the same time await one task
+        self.coalesce = coalesce
+        self.inflight = {}
+
+    async def connect(self):
+        self.connection = await aio_pika.connect_robust(self.url)
+        self.channel = await self.connection.channel()
+        self.callback_queue = await self.channel.declare_queue(exclusive=True)
+        await self.callback_queue.consume(self._on_response, no_ack=True)
+
+    async def close(self):
+        for future in self.futures.values():
+            future.cancel()
+        await self.connection.close()
+
+    async def _on_response(self, message):
+        future = self.futures.pop(message.correlation_id, None)
+        if future is not None and not future.done():
+            future.set_result(
+                wire.decode(message.body, message.content_type)
+            )
+
+    def _encode(self, q_type, args, options):
+        # (body, content_type), options only fit in an envelope
+        if self.wire_format is None and not options:
+            return format_query(q_type, *args).encode("utf-8"), None
+
+        content_type = self.wire_format or wire.JSON
+        return wire.encode_request(
+            q_type, args, options, content_type
+        ), content_type
+
+    async def call(self, queue_name, q_type, *args, shared=False, **options):
+        options = {k: v for k, v in options.items() if v is not None}
+        message, content_type = self._encode(q_type, args, options)
+        if not (shared and self.coalesce):
+            return await self._call(queue_name, message, content_type)
+
+        key = (queue_name, q_type) + tuple(
+            arg.strip().lower() for arg in args
+        ) + tuple(sorted(options.items()))
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(
+                self._call(queue_name, message, content_type)
+            )
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        # one caller going away must not cancel the others
+        return await asyncio.shield(task)
+
+    async def _call(self, queue_name, message, content_type):
+        corr_id = str(uuid.uuid4())
+        future = asyncio.get_event_loop().create_future()
+        self.futures[corr_id] = future
+        try:
+            await self.channel.default_exchange.publish(
+                aio_pika.Message(
+                    body=message,
+                    content_type=content_type,
+                    correlation_id=corr_id,
+                    reply_to=self.callback_queue.name
+                ),
+                routing_key=queue_name
+            )
+            return await asyncio.wait_for(future, self.timeout)
+        finally:
+            self.futures.pop(corr_id, None)
+
+
+def _route(queue_name, q_type, fuzzy_type=None, split=None, paged=False):
+    async def handler(request):
+        ident = request.match_info['ident']
+        if not ident:
+            raise web.HTTPForbidden()
+
+        args = ident.split(split) if split else [ident]
+        r_type = q_type
+        if fuzzy_type and request.query.get('fuzzy', '').lower() in [
+                '1', 't', 'true']:
+            r_type = fuzzy_type
+
+        options = {}
+        if queue_name == query_queue:
+            options['fields'] = request.query.get('fields')
+        else:
+            options['seed'] = request.query.get('seed')
+            if request.query.get('log', '').lower() in ['0', 'f', 'false']:
+                options['log'] = False
+        if paged:
+            options['limit'] = request.query.get('limit')
+            options['cursor'] = request.query.get('cursor')
+
+        try:
+            result = await request.app['rpc'].call(
+                queue_name, r_type, *args, shared=queue_name == query_queue,
+                **options
+            )
+        except asyncio.TimeoutError:
+            raise web.HTTPGatewayTimeout()
+        except Exception:
+            raise web.HTTPInternalServerError()
+
+        if not isinstance(result, dict) or \
+                'code' not in result or 'data' not in result:
+            raise web.HTTPInternalServerError()
+
+        response = web.Response(
+            status=result['code'],
+            text=json.dumps(result['data']),
+            content_type='application/json'
+        )
+        if result.get('cursor'):
+            response.headers['X-Next-Cursor'] = result['cursor']
+        return response
+    return handler
+
+
+async def _start_rpc(app):
+    app['rpc'] = AsyncRpcClient(
+        mq_url, float(os.getenv("MQ_TIMEOUT", DEFAULT_TIMEOUT)),
+        os.getenv("COALESCE_REQUESTS", "").lower() in ['1', 't', 'true'],
+        wire.FORMATS.get(os.getenv("MQ_WIRE_FORMAT", "").lower())
+    )
+    await app['rpc'].connect()
+
+
+async def _stop_rpc(app):
+    await app['rpc'].close()
+
+
+async def _battles(request):
+    # POST {"pairs": [[pid1, pid2], ...]}, as /battles on the Flask API
+    try:
+        body = await request.json()
+    except ValueError:
+        raise web.HTTPForbidden()
+    pairs = body.get('pairs') if isinstance(body, dict) else None
+    if not pairs or not isinstance(pairs, list) or not all(
+            isinstance(pair, list) and len(pair) == 2 for pair in pairs):
+        raise web.HTTPForbidden()
+
+    try:
+        result = await request.app['rpc'].call(
+            battle_queue, 'BATTLES',
+            *["{},{}".format(pid_1, pid_2) for pid_1, pid_2 in pairs],
+            seed=body.get('seed')
+        )
+    except asyncio.TimeoutError:
+        raise web.HTTPGatewayTimeout()
+    except Exception:
+        raise web.HTTPInternalServerError()
+
+    if not isinstance(result, dict) or \
+            'code' not in result or 'data' not in result:
+        raise web.HTTPInternalServerError()
+
+    return web.Response(
+        status=result['code'],
+        text=json.dumps(result['data']),
+        content_type='application/json'
+    )
+
+
+async def _tournament(request):
+    # the final standings only, streaming is left to the Flask API
+    try:
+        result = await request.app['rpc'].call(
+            battle_queue, 'TOURNAMENT', request.match_info['q_type'],
+            request.match_info['ident'], format=request.query.get('format'),
+            seed=request.query.get('seed')
+        )
+    except asyncio.TimeoutError:
+        raise web.HTTPGatewayTimeout()
+    except Exception:
+        raise web.HTTPInternalServerError()
+
+    if not isinstance(result, dict) or \
+            'code' not in result or 'data' not in result:
+        raise web.HTTPInternalServerError()
+
+    return web.Response(
+        status=result['code'],
+        text=json.dumps(result['data']),
+        content_type='application/json'
+    )
+
+
+def make_app():
+    app = web.Application()
+    app.on_startup.append(_start_rpc)
+    app.on_cleanup.append(_stop_rpc)
+    app.add_routes([
+        web.get('/id/{ident}', _route(query_queue, 'ID')),
+        web.get('/name/{ident}', _route(query_queue, 'NAME', 'FUZZY')),
+        web.get('/type/{ident}', _route(query_queue, 'TYPE', paged=True)),
+        web.get('/gen/{ident}', _route(query_queue, 'GEN', paged=True)),
+        web.get('/legend/{ident}', _route(query_queue, 'LEGEND', paged=True)),
+        web.get('/stats/{ident}', _route(query_queue, 'STATS', paged=True)),
+        web.get('/battle/{ident}', _route(battle_queue, 'BATTLE', split=':')),
+        web.post('/battles', _battles),
+        web.get('/tournament/{q_type}/{ident}', _tournament)
+    ])
+    return app
+
+
+if __name__ == '__main__':
+    web.run_app(make_app(), port=int(os.getenv("PORT", 5000)))
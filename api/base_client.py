@@ -1,57 +1,155 @@
 import pika
 import time
 import uuid
-import json
 
+import wire
 
-def format_query(q_type, data):
-    return "{}:{}".format(q_type, data)
+
+DIRECT_REPLY_TO = 'amq.rabbitmq.reply-to'
+DEFAULT_TIMEOUT = 10
+
+
+class RequestTimeout(Exception):
+    pass
+
+
+def format_query(q_type, *args):
+    return ":".join(str(arg) for arg in (q_type,) + args)
 
 
 class BaseClient(object):
     retries = 3
 
-    def __init__(self, url, queue_name):
+    def __init__(self, url, queue_name,
+                 direct_reply_to=False, timeout=DEFAULT_TIMEOUT,
+                 wire_format=None):
         self.url = url
         self.queue_name = queue_name
+        self.direct_reply_to = direct_reply_to
+        self.timeout = timeout
+        # None keeps the colon separated text requests, a content type from
+        # wire.CODECS sends request envelopes and gets replies in kind
+        if wire_format is not None and wire_format not in wire.CODECS:
+            wire_format = wire.JSON
+        self.wire_format = wire_format
+        self.connection = None
+        self.channel = None
+        self.responses = {}
 
     def __enter__(self):
-        try:
-            self.connection = pika.BlockingConnection(
-                pika.URLParameters(self.url)
-            )
-        except pika.exceptions.ConnectionClosed:
-            if not self.retries:
-                raise
-            self.retries -= 1
-            time.sleep(2)
+        self.connect()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def connect(self):
+        retries = self.retries
+        while True:
+            try:
+                self.connection = pika.BlockingConnection(
+                    pika.URLParameters(self.url)
+                )
+                break
+            except pika.exceptions.AMQPConnectionError:
+                if not retries:
+                    raise
+                retries -= 1
+                time.sleep(2)
 
         self.channel = self.connection.channel()
-        result = self.channel.queue_declare(exclusive=True)
-        self.callback_queue = result.method.queue
+        if self.direct_reply_to:
+            # RabbitMQ's pseudo-queue, replies come straight back to this
+            # channel without declaring a queue of our own
+            self.callback_queue = DIRECT_REPLY_TO
+        else:
+            result = self.channel.queue_declare(exclusive=True)
+            self.callback_queue = result.method.queue
 
         self.channel.basic_consume(self._on_query_response, no_ack=True,
                                    queue=self.callback_queue)
-        return self
 
-    def __exit__(self, type, value, traceback):
-        self.channel.close()
-        self.connection.close()
+    def close(self):
+        try:
+            if self.connection and self.connection.is_open:
+                self.connection.close()
+        except pika.exceptions.AMQPError:
+            pass
+        self.connection = None
+        self.channel = None
+        self.responses = {}
+
+    def is_open(self):
+        # also services heartbeats for a client that sat idle in a pool
+        if not self.connection or not self.connection.is_open:
+            return False
+        try:
+            self.connection.process_data_events(time_limit=0)
+        except pika.exceptions.AMQPError:
+            return False
+        return self.channel.is_open
+
+    def _request(self, q_type, *args, **options):
+        options = {k: v for k, v in options.items() if v is not None}
+        if self.wire_format is None and not options:
+            return self._send_request(format_query(q_type, *args))
 
-    def _send_request(self, message):
-        self.response = None
+        # options only fit in an envelope
+        content_type = self.wire_format or wire.JSON
+        message = wire.encode_request(q_type, args, options, content_type)
+        if options.get('stream'):
+            return self._stream_request(message, content_type)
+        return self._send_request(message, content_type)
+
+    def _publish_request(self, message, content_type):
         corr_id = str(uuid.uuid4())
+        self.responses[corr_id] = []
         self.channel.basic_publish(
             exchange='', routing_key=self.queue_name,
             properties=pika.BasicProperties(
                 reply_to=self.callback_queue,
                 correlation_id=corr_id,
+                content_type=content_type
             ), body=message)
+        return corr_id
+
+    def _next_response(self, corr_id):
+        deadline = time.time() + self.timeout
+        while not self.responses[corr_id]:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                del self.responses[corr_id]
+                raise RequestTimeout(
+                    "No response to {} within {}s".format(corr_id, self.timeout)
+                )
+            # blocks until something arrives or the time is up
+            self.connection.process_data_events(time_limit=remaining)
 
-        while self.response is None:
-            self.connection.process_data_events()
+        return self.responses[corr_id].pop(0)
 
-        return self.response
+    def _send_request(self, message, content_type=None):
+        corr_id = self._publish_request(message, content_type)
+        response = self._next_response(corr_id)
+        del self.responses[corr_id]
+        return response
+
+    def _stream_request(self, message, content_type):
+        # yields each message of a streamed response as it arrives, the
+        # timeout applies to the wait for every one of them
+        corr_id = self._publish_request(message, content_type)
+        try:
+            while True:
+                response = self._next_response(corr_id)
+                yield response
+                if not response.get('more'):
+                    return
+        finally:
+            self.responses.pop(corr_id, None)
 
     def _on_query_response(self, ch, method, props, body):
-        self.response = json.loads(body.decode("ASCII"))
+        # replies are matched on correlation id, anything left over from
+        # an earlier, abandoned request is dropped
+        if props.correlation_id in self.responses:
+            self.responses[props.correlation_id].append(
+                wire.decode(body, props.content_type)
+            )
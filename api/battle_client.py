@@ -1,9 +1,22 @@
 
-from base_client import BaseClient, format_query
+from base_client import BaseClient
 
 
 class BattleClient(BaseClient):
     retries = 3
 
-    def do_battle(self, ident):
-        return self._send_request(format_query("BATTLE", ident))
+    def do_battle(self, ident, **options):
+        # "pid1:pid2"
+        return self._request("BATTLE", *ident.split(":"), **options)
+
+    def do_battles(self, pairs, **options):
+        # [(pid1, pid2), ...] fought in one request, only the outcome of
+        # each comes back
+        return self._request("BATTLES", *[
+            "{},{}".format(pid_1, pid_2) for pid_1, pid_2 in pairs
+        ], **options)
+
+    def tournament(self, q_type, ident, **options):
+        # entrants picked by a TYPE, GEN, LEGEND or STATS query, a
+        # generator of updates when streamed
+        return self._request("TOURNAMENT", q_type, ident, **options)
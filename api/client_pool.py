@@ -0,0 +1,103 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import pika
+
+from base_client import DEFAULT_TIMEOUT, RequestTimeout
+
+# how often a borrower waiting on a full pool looks for a freed slot
+RECHECK_INTERVAL = 0.5
+
+
+class ClientPool(object):
+    # Long lived clients shared by the request threads of one worker, each
+    # keeps its connection, channel and reply queue between requests
+
+    def __init__(self, client_cls, url, queue_name, size, **client_kwargs):
+        self.client_cls = client_cls
+        self.url = url
+        self.queue_name = queue_name
+        self.size = size
+        self.client_kwargs = client_kwargs
+        # a borrower waits as long as a request would for its reply
+        self.timeout = client_kwargs.get('timeout', DEFAULT_TIMEOUT)
+
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _take(self):
+        # an idle client, a new one while the pool has room, otherwise
+        # wait for either until the timeout (streams hold theirs for long)
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                return self.client_cls(
+                    self.url, self.queue_name, **self.client_kwargs
+                )
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise RequestTimeout(
+                    "No client free within {}s".format(self.timeout)
+                )
+            try:
+                # slots freed by a discarded client are not put back, so
+                # the wait is cut short to look for them
+                return self._idle.get(
+                    timeout=min(remaining, RECHECK_INTERVAL)
+                )
+            except queue.Empty:
+                pass
+
+    def _acquire(self):
+        client = self._take()
+
+        if not client.is_open():
+            client.close()
+            try:
+                client.connect()
+            except Exception:
+                self._discard()
+                raise
+        return client
+
+    def _discard(self):
+        with self._lock:
+            self._created -= 1
+
+    @contextmanager
+    def client(self):
+        client = self._acquire()
+        healthy = True
+        try:
+            yield client
+        except pika.exceptions.AMQPError:
+            healthy = False
+            raise
+        finally:
+            if healthy:
+                self._idle.put(client)
+            else:
+                # connection state is unknown, the next user gets a fresh one
+                client.close()
+                self._discard()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+            self._discard()
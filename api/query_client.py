@@ -1,23 +1,26 @@
 
-from base_client import BaseClient, format_query
+from base_client import BaseClient
 
 
 class QueryClient(BaseClient):
 
-    def get_by_id(self, ident):
-        return self._send_request(format_query("ID", ident))
+    def get_by_id(self, ident, **options):
+        return self._request("ID", ident, **options)
 
-    def get_by_name(self, name):
-        return self._send_request(format_query("NAME", name))
+    def get_by_name(self, name, **options):
+        return self._request("NAME", name, **options)
 
-    def get_by_type(self, p_type):
-        return self._send_request(format_query("TYPE", p_type))
+    def get_by_fuzzy_name(self, name, **options):
+        return self._request("FUZZY", name, **options)
 
-    def get_by_generation(self, gen):
-        return self._send_request(format_query("GEN", gen))
+    def get_by_type(self, p_type, **options):
+        return self._request("TYPE", p_type, **options)
 
-    def get_by_legendary(self, is_legend):
-        return self._send_request(format_query("LEGEND", is_legend))
+    def get_by_generation(self, gen, **options):
+        return self._request("GEN", gen, **options)
 
-    def get_by_stats(self, stats):
-        return self._send_request(format_query("STATS", stats))
+    def get_by_legendary(self, is_legend, **options):
+        return self._request("LEGEND", is_legend, **options)
+
+    def get_by_stats(self, stats, **options):
+        return self._request("STATS", stats, **options)
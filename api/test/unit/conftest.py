@@ -0,0 +1,105 @@
+import asyncio
+import os
+import sys
+
+import pika
+import pytest
+from mock import MagicMock
+
+# the api modules are run as scripts from the api directory, not a package
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import wire  # noqa: E402
+
+
+class FakeConnection(object):
+    # replies queued in pending are delivered the next time events are
+    # processed, with nothing to deliver it waits out time_limit
+
+    def __init__(self, client, sleep):
+        self.client = client
+        self.sleep = sleep
+        self.pending = []
+        self.waits = []
+        self.is_open = True
+
+    def process_data_events(self, time_limit=0):
+        self.waits.append(time_limit)
+        if not self.pending:
+            self.sleep(time_limit)
+        pending, self.pending = self.pending, []
+        for corr_id, body in pending:
+            self.client._on_query_response(
+                None, None,
+                pika.BasicProperties(correlation_id=corr_id,
+                                     content_type=wire.JSON),
+                wire.encode(body)
+            )
+
+
+@pytest.fixture
+def fake_connection():
+    # (client, connection) for a BaseClient that never opens a socket,
+    # request() makes the next publish get body back as its reply
+    def connect(client, sleep=lambda seconds: None):
+        connection = FakeConnection(client, sleep)
+        client.connection = connection
+        client.channel = MagicMock()
+        client.callback_queue = 'replies'
+
+        def reply(body):
+            def publish(properties, **kwargs):
+                connection.pending.append((properties.correlation_id, body))
+            client.channel.basic_publish.side_effect = publish
+
+        return connection, reply
+
+    yield connect
+
+
+class FakeReply(object):
+
+    def __init__(self, corr_id, body, content_type=wire.JSON):
+        self.correlation_id = corr_id
+        self.body = wire.encode(body, content_type)
+        self.content_type = content_type
+
+
+class FakeExchange(object):
+    # stands in for the default exchange of an AsyncRpcClient, respond
+    # turns each published message into the reply body, None for no reply
+
+    def __init__(self, client, respond):
+        self.client = client
+        self.respond = respond
+        self.published = []
+
+    async def publish(self, message, routing_key):
+        self.published.append((message, routing_key))
+        body = self.respond(message)
+        if body is not None:
+            # delivered later, as the consumer would
+            asyncio.get_event_loop().call_soon(
+                asyncio.ensure_future, self.deliver(
+                    message.correlation_id, body, message.content_type
+                )
+            )
+
+    async def deliver(self, corr_id, body, content_type=wire.JSON):
+        await self.client._on_response(
+            FakeReply(corr_id, body, content_type or wire.JSON)
+        )
+
+
+@pytest.fixture
+def fake_exchange():
+    # an AsyncRpcClient wired to a FakeExchange instead of a connection
+    def connect(client, respond=lambda message: None):
+        exchange = FakeExchange(client, respond)
+        client.channel = MagicMock()
+        client.channel.default_exchange = exchange
+        client.callback_queue = MagicMock()
+        client.callback_queue.name = 'replies'
+        return exchange
+
+    yield connect
@@ -0,0 +1,263 @@
+import asyncio
+import json
+
+import pytest
+import wire
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+import async_app
+from async_app import AsyncRpcClient
+
+
+def _echo(message):
+    # every request answered with what it asked for
+    if message.content_type is None:
+        return {'code': 200, 'data': message.body.decode('utf-8')}
+    return {'code': 200, 'data': wire.decode(message.body,
+                                             message.content_type)}
+
+
+def test_call(fake_exchange):
+    client = AsyncRpcClient("")
+    exchange = fake_exchange(client, _echo)
+
+    result = asyncio.run(client.call('qq', 'NAME', 'pika'))
+
+    assert result == {'code': 200, 'data': 'NAME:pika'}
+    message, routing_key = exchange.published[0]
+    assert routing_key == 'qq'
+    assert message.reply_to == 'replies'
+    assert message.content_type is None
+    assert client.futures == {}
+
+
+def test_call_envelope(fake_exchange):
+    client = AsyncRpcClient("", wire_format=wire.MSGPACK)
+    fake_exchange(client, _echo)
+
+    result = asyncio.run(
+        client.call('qq', 'TYPE', 'fire', fields='id', limit=None)
+    )
+
+    # options left unset are not sent
+    assert result['data'] == {
+        'type': 'TYPE', 'args': ['fire'], 'options': {'fields': 'id'}
+    }
+
+
+def test_call_concurrent(fake_exchange):
+    client = AsyncRpcClient("")
+    exchange = fake_exchange(client, _echo)
+
+    async def calls():
+        return await asyncio.gather(*[
+            client.call('qq', 'ID', str(i)) for i in range(200)
+        ])
+
+    results = asyncio.run(calls())
+
+    # every caller gets the reply to its own request
+    assert [r['data'] for r in results] == [
+        'ID:{}'.format(i) for i in range(200)
+    ]
+    assert len({m.correlation_id for m, _ in exchange.published}) == 200
+    assert client.futures == {}
+
+
+def test_call_timeout(fake_exchange):
+    client = AsyncRpcClient("", timeout=0.01)
+    exchange = fake_exchange(client)
+
+    async def late_reply():
+        with pytest.raises(asyncio.TimeoutError):
+            await client.call('qq', 'ID', '1')
+        # the future is gone, a reply arriving now is dropped
+        assert client.futures == {}
+        await exchange.deliver(
+            exchange.published[0][0].correlation_id, {'code': 200}
+        )
+
+    asyncio.run(late_reply())
+    assert client.futures == {}
+
+
+def test_reply_for_unknown_request_dropped(fake_exchange):
+    client = AsyncRpcClient("")
+    exchange = fake_exchange(client)
+
+    asyncio.run(exchange.deliver('abandoned', {'code': 200}))
+    assert client.futures == {}
+
+
+def _coalescing_client(fake_exchange, replies):
+    # nothing is answered until reply_all(), once count requests are out
+    client = AsyncRpcClient("", timeout=1, coalesce=True)
+    held = []
+
+    def respond(message):
+        held.append(message.correlation_id)
+        return None
+
+    exchange = fake_exchange(client, respond)
+
+    async def reply_all(count):
+        for _ in range(100):
+            if len(held) >= count:
+                break
+            await asyncio.sleep(0)
+        for corr_id in held:
+            await exchange.deliver(corr_id, replies)
+
+    return client, exchange, reply_all
+
+
+def test_call_coalesced(fake_exchange):
+    client, exchange, reply_all = _coalescing_client(
+        fake_exchange, {'code': 200, 'data': [1]}
+    )
+
+    async def calls():
+        callers = [
+            asyncio.ensure_future(client.call(
+                'qq', 'TYPE', ident, shared=True, fields='id'
+            )) for ident in ['fire', ' Fire ', 'FIRE']
+        ]
+        await asyncio.sleep(0)
+        assert len(client.inflight) == 1
+        await reply_all(1)
+        return await asyncio.gather(*callers)
+
+    results = asyncio.run(calls())
+
+    assert len(exchange.published) == 1
+    assert all(r == {'code': 200, 'data': [1]} for r in results)
+    assert client.inflight == {}
+
+
+def test_call_not_shared(fake_exchange):
+    client, exchange, reply_all = _coalescing_client(
+        fake_exchange, {'code': 200, 'data': 'ok'}
+    )
+
+    async def calls():
+        callers = [
+            asyncio.ensure_future(client.call('qq', 'BATTLE', '1', '2'))
+            for _ in range(3)
+        ]
+        await reply_all(3)
+        return await asyncio.gather(*callers)
+
+    assert len(asyncio.run(calls())) == 3
+    assert len(exchange.published) == 3
+    assert client.inflight == {}
+
+
+def test_call_coalesced_cancel_one(fake_exchange):
+    client, exchange, reply_all = _coalescing_client(
+        fake_exchange, {'code': 200, 'data': [1]}
+    )
+
+    async def calls():
+        first, second = [
+            asyncio.ensure_future(client.call('qq', 'TYPE', 'fire',
+                                              shared=True))
+            for _ in range(2)
+        ]
+        await asyncio.sleep(0)
+        # the caller that goes away does not take the shared call with it
+        first.cancel()
+        await reply_all(1)
+        await asyncio.sleep(0)
+        assert first.cancelled()
+        return await second
+
+    assert asyncio.run(calls()) == {'code': 200, 'data': [1]}
+    assert len(exchange.published) == 1
+    assert client.inflight == {}
+
+
+class FakeRpc(object):
+    # records each call and answers with result, or raises it
+
+    def __init__(self, result):
+        self.result = result
+        self.calls = []
+
+    async def call(self, queue_name, q_type, *args, **options):
+        self.calls.append((queue_name, q_type, args, options))
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+@pytest.fixture
+def queues(monkeypatch):
+    monkeypatch.setattr(async_app, 'query_queue', 'query')
+    monkeypatch.setattr(async_app, 'battle_queue', 'battle')
+
+
+def _get(handler, path, result, **match_info):
+    app = web.Application()
+    app['rpc'] = FakeRpc(result)
+    request = make_mocked_request('GET', path, match_info=match_info,
+                                  app=app)
+    return asyncio.run(handler(request)), app['rpc'].calls
+
+
+@pytest.mark.parametrize(
+    "path, paged, r_type, options", [
+        ('/type/fire', True, 'TYPE',
+         {'fields': None, 'limit': None, 'cursor': None}),
+        ('/type/fire?limit=2&cursor=4&fields=id', True, 'TYPE',
+         {'fields': 'id', 'limit': '2', 'cursor': '4'}),
+        ('/name/fire?fields=name', False, 'NAME', {'fields': 'name'}),
+        ('/name/fire?fuzzy=true', False, 'FUZZY', {'fields': None})
+    ]
+)
+def test_route_query(queues, path, paged, r_type, options):
+    handler = async_app._route('query', path.split('/')[1].upper(),
+                               'FUZZY', paged=paged)
+    response, calls = _get(
+        handler, path, {'code': 200, 'data': [1], 'cursor': '6'},
+        ident='fire'
+    )
+
+    assert calls == [('query', r_type, ('fire',),
+                      dict(options, shared=True))]
+    assert response.status == 200
+    assert json.loads(response.text) == [1]
+    assert response.headers['X-Next-Cursor'] == '6'
+
+
+@pytest.mark.parametrize(
+    "path, options", [
+        ('/battle/1:2', {'seed': None}),
+        ('/battle/1:2?log=false&seed=7', {'seed': '7', 'log': False})
+    ]
+)
+def test_route_battle(queues, path, options):
+    handler = async_app._route('battle', 'BATTLE', split=':')
+    response, calls = _get(
+        handler, path, {'code': 404, 'data': 'Could not find pokemon'},
+        ident='1:2'
+    )
+
+    assert calls == [('battle', 'BATTLE', ('1', '2'),
+                      dict(options, shared=False))]
+    assert response.status == 404
+    assert 'X-Next-Cursor' not in response.headers
+
+
+@pytest.mark.parametrize(
+    "result, error", [
+        (asyncio.TimeoutError(), web.HTTPGatewayTimeout),
+        (KeyError('boom'), web.HTTPInternalServerError),
+        ({'code': 200}, web.HTTPInternalServerError),
+        ('not a reply', web.HTTPInternalServerError)
+    ]
+)
+def test_route_errors(queues, result, error):
+    handler = async_app._route('query', 'ID')
+    with pytest.raises(error):
+        _get(handler, '/id/1', result, ident='1')
@@ -0,0 +1,145 @@
+import pika
+import pytest
+import wire
+from mock import MagicMock, patch
+from base_client import BaseClient, RequestTimeout
+
+
+def _client(fake_connection, **options):
+    client = BaseClient("", "qq", wire_format=wire.JSON, **options)
+    connection, reply = fake_connection(client)
+    return client, connection, reply
+
+
+def test_request(fake_connection):
+    client, connection, reply = _client(fake_connection)
+    reply({'code': 200, 'data': 'ok'})
+
+    assert client._request('NAME', 'pika') == {'code': 200, 'data': 'ok'}
+    properties = client.channel.basic_publish.call_args[1]['properties']
+    assert properties.reply_to == 'replies'
+    assert properties.content_type == wire.JSON
+    assert client.responses == {}
+
+
+def test_reply_for_another_request_dropped(fake_connection):
+    client, connection, reply = _client(fake_connection)
+    connection.pending.append(('abandoned', {'code': 200, 'data': 'old'}))
+    reply({'code': 200, 'data': 'new'})
+
+    assert client._request('NAME', 'pika')['data'] == 'new'
+    assert client.responses == {}
+
+
+def test_replies_matched_on_correlation_id(fake_connection):
+    client, connection, reply = _client(fake_connection)
+    first = client._publish_request(b'1', wire.JSON)
+    second = client._publish_request(b'2', wire.JSON)
+    connection.pending += [(second, {'data': 2}), (first, {'data': 1})]
+
+    assert client._next_response(first) == {'data': 1}
+    assert client._next_response(second) == {'data': 2}
+
+
+def test_text_request_without_options(fake_connection):
+    client = BaseClient("", "qq")
+    connection, reply = fake_connection(client)
+    reply({'code': 200, 'data': []})
+
+    client._request('TYPE', 'fire')
+
+    publish = client.channel.basic_publish.call_args[1]
+    assert publish['body'] == 'TYPE:fire'
+    assert publish['properties'].content_type is None
+
+
+def test_is_open(fake_connection):
+    client, connection, _ = _client(fake_connection)
+    assert client.is_open()
+
+    client.channel.is_open = False
+    assert not client.is_open()
+
+    client.channel.is_open = True
+    connection.process_data_events = MagicMock(
+        side_effect=pika.exceptions.AMQPConnectionError()
+    )
+    assert not client.is_open()
+    assert not BaseClient("", "qq").is_open()
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    clock = FakeClock()
+    with patch('base_client.time.time', clock.time):
+        yield clock
+
+
+def _timed_client(fake_connection, clock, timeout=5):
+    client = BaseClient("", "qq", wire_format=wire.JSON, timeout=timeout)
+    connection, reply = fake_connection(client, clock.sleep)
+    return client, connection, reply
+
+
+def test_request_timeout(fake_connection, clock):
+    client, connection, _ = _timed_client(fake_connection, clock)
+
+    with pytest.raises(RequestTimeout):
+        client._request('NAME', 'pika')
+
+    assert clock.now == 1005.0
+    assert client.responses == {}
+    # one wait for the whole deadline, never longer
+    assert connection.waits == [5]
+
+
+def test_deadline_not_reset_by_other_replies(fake_connection, clock):
+    client, connection, _ = _timed_client(fake_connection, clock)
+
+    def stray(time_limit=0):
+        # something arrives for another request every second
+        connection.waits.append(time_limit)
+        clock.sleep(1)
+        client._on_query_response(
+            None, None, pika.BasicProperties(correlation_id='other'), b'{}'
+        )
+    connection.process_data_events = stray
+
+    with pytest.raises(RequestTimeout):
+        client._request('NAME', 'pika')
+    assert connection.waits == [5, 4, 3, 2, 1]
+
+
+def test_late_reply_dropped(fake_connection, clock):
+    client, connection, reply = _timed_client(fake_connection, clock)
+    with pytest.raises(RequestTimeout):
+        client._request('NAME', 'pika')
+    late = client.channel.basic_publish.call_args[1]['properties']
+    connection.pending.append((late.correlation_id, {'data': 'late'}))
+
+    reply({'code': 200, 'data': 'on time'})
+    assert client._request('NAME', 'pika')['data'] == 'on time'
+    assert client.responses == {}
+
+
+def test_stream_timeout(fake_connection, clock):
+    client, connection, reply = _timed_client(fake_connection, clock)
+    reply({'code': 200, 'data': [1], 'more': True})
+
+    messages = client._request('TYPE', 'fire', stream=True)
+    assert next(messages)['data'] == [1]
+    with pytest.raises(RequestTimeout):
+        next(messages)
+    assert client.responses == {}
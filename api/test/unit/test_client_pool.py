@@ -0,0 +1,152 @@
+import threading
+import time
+
+import pika
+import pytest
+from mock import MagicMock
+from base_client import RequestTimeout
+from client_pool import ClientPool
+
+
+@pytest.fixture
+def client_cls():
+    yield MagicMock(side_effect=lambda *args, **kwargs: MagicMock())
+
+
+def _pool(client_cls, size=2, timeout=1):
+    return ClientPool(client_cls, "url", "qq", size, timeout=timeout)
+
+
+def test_client_reused(client_cls):
+    pool = _pool(client_cls)
+
+    with pool.client() as first:
+        pass
+    with pool.client() as second:
+        pass
+
+    assert first is second
+    client_cls.assert_called_once_with("url", "qq", timeout=1)
+
+
+def test_broken_client_discarded(client_cls):
+    pool = _pool(client_cls, size=1)
+
+    with pytest.raises(pika.exceptions.AMQPConnectionError):
+        with pool.client() as broken:
+            raise pika.exceptions.AMQPConnectionError()
+    with pool.client() as client:
+        pass
+
+    broken.close.assert_called_once_with()
+    assert client is not broken
+    assert client_cls.call_count == 2
+
+
+def test_other_errors_keep_client(client_cls):
+    pool = _pool(client_cls)
+
+    with pytest.raises(ValueError):
+        with pool.client() as first:
+            raise ValueError()
+    with pool.client() as second:
+        pass
+
+    assert first is second
+    assert not first.close.called
+
+
+def test_reconnect_on_borrow(client_cls):
+    pool = _pool(client_cls)
+    with pool.client() as client:
+        pass
+
+    client.is_open.return_value = False
+    with pool.client() as again:
+        pass
+
+    assert again is client
+    client.close.assert_called_once_with()
+    client.connect.assert_called_once_with()
+
+
+def test_reconnect_failure_frees_slot(client_cls):
+    pool = _pool(client_cls, size=1)
+    with pool.client() as client:
+        pass
+
+    client.is_open.return_value = False
+    client.connect.side_effect = pika.exceptions.AMQPConnectionError()
+    with pytest.raises(pika.exceptions.AMQPConnectionError):
+        with pool.client():
+            pass
+
+    with pool.client() as fresh:
+        pass
+    assert fresh is not client
+
+
+def test_full_pool_times_out(client_cls):
+    pool = _pool(client_cls, size=1, timeout=0.2)
+
+    with pool.client():
+        start = time.time()
+        with pytest.raises(RequestTimeout):
+            with pool.client():
+                pass
+
+    assert 0.2 <= time.time() - start < 1
+    assert client_cls.call_count == 1
+
+
+def test_waits_for_released_client(client_cls):
+    pool = _pool(client_cls, size=1)
+    held = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with pool.client():
+            held.set()
+            release.wait()
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    held.wait()
+    threading.Timer(0.1, release.set).start()
+
+    with pool.client():
+        pass
+    thread.join()
+    assert client_cls.call_count == 1
+
+
+def test_waits_for_discarded_slot(client_cls):
+    pool = _pool(client_cls, size=1)
+    held = threading.Event()
+
+    def hold():
+        with pytest.raises(pika.exceptions.AMQPError):
+            with pool.client():
+                held.set()
+                time.sleep(0.1)
+                raise pika.exceptions.AMQPError()
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    held.wait()
+
+    with pool.client():
+        pass
+    thread.join()
+    assert client_cls.call_count == 2
+
+
+def test_close(client_cls):
+    pool = _pool(client_cls)
+    with pool.client() as client:
+        pass
+
+    pool.close()
+
+    client.close.assert_called_once_with()
+    assert pool._created == 0
@@ -0,0 +1,17 @@
+import os
+
+import pytest
+
+# the repository root, the backend tree is mounted next to /api in the
+# frontend container
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..', '..')
+
+
+@pytest.mark.parametrize("module", ['wire.py', 'single_flight.py'])
+def test_shared_module_copies_match(module):
+    # the two services negotiate the wire format with these, a change made
+    # to only one copy would break it
+    with open(os.path.join(ROOT, 'api', module), 'rb') as api_copy, \
+            open(os.path.join(ROOT, 'backend', 'backend', module),
+                 'rb') as backend_copy:
+        assert api_copy.read() == backend_copy.read()
@@ -5,40 +5,135 @@ import time
 
 from .battle_server import BattleServer
 from .query_server import QueryServer
-from .pokedex import Pokedex
+from .cache import LRUCache
+from .matchups import MatchupTable
+from .memory_pokedex import MemoryPokedex
+from .pokedex import Pokedex, DEFAULT_IMPORT_BATCH_SIZE, LAYOUT_JSON
+from .supervisor import Supervisor
 
 
-def setup(connection):
-    pokedex = Pokedex(os.getenv("REDIS_URL"))
-    battle_server = BattleServer(os.getenv("BATTLE_QUEUE"), pokedex)
-    query_server = QueryServer(os.getenv("QUERY_QUEUE"), pokedex)
+def make_cache():
+    size = int(os.getenv("POKEDEX_CACHE_SIZE", 2048))
+    if not size:
+        return None
 
-    print("Importing pokemon data")
-    pokedex.import_data(os.getenv("POKEMON_DATA_FILE"))
+    ttl = os.getenv("POKEDEX_CACHE_TTL")
+    return LRUCache(size, float(ttl) if ttl else None)
+
+
+def make_response_cache():
+    # bounded by the size of the encoded bodies, not the number of queries
+    max_bytes = int(os.getenv("RESPONSE_CACHE_BYTES", 16 * 1024 * 1024))
+    if not max_bytes:
+        return None
+
+    return LRUCache(
+        int(os.getenv("RESPONSE_CACHE_SIZE", 4096)), max_bytes=max_bytes
+    )
+
+
+def make_pokedex():
+    if os.getenv("POKEDEX_BACKEND", "redis").lower() == "memory":
+        return MemoryPokedex()
+
+    return Pokedex(
+        os.getenv("REDIS_URL"),
+        int(os.getenv("IMPORT_BATCH_SIZE", DEFAULT_IMPORT_BATCH_SIZE)),
+        cache=make_cache(),
+        layout=os.getenv("POKEDEX_LAYOUT", LAYOUT_JSON).lower()
+    )
+
+
+def make_matchups():
+    # the outcome of every pairing, memory mapped from this directory
+    directory = os.getenv("MATCHUP_TABLE_DIR")
+    if not directory:
+        return None
+
+    return MatchupTable(directory, BattleServer.rounds)
+
+
+def connect(mq_url, retries=3):
+    print("Connecting to MQ")
+    while True:
+        try:
+            return pika.BlockingConnection(pika.URLParameters(mq_url))
+        except pika.exceptions.AMQPConnectionError:
+            if not retries:
+                print("Giving up connection after 3 attempts")
+                raise
+            print("Could not connect to MQ, retrying")
+            retries -= 1
+            time.sleep(3)
 
-    print("Setting up channel")
-    channel = connection.channel()
-    battle_server.setup(channel)
-    query_server.setup(channel)
+
+def serve(pokedex, matchups=None):
+    connection = connect(os.getenv("MQ_URL"))
+    battle_server = BattleServer(
+        os.getenv("BATTLE_QUEUE"), pokedex, matchups,
+        int(os.getenv("TOURNAMENT_PROCESSES", 0)), make_response_cache()
+    )
+    query_server = QueryServer(
+        os.getenv("QUERY_QUEUE"), pokedex, make_response_cache()
+    )
+
+    print("Setting up channels")
+    query_workers = int(os.getenv("QUERY_WORKERS", 0))
+    battle_workers = int(os.getenv("BATTLE_WORKERS", 0))
+    prefetch = os.getenv("PREFETCH_COUNT")
+    battle_server.setup(
+        connection.channel(),
+        int(prefetch) if prefetch else max(battle_workers, 1),
+        battle_workers
+    )
+    query_server.setup(
+        connection.channel(),
+        int(prefetch) if prefetch else max(query_workers, 1),
+        query_workers
+    )
 
     print("Start consuming")
-    channel.start_consuming()
+    try:
+        # dispatches deliveries for both channels and runs the publishes
+        # handed back by worker threads
+        while connection.is_open:
+            connection.process_data_events(time_limit=None)
+    finally:
+        battle_server.shutdown()
+        query_server.shutdown()
+        if connection.is_open:
+            connection.close()
     print("app closing down")
 
 
-mq_url = os.getenv("MQ_URL")
-retries = 3
+def serve_worker(pokedex, matchups=None):
+    # a forked worker keeps the in-memory pokedex it inherited, but opens
+    # its own redis handle rather than sharing the parent's sockets
+    if isinstance(pokedex, Pokedex):
+        pokedex = make_pokedex()
+    serve(pokedex, matchups)
 
-print("Connecting to MQ")
-while retries:
-    try:
-        connection = pika.BlockingConnection(pika.URLParameters(mq_url))
-        setup(connection)
-        break
-    except pika.exceptions.ConnectionClosed:
-        if not retries:
-            print("Giving up connection after 3 attempts")
-            raise
-        print("Could not connect to MQ, retrying")
-        retries -= 1
-        time.sleep(3)
+
+def main():
+    pokedex = make_pokedex()
+
+    # imported once, before any worker is forked
+    print("Importing pokemon data")
+    pokedex.import_data(os.getenv("POKEMON_DATA_FILE"))
+
+    # built (or found on disk) before forking, workers share the mapping
+    matchups = make_matchups()
+    if matchups is not None:
+        print("Loaded matchups for {} pokemon".format(
+            matchups.load(pokedex)
+        ))
+
+    processes = int(os.getenv("BACKEND_PROCESSES", 1))
+    if processes > 1:
+        Supervisor(processes, serve_worker, (pokedex, matchups)).run()
+    else:
+        serve(pokedex, matchups)
+
+
+if __name__ == "__main__":
+    main()
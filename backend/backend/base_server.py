@@ -1,44 +1,154 @@
 import pika
-import json
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
+from . import wire
 
-def parse_request(message):
-    return message.decode('ASCII').split(":")
+
+def encode_result(code, result, content_type=wire.JSON, **extra):
+    body = {'code': code, 'data': result}
+    body.update(extra)
+    return wire.encode(body, content_type)
 
 
 class BaseServer(object):
+    # request type -> (number of args after it, None for any, and the
+    # option names it takes), anything else is answered as bad input
+    requests = {}
 
-    def __init__(self, queue):
+    def __init__(self, queue, response_cache=None):
         self.queue_name = queue
+        self.executor = None
+
+        # optional LRUCache of encoded response bodies, see _cached()
+        self.response_cache = response_cache
+        self._response_version = None
 
     def handle_request(self, ch, method, props, body):
+        if self.executor is None:
+            self._process_request(ch, method, props, body)
+        else:
+            self.executor.submit(
+                self._process_request, ch, method, props, body
+            )
+
+    def _process_request(self, ch, method, props, body):
+        content_type = wire.response_type(props.content_type)
         try:
-            args = parse_request(body)
-            code, result = self._request_received(*args)
-            self._send_result(ch, method, props, code, result)
-        except Exception as e:
-            raise
-            self._send_result(ch, method, props, 500, "Server error")
+            args, options = wire.decode_request(body, props.content_type)
+            if self._valid_request(args, options):
+                body = self._respond(content_type, args, options)
+            else:
+                body = encode_result(403, "Bad input", content_type)
+        except Exception:
+            traceback.print_exc()
+            body = encode_result(500, "Server error", content_type)
+        self._publish(ch, method, props, body, content_type)
+
+    def _valid_request(self, args, options):
+        # checked before the handler is called, where an unknown option or
+        # a wrong number of args would be a TypeError
+        if not isinstance(options, dict) or \
+                not isinstance(args[0], str) or args[0] not in self.requests:
+            return False
+        arg_count, option_names = self.requests[args[0]]
+        if arg_count is not None and len(args) - 1 != arg_count:
+            return False
+        return set(options) <= option_names
+
+    def _respond(self, content_type, args, options):
+        # the encoded response body, or a list of them sent in order as
+        # separate messages; servers can override this to reuse bodies
+        # they have already encoded
+        code, result = self._request_received(*args, **options)
+        return encode_result(code, result, content_type)
+
+    def _cached(self, version, key, content_type, request):
+        # The encoded body for key from the response cache, request() ->
+        # (code, result) answers a miss. Everything cached is dropped when
+        # the data version moves on and server errors are never kept.
+        if version != self._response_version:
+            self.response_cache.clear()
+            self._response_version = version
+
+        key = (version, content_type) + key
+        body = self.response_cache.get(key)
+        if body is None:
+            code, result = request()
+            body = encode_result(code, result, content_type)
+            if code != 500:
+                self.response_cache.set(key, body)
+        return body
 
     def _request_received(self, args):
         raise NotImplemented
 
-    def setup(self, channel):
+    def setup(self, channel, prefetch_count=1, workers=0):
+        # with workers, requests are handled on a thread pool and only the
+        # publish/ack goes back to the connection's thread
+        if workers:
+            self.executor = ThreadPoolExecutor(
+                workers, thread_name_prefix=self.queue_name
+            )
         channel.queue_declare(queue=self.queue_name)
-        channel.basic_qos(prefetch_count=1)
+        channel.basic_qos(prefetch_count=prefetch_count)
         channel.basic_consume(self.handle_request, queue=self.queue_name)
 
-    def _send_result(self, ch, method, props, code, result):
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def _send_result(self, ch, method, props, code, result,
+                     content_type=wire.JSON):
         self._publish(ch, method, props,
-                      {'code': code, 'data': result})
-
-    def _publish(self, ch, method, props, body):
-        ch.basic_publish(
-            exchange='', routing_key=props.reply_to,
-            properties=pika.BasicProperties(
-                correlation_id=props.correlation_id,
-                content_encoding='application/json'
-            ),
-            body=json.dumps(body)
-        )
-        ch.basic_ack(delivery_tag=method.delivery_tag)
+                      encode_result(code, result, content_type), content_type)
+
+    def _publish(self, ch, method, props, body, content_type=wire.JSON):
+        # body is one encoded body, a list of them, or a generator whose
+        # bodies go out one by one as they are produced
+        if isinstance(body, (bytes, list)):
+            bodies = body if isinstance(body, list) else [body]
+            self._on_connection(ch, self._send, ch, method, props, bodies,
+                                content_type, True)
+            return
+
+        pending = []
+        for body in self._produce(body, content_type):
+            if pending:
+                self._on_connection(ch, self._send, ch, method, props,
+                                    pending, content_type, False)
+            pending = [body]
+        # the ack goes with the last of them
+        self._on_connection(ch, self._send, ch, method, props, pending,
+                            content_type, True)
+
+    def _produce(self, bodies, content_type):
+        # a generator failing part way through ends the response with a
+        # server error
+        try:
+            for body in bodies:
+                yield body
+        except Exception:
+            traceback.print_exc()
+            yield encode_result(500, "Server error", content_type)
+
+    def _on_connection(self, ch, callback, *args):
+        if self.executor is None:
+            callback(*args)
+        else:
+            # pika channels are not thread safe
+            ch.connection.add_callback_threadsafe(partial(callback, *args))
+
+    def _send(self, ch, method, props, bodies, content_type, ack):
+        for body in bodies:
+            ch.basic_publish(
+                exchange='', routing_key=props.reply_to,
+                properties=pika.BasicProperties(
+                    correlation_id=props.correlation_id,
+                    content_type=content_type
+                ),
+                body=body
+            )
+        if ack:
+            ch.basic_ack(delivery_tag=method.delivery_tag)
@@ -0,0 +1,93 @@
+from operator import attrgetter
+
+import numpy as np
+
+# columns of the (n, 4) stat arrays simulate() takes
+BATTLE_STATS = ('hp', 'attack', 'defence', 'speed')
+HP, ATTACK, DEFENCE, SPEED = range(len(BATTLE_STATS))
+_battle_stats = attrgetter(*BATTLE_STATS)
+
+
+def stat_rows(pokemon):
+    # pokemon records -> (n, 4) array in BATTLE_STATS order
+    return np.array(
+        [_battle_stats(p) for p in pokemon], dtype=np.int64
+    ).reshape(-1, len(BATTLE_STATS))
+
+
+def _hit(hp, damage, hits):
+    # same rule as BattleServer._attack, negative damage heals and hp
+    # never drops below 0
+    return np.where(hits, np.maximum(hp - damage, 0), hp)
+
+
+def simulate(poke_1, poke_2, rounds, rng):
+    # Every pair (poke_1[i], poke_2[i]) fought at once with the rules of
+    # BattleServer._battle_round, returns (hp_1, hp_2, rounds fought).
+    # A pair stops fighting the moment either side is at 0 hp.
+    n = len(poke_1)
+    hp_1 = poke_1[:, HP].copy()
+    hp_2 = poke_2[:, HP].copy()
+    damage_1 = poke_1[:, ATTACK] - poke_2[:, DEFENCE]
+    damage_2 = poke_2[:, ATTACK] - poke_1[:, DEFENCE]
+    speed = poke_1[:, SPEED] - poke_2[:, SPEED]
+    ties = speed == 0
+    any_ties = ties.any()
+
+    fought = np.zeros(n, dtype=np.int64)
+    active = np.ones(n, dtype=bool)
+    for _ in range(rounds):
+        if not active.any():
+            break
+        fought += active
+
+        # equal speed is a coin toss every round
+        first_1 = speed > 0
+        if any_ties:
+            first_1 = first_1 | (ties & (rng.random(n) > 0.5))
+
+        hp_2 = _hit(hp_2, damage_1, active & first_1)
+        hp_1 = _hit(hp_1, damage_2, active & ~first_1)
+        active &= (hp_1 > 0) & (hp_2 > 0)
+
+        hp_1 = _hit(hp_1, damage_2, active & first_1)
+        hp_2 = _hit(hp_2, damage_1, active & ~first_1)
+        active &= (hp_1 > 0) & (hp_2 > 0)
+
+    return hp_1, hp_2, fought
+
+
+def _falls_at(hp, damage, never):
+    # the hit that takes hp to 0, never when the damage does not hurt
+    return np.where(damage > 0, -(-hp // np.maximum(damage, 1)), never)
+
+
+def outcome(poke_1, poke_2, rounds):
+    # Closed form of simulate() for (broadcastable) stat arrays. Without a
+    # speed tie the order of attacks never changes, so the round either
+    # side falls in is just hp / damage. Pairs with equal speed come back
+    # with 0 rounds, their outcome is down to the coin tosses.
+    first_1 = poke_1[..., SPEED] > poke_2[..., SPEED]
+    fast = np.where(first_1[..., None], poke_1, poke_2)
+    slow = np.where(first_1[..., None], poke_2, poke_1)
+    damage_fast = fast[..., ATTACK] - slow[..., DEFENCE]
+    damage_slow = slow[..., ATTACK] - fast[..., DEFENCE]
+
+    never = rounds + 1
+    slow_falls = _falls_at(slow[..., HP], damage_fast, never)
+    fast_falls = _falls_at(fast[..., HP], damage_slow, never)
+
+    # the slower side lands one hit less than the faster in the round the
+    # faster knocks it out
+    fast_out = (fast_falls < slow_falls) & (fast_falls <= rounds)
+    slow_out = ~fast_out & (slow_falls <= rounds)
+    fought = np.where(fast_out, fast_falls,
+                      np.where(slow_out, slow_falls, rounds))
+    hp_fast = np.where(fast_out, 0,
+                       fast[..., HP] - (fought - slow_out) * damage_slow)
+    hp_slow = np.where(slow_out, 0, slow[..., HP] - fought * damage_fast)
+
+    hp_1 = np.where(first_1, hp_fast, hp_slow)
+    hp_2 = np.where(first_1, hp_slow, hp_fast)
+    ties = poke_1[..., SPEED] == poke_2[..., SPEED]
+    return hp_1, hp_2, np.where(ties, 0, fought)
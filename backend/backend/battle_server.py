@@ -1,18 +1,173 @@
 
+import multiprocessing
 import random
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
-from .base_server import BaseServer
+import numpy as np
+
+from .base_server import BaseServer, encode_result
+from .battle_engine import BATTLE_STATS, simulate, stat_rows
+from .query_server import QueryServer
+from .tournament import bracket, round_robin
+
+
+# everything a battle reads, the rest of the document is never fetched
+BATTLE_FIELDS = ('name', 'stats.hp', 'stats.attack', 'stats.defence',
+                 'stats.speed')
+BATCH_FIELDS = ('id',) + tuple('stats.' + stat for stat in BATTLE_STATS)
+TOURNAMENT_FIELDS = ('name',) + BATCH_FIELDS
+# the queries a tournament's entrants can be picked with
+TOURNAMENT_QUERIES = ('TYPE', 'GEN', 'LEGEND', 'STATS')
+
+
+def parse_pair(pair):
+    # "pid1,pid2" or [pid1, pid2]
+    if isinstance(pair, str):
+        pair = pair.split(',')
+    pid_1, pid_2 = [str(p_id).strip() for p_id in pair]
+    if not pid_1 or not pid_2:
+        raise ValueError("Bad pair")
+    return pid_1, pid_2
+
+
+def parse_seed(seed):
+    # a non-negative integer, anything else is bad input
+    if seed is None:
+        return None
+    seed = int(seed)
+    if seed < 0:
+        raise ValueError("Bad seed")
+    return seed
+
+
+def summarize(combatants, hp_1, hp_2, rounds):
+    # a battle without its turn log, winner is 0, 1 or None for a draw
+    return {
+        'combatants': combatants,
+        'winner': 0 if hp_1 > hp_2 else 1 if hp_2 > hp_1 else None,
+        'hp': [hp_1, hp_2],
+        'rounds': rounds
+    }
+
+
+def _standings(pokemon, standings):
+    return [{
+        'id': pokemon[row].id,
+        'name': pokemon[row].name,
+        'wins': int(standings.wins[row]),
+        'losses': int(standings.losses[row]),
+        'draws': int(standings.draws[row]),
+        'rating': round(float(standings.rating[row]), 1)
+    } for row in standings.ranking().tolist()]
+
+
+# One side of a battle in progress, the pokemon records it starts from are
+# shared with the pokedex's cache and never changed.
+class Combatant(object):
+    __slots__ = ('battle_id', 'hp', 'attack', 'defence', 'speed')
+
+    def __init__(self, battle_id, pokemon):
+        self.battle_id = battle_id
+        self.hp = pokemon.hp
+        self.attack = pokemon.attack
+        self.defence = pokemon.defence
+        self.speed = pokemon.speed
 
 
 class BattleServer(BaseServer):
     rounds = 8
+    max_battles = 100000
+    max_entrants = 1000
+    tournament_chunk_size = 10000
+    requests = {
+        'BATTLE': (2, frozenset(['log', 'seed'])),
+        'BATTLES': (None, frozenset(['seed'])),
+        'TOURNAMENT': (2, frozenset(['format', 'stream', 'seed']))
+    }
 
-    def __init__(self, battle_queue, pokedex):
-        super(BattleServer, self).__init__(battle_queue)
+    def __init__(self, battle_queue, pokedex, matchups=None, processes=0,
+                 response_cache=None):
+        # response_cache only keeps seeded battles, the only ones with a
+        # single answer
+        super(BattleServer, self).__init__(battle_queue, response_cache)
 
         self.pokedex = pokedex
+        self.matchups = matchups
+        # entrants are picked exactly as the query queue would find them
+        self.queries = QueryServer(battle_queue, pokedex)
+
+        # round robin chunks are fought on a pool of this many processes
+        self.processes = processes
+        self.pool = None
+
+        # unseeded battles draw from a generator of their worker's own
+        self._local = threading.local()
+
+    def setup(self, channel, prefetch_count=1, workers=0):
+        super(BattleServer, self).setup(channel, prefetch_count, workers)
+        if self.processes:
+            # the pool starts its processes on the first tournament, from a
+            # worker thread while the connection's threads are running, so
+            # they come from a forkserver rather than a fork of this process
+            self.pool = ProcessPoolExecutor(
+                self.processes,
+                mp_context=multiprocessing.get_context('forkserver')
+            )
+
+    def shutdown(self):
+        super(BattleServer, self).shutdown()
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def _respond(self, content_type, args, options):
+        if args and args[0] == 'TOURNAMENT':
+            return self._tournament(content_type, args[1:], **options)
+
+        key = self._battle_key(args, options)
+        if key is None:
+            return super(BattleServer, self)._respond(
+                content_type, args, options
+            )
+        return self._cached(
+            self.pokedex.data_version(), key, content_type,
+            partial(self._request_received, *args, **options)
+        )
+
+    def _battle_key(self, args, options):
+        # (pid_1, pid_2, seed, log) for a single seeded battle when there
+        # is a response cache to keep it in
+        if self.response_cache is None or len(args) != 3 or \
+                args[0] == 'BATTLES' or set(options) - {'seed', 'log'}:
+            return None
+        try:
+            seed = parse_seed(options.get('seed'))
+        except (TypeError, ValueError):
+            return None
+        if seed is None:
+            return None
+        return (args[1], args[2], seed, bool(options.get('log', True)))
+
+    def _rng(self, seed=None):
+        # a fresh generator for a seed, otherwise this worker's own
+        if seed is not None:
+            return random.Random(seed)
+        rng = getattr(self._local, 'rng', None)
+        if rng is None:
+            rng = self._local.rng = random.Random()
+        return rng
+
+    def _request_received(self, *args, log=True, seed=None):
+        try:
+            seed = parse_seed(seed)
+        except (TypeError, ValueError):
+            return 403, "Bad input"
+
+        if args and args[0] == 'BATTLES':
+            return self._battles(args[1:], seed)
 
-    def _request_received(self, *args):
         if len(args) != 3:
             return 403, "Bad input"
 
@@ -21,46 +176,180 @@ class BattleServer(BaseServer):
         if not all([pid_1, pid_2]):
             return 403, "Bad input"
 
-        poke_1 = self.pokedex.get_pokemon_by_id(pid_1)
-        poke_2 = self.pokedex.get_pokemon_by_id(pid_2)
+        # straight from the matchup table when only the outcome is wanted,
+        # the turn log is played out for the clients that ask for it
+        matchups = self._matchups()
+        if not log and matchups is not None:
+            found = matchups.lookup(pid_1, pid_2)
+            if found:
+                return 200, summarize(
+                    [matchups.names[matchups.rows[pid_1]],
+                     matchups.names[matchups.rows[pid_2]]],
+                    *found
+                )
+
+        poke_1, poke_2 = self._combatants(matchups, pid_1, pid_2)
 
         if not all([poke_1, poke_2]):
             return 404, "Could not find pokemon"
 
-        result = {'combatants': [poke_1['name'], poke_2['name']]}
-        poke_1['battle_id'] = 0
-        poke_2['battle_id'] = 1
+        rng = self._rng(seed)
+        result = {'combatants': [poke_1.name, poke_2.name]}
+        poke_1 = Combatant(0, poke_1)
+        poke_2 = Combatant(1, poke_2)
         for i in range(self.rounds):
             result[i+1], term, poke_1, poke_2 = self._battle_round(
-                poke_1, poke_2
+                poke_1, poke_2, rng
             )
             if term:
                 break
 
+        if not log:
+            return 200, summarize(
+                result['combatants'], poke_1.hp, poke_2.hp, i + 1
+            )
         return 200, result
 
+    def _matchups(self):
+        if self.matchups is None:
+            return None
+        return self.matchups.current(self.pokedex)
+
+    def _combatants(self, matchups, pid_1, pid_2):
+        if matchups is not None:
+            poke_1 = matchups.pokemon(pid_1)
+            poke_2 = matchups.pokemon(pid_2)
+            if poke_1 and poke_2:
+                return poke_1, poke_2
+
+        return (
+            self.pokedex.get_pokemon_by_id(pid_1, fields=BATTLE_FIELDS),
+            self.pokedex.get_pokemon_by_id(pid_2, fields=BATTLE_FIELDS)
+        )
+
+    def _tournament(self, content_type, args, format='round_robin',
+                    stream=False, seed=None):
+        # TOURNAMENT:<TYPE|GEN|LEGEND|STATS>:<arg>, the standings come back
+        # once at the end or, streamed, after every chunk or round
+        play = {
+            'round_robin': self._round_robin, 'bracket': self._bracket
+        }.get(format)
+        try:
+            seed = parse_seed(seed)
+        except (TypeError, ValueError):
+            play = None
+        if play is None or len(args) != 2 or \
+                args[0].upper() not in TOURNAMENT_QUERIES:
+            return encode_result(403, "Bad input", content_type)
+
+        code, pokemon = self.queries._request_received(
+            args[0].upper(), args[1], fields=TOURNAMENT_FIELDS
+        )
+        if code != 200:
+            return encode_result(code, pokemon, content_type)
+        if len(pokemon) < 2:
+            return encode_result(403, "Not enough pokemon", content_type)
+        if len(pokemon) > self.max_entrants:
+            return encode_result(403, "Too many pokemon", content_type)
+
+        updates = play(pokemon, seed)
+        if not stream:
+            return encode_result(
+                200, deque(updates, maxlen=1)[0][0], content_type
+            )
+        return (
+            encode_result(200, [update], content_type, more=more)
+            for update, more in updates
+        )
+
+    def _round_robin(self, pokemon, seed=None):
+        # yields (update, more) after each chunk of battles
+        total = len(pokemon) * (len(pokemon) - 1) // 2
+        map_chunks = self.pool.map if self.pool is not None else map
+        for standings in round_robin(stat_rows(pokemon), self.rounds,
+                                     self.tournament_chunk_size, map_chunks,
+                                     seed):
+            yield {
+                'played': standings.played,
+                'battles': total,
+                'standings': _standings(pokemon, standings)
+            }, standings.played < total
+
+    def _bracket(self, pokemon, seed=None):
+        # yields (update, more) after each round, the entrants placed in
+        # the order the query returned them
+        ids = [p.id for p in pokemon]
+        rounds = bracket(stat_rows(pokemon), self.rounds, seed)
+        for i, (standings, first, second, winners) in enumerate(rounds):
+            update = {
+                'round': i + 1,
+                'matches': [
+                    [ids[p_1], ids[p_2], ids[winner]] for p_1, p_2, winner
+                    in zip(first.tolist(), second.tolist(), winners.tolist())
+                ],
+                'standings': _standings(pokemon, standings)
+            }
+            if standings.played == len(ids) - 1:
+                update['champion'] = ids[winners[0]]
+            yield update, 'champion' not in update
+
+    def _battles(self, pairs, seed=None):
+        # BATTLES:<pid1>,<pid2>:<pid1>,<pid2>:... every pair fought at once
+        # by the vectorized engine, only the outcome is returned
+        try:
+            pairs = [parse_pair(pair) for pair in pairs]
+        except (TypeError, ValueError):
+            return 403, "Bad input"
+
+        if not pairs or len(pairs) > self.max_battles:
+            return 403, "Bad input"
+
+        ids = sorted({p_id for pair in pairs for p_id in pair})
+        pokemon = self.pokedex.get_pokemon_by_ids(ids, fields=BATCH_FIELDS)
+        rows = {p.id: row for row, p in enumerate(pokemon)}
+        if any(p_id not in rows for p_id in ids):
+            return 404, "Could not find pokemon"
+
+        stats = stat_rows(pokemon)
+        hp_1, hp_2, fought = simulate(
+            stats[[rows[pid_1] for pid_1, _ in pairs]],
+            stats[[rows[pid_2] for _, pid_2 in pairs]],
+            self.rounds, np.random.default_rng(seed)
+        )
+        hp_1 = hp_1.tolist()
+        hp_2 = hp_2.tolist()
+        return 200, {
+            'winner': [
+                pid_1 if h_1 > h_2 else pid_2 if h_2 > h_1 else None
+                for (pid_1, pid_2), h_1, h_2 in zip(pairs, hp_1, hp_2)
+            ],
+            'hp_1': hp_1,
+            'hp_2': hp_2,
+            'rounds': fought.tolist()
+        }
+
     def _attack(self, attacker, defender):
-        atk = attacker['stats']['attack']
-        hp = defender['stats']['hp']
-        defence = defender['stats']['defence']
+        atk = attacker.attack
+        hp = defender.hp
+        defence = defender.defence
 
         dmg = (atk - defence) or 0
         hp = hp - dmg if hp - dmg > 0 else 0
-        defender['stats']['hp'] = hp
+        defender.hp = hp
         return {
-            'attacker': attacker['battle_id'],
-            'defender': defender['battle_id'],
+            'attacker': attacker.battle_id,
+            'defender': defender.battle_id,
             'damage': dmg,
             'hp': hp
         }, attacker, defender
 
-    def _battle_round(self, poke_1, poke_2):
+    def _battle_round(self, poke_1, poke_2, rng):
         result = []
         # who fights first?
-        speed = poke_1['stats']['speed'] - poke_2['stats']['speed']
+        speed = poke_1.speed - poke_2.speed
 
         if speed == 0:
-            speed = random.random() - 0.5
+            speed = rng.random() - 0.5
 
         if speed > 0:
             part, poke_1, poke_2 = self._attack(poke_1, poke_2)
@@ -69,7 +358,7 @@ class BattleServer(BaseServer):
 
         result.append(part)
 
-        if not all([poke_1['stats']['hp'], poke_2['stats']['hp']]):
+        if not all([poke_1.hp, poke_2.hp]):
             return result, True, poke_1, poke_2
 
         if speed > 0:
@@ -80,7 +369,6 @@ class BattleServer(BaseServer):
 
         return (
             result,
-            any([poke_1['stats']['hp'] <= 0,
-                 poke_2['stats']['hp'] <= 0]),
+            any([poke_1.hp <= 0, poke_2.hp <= 0]),
             poke_1, poke_2
         )
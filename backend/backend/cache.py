@@ -0,0 +1,65 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache(object):
+
+    def __init__(self, max_size, ttl=None, max_bytes=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        # with max_bytes, values are sized by len() (encoded responses) and
+        # the least recently used are evicted until the total fits
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return default
+
+            if expires is not None and expires < time.time():
+                self._remove(key)
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def _size(self, value):
+        return len(value) if self.max_bytes is not None else 0
+
+    def _remove(self, key):
+        _, value = self._data.pop(key)
+        self.size_bytes -= self._size(value)
+
+    def set(self, key, value):
+        size = self._size(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        expires = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (expires, value)
+            self.size_bytes += size
+
+            while len(self._data) > self.max_size or (
+                    self.max_bytes is not None and
+                    self.size_bytes > self.max_bytes):
+                self._remove(next(iter(self._data)))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size_bytes = 0
@@ -0,0 +1,119 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+from .battle_engine import BATTLE_STATS, outcome, stat_rows
+from .record import PokemonRecord
+
+MATCHUP_FIELDS = ('id', 'name') + tuple(
+    'stats.' + stat for stat in BATTLE_STATS
+)
+# rounds is 0 where equal speed leaves the battle to chance
+MATCHUP_DTYPE = np.dtype([
+    ('hp_1', np.int32), ('hp_2', np.int32), ('rounds', np.int8)
+])
+BUILD_CHUNK_ROWS = 64
+
+
+def table_key(ids, stats, rounds):
+    # names the table file, any change to the roster or stats is a new one
+    digest = hashlib.sha1(repr((rounds, ids)).encode('utf-8'))
+    digest.update(stats.tobytes())
+    return digest.hexdigest()
+
+
+def build_table(path, stats, rounds, chunk_rows=BUILD_CHUNK_ROWS):
+    # written next to its final name and moved into place, so other
+    # processes only ever open a complete table
+    n = len(stats)
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    table = np.lib.format.open_memmap(
+        tmp_path, mode='w+', dtype=MATCHUP_DTYPE, shape=(n, n)
+    )
+    for start in range(0, n, chunk_rows):
+        block = table[start:start + chunk_rows]
+        block['hp_1'], block['hp_2'], block['rounds'] = outcome(
+            stats[start:start + chunk_rows, None], stats[None], rounds
+        )
+    table.flush()
+    del table
+    os.replace(tmp_path, path)
+
+
+# Outcome of every pairing in the pokedex, memory mapped from a file in
+# directory that is built once per dataset and shared by every process.
+class MatchupTable(object):
+
+    def __init__(self, directory, rounds):
+        self.directory = directory
+        self.rounds = rounds
+        self.version = None
+        self.names = []
+        self.rows = {}
+        self.stats = stat_rows([])
+        self.table = None
+        self._lock = threading.Lock()
+
+    def load(self, pokedex):
+        version = pokedex.data_version()
+        pokemon = sorted(
+            pokedex.get_pokemon_by_stat('hp', fields=MATCHUP_FIELDS),
+            key=lambda p: str(p.id)
+        )
+        ids = [str(p.id) for p in pokemon]
+        stats = stat_rows(pokemon)
+
+        if ids:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, 'matchups-{}.npy'.format(
+                table_key(ids, stats, self.rounds)
+            ))
+            if not os.path.exists(path):
+                print("Building matchup table for {} pokemon".format(
+                    len(ids)
+                ))
+                build_table(path, stats, self.rounds)
+            table = np.load(path, mmap_mode='r')
+        else:
+            table = np.zeros((0, 0), dtype=MATCHUP_DTYPE)
+
+        self.names = [p.name for p in pokemon]
+        self.rows = {p_id: row for row, p_id in enumerate(ids)}
+        self.stats = stats
+        self.table = table
+        self.version = version
+        return len(ids)
+
+    def current(self, pokedex):
+        # loaded on first use and again whenever the dataset moves on
+        if self.table is None or pokedex.data_version() != self.version:
+            with self._lock:
+                if self.table is None or \
+                        pokedex.data_version() != self.version:
+                    self.load(pokedex)
+        return self
+
+    def lookup(self, pid_1, pid_2):
+        # (hp_1, hp_2, rounds), None when either pokemon is not in the
+        # table or their speeds tie
+        row_1 = self.rows.get(pid_1)
+        row_2 = self.rows.get(pid_2)
+        if row_1 is None or row_2 is None:
+            return None
+
+        hp_1, hp_2, rounds = self.table[row_1, row_2].tolist()
+        if not rounds:
+            return None
+        return hp_1, hp_2, rounds
+
+    def pokemon(self, p_id):
+        # the record a battle reads, without going to the pokedex
+        row = self.rows.get(p_id)
+        if row is None:
+            return None
+        pokemon = PokemonRecord(name=self.names[row])
+        for stat, value in zip(BATTLE_STATS, self.stats[row].tolist()):
+            setattr(pokemon, stat, value)
+        return pokemon
@@ -0,0 +1,173 @@
+import time
+from array import array
+
+from .name_index import NameIndex
+from .pokedex import read_pokemon_file
+from .projection import parse_fields
+from .record import STATS, PokemonRecord
+from .stats_query import SortedStatIndex
+
+NO_TYPE = 0
+
+
+def _normalise(ident):
+    if isinstance(ident, str):
+        ident = ident.lower().strip()
+    return ident
+
+
+# Read-only, redis-free pokedex. Every attribute is a column indexed by
+# row, types are interned as small codes, and pokemon records are only
+# built for the rows a query returns.
+class MemoryPokedex(object):
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self.ids = []
+        self.names = []
+        self.type_1 = array('B')
+        self.type_2 = array('B')
+        self.gen = array('B')
+        self.legendary = array('B')
+        self.stats = {stat: array('H') for stat in STATS}
+        self.stats_index = SortedStatIndex(self.stats)
+        self.name_index = NameIndex(self.names)
+
+        self.type_names = [None]
+        self.type_codes = {}
+        self.rows_by_id = {}
+
+        self.version = 0
+
+    def import_data(self, data_file):
+        start = time.time()
+        version = self.version
+        self._reset()
+
+        for pokemon in read_pokemon_file(data_file):
+            self._import_pokemon(pokemon)
+
+        self.stats_index = SortedStatIndex(self.stats)
+        self.name_index = NameIndex(self.names)
+        self.version = version + 1
+
+        elapsed = time.time() - start
+        print("Imported {} pokemon in {:.2f}s ({:.0f} rows/s)".format(
+            len(self.ids), elapsed, len(self.ids) / elapsed if elapsed else 0
+        ))
+        return len(self.ids)
+
+    def data_version(self):
+        return self.version
+
+    def _type_code(self, p_type):
+        key = _normalise(p_type)
+        if key not in self.type_codes:
+            self.type_codes[key] = len(self.type_names)
+            self.type_names.append(p_type)
+        return self.type_codes[key]
+
+    def _import_pokemon(self, pokemon):
+        p_id = _normalise(pokemon.id)
+        if p_id in self.rows_by_id:
+            print("Pokemon id: {} ({}) already in pokedex, skipping".format(
+                pokemon.id, pokemon.name)
+            )
+            return  # ASSUMPTION: pokemon details don't change
+
+        types = [self._type_code(t) for t in pokemon.type if t]
+        types += [NO_TYPE] * (2 - len(types))
+
+        self.rows_by_id[p_id] = len(self.ids)
+        self.ids.append(pokemon.id)
+        self.names.append(pokemon.name)
+        self.type_1.append(types[0])
+        self.type_2.append(types[1])
+        self.gen.append(pokemon.gen)
+        self.legendary.append(pokemon.legendary)
+        stats = pokemon.stats()
+        for stat in STATS:
+            self.stats[stat].append(stats[stat])
+
+    def _build_pokemon(self, row, projection=None):
+        types = (self.type_names[self.type_1[row]],)
+        if self.type_2[row] != NO_TYPE:
+            types += (self.type_names[self.type_2[row]],)
+
+        return PokemonRecord(
+            self.ids[row], self.names[row], types,
+            tuple(self.stats[stat][row] for stat in STATS),
+            self.gen[row], bool(self.legendary[row]), projection
+        )
+
+    def _build_rows(self, rows, fields=None):
+        projection = parse_fields(fields)
+        return [self._build_pokemon(row, projection) for row in rows]
+
+    def _rows_of_type(self, p_type):
+        code = self.type_codes.get(_normalise(p_type))
+        if code is None:
+            return []
+        return [row for row in range(len(self.ids))
+                if self.type_1[row] == code or self.type_2[row] == code]
+
+    def get_pokemon_by_id(self, p_id, fields=None):
+        projection = parse_fields(fields)
+        row = self.rows_by_id.get(_normalise(p_id))
+        if row is None:
+            return None
+        return self._build_pokemon(row, projection)
+
+    def get_pokemon_by_ids(self, p_ids, fields=None):
+        rows = [self.rows_by_id.get(_normalise(p_id)) for p_id in p_ids]
+        return self._build_rows((row for row in rows if row is not None),
+                                fields)
+
+    def get_pokemon_by_name(self, name, fields=None):
+        return self._build_rows(self.name_index.search(name), fields)
+
+    def get_pokemon_by_fuzzy_name(self, name, limit, fields=None):
+        projection = parse_fields(fields)
+        return [{'score': round(score, 3),
+                 'pokemon': self._build_pokemon(row, projection)}
+                for row, score in self.name_index.fuzzy(name, limit)]
+
+    def get_pokemon_of_type(self, p_type, fields=None):
+        return self._build_rows(self._rows_of_type(p_type), fields)
+
+    def get_pokemon_by_generation(self, gen, fields=None):
+        try:
+            gen = int(gen)
+        except ValueError:
+            return []
+        return self._build_rows(
+            (row for row, p_gen in enumerate(self.gen) if p_gen == gen),
+            fields
+        )
+
+    def get_pokemon_by_legendary(self, is_legend, fields=None):
+        return self._build_rows(
+            (row for row, legend in enumerate(self.legendary)
+             if bool(legend) == is_legend),
+            fields
+        )
+
+    def get_pokemon_by_stat(self, stat, fields=None):
+        if _normalise(stat) not in self.stats:
+            return []
+        return self._build_rows(range(len(self.ids)), fields)
+
+    def get_pokemon_by_type(self, p_types, fields=None):
+        rows = [set(self._rows_of_type(p_type)) for p_type in p_types]
+        if not rows:
+            return []
+
+        return self._build_rows(
+            sorted(rows[0].intersection(*rows[1:])), fields
+        )
+
+    def get_pokemon_by_stats(self, stats, fields=None):
+        # [(stat, op, value)]
+        return self._build_rows(self.stats_index.query(stats), fields)
@@ -0,0 +1,99 @@
+import fnmatch
+import heapq
+import re
+
+GLOB_CHARS = re.compile(r"[*?\[\]]")
+# wildcards and [...] character classes, what is left between them has to
+# appear literally in a matching name
+GLOB_TOKENS = re.compile(r"\[[^\]]*\]|[*?]")
+
+
+def trigrams(text):
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def fuzzy_trigrams(text):
+    # padded so the start and end of a name count, and short names still
+    # have something to compare
+    return trigrams("  {} ".format(text.strip()))
+
+
+def name_pattern(name):
+    # names are searched case-insensitively, a plain search string matches
+    # any name containing it, globs ('Bulba*', '*chu') keep their meaning
+    pattern = name.lower().strip()
+    if not GLOB_CHARS.search(pattern):
+        pattern = "*{}*".format(pattern)
+    return pattern
+
+
+def pattern_prefix(pattern):
+    return GLOB_TOKENS.split(pattern, 1)[0]
+
+
+def pattern_trigrams(pattern):
+    # every trigram of every literal run, all of them must appear in a
+    # matching name
+    result = set()
+    for fragment in GLOB_TOKENS.split(pattern):
+        result.update(trigrams(fragment))
+    return result
+
+
+def match_name(pattern, name):
+    return fnmatch.fnmatchcase(name.lower(), pattern)
+
+
+class NameIndex(object):
+
+    def __init__(self, names):
+        self.names = [name.lower() for name in names]
+        self.postings = {}
+        for row, name in enumerate(self.names):
+            for trigram in trigrams(name):
+                self.postings.setdefault(trigram, set()).add(row)
+
+        self.fuzzy_postings = {}
+        self.fuzzy_sizes = []
+        for row, name in enumerate(self.names):
+            grams = fuzzy_trigrams(name)
+            self.fuzzy_sizes.append(len(grams))
+            for trigram in grams:
+                self.fuzzy_postings.setdefault(trigram, []).append(row)
+
+    def search(self, name):
+        pattern = name_pattern(name)
+        keys = pattern_trigrams(pattern)
+        if keys:
+            postings = sorted(
+                (self.postings.get(key, set()) for key in keys), key=len
+            )
+            candidates = sorted(postings[0].intersection(*postings[1:]))
+        else:
+            candidates = range(len(self.names))
+
+        return [row for row in candidates
+                if match_name(pattern, self.names[row])]
+
+    def fuzzy(self, name, limit, min_score=0.3):
+        # [(row, score)] best first, score is the dice coefficient of the
+        # padded trigram sets
+        grams = fuzzy_trigrams(name.lower())
+        if not grams:
+            return []
+
+        shared = {}
+        for trigram in grams:
+            for row in self.fuzzy_postings.get(trigram, ()):
+                shared[row] = shared.get(row, 0) + 1
+
+        scored = (
+            (2.0 * common / (len(grams) + self.fuzzy_sizes[row]), row)
+            for row, common in shared.items()
+        )
+        best = heapq.nsmallest(
+            limit, ((-score, row) for score, row in scored
+                    if score >= min_score)
+        )
+        return [(row, -score) for score, row in best]
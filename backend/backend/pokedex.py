@@ -1,13 +1,67 @@
 
 import redis
 import json
+import time
+import uuid
+
+from .name_index import (
+    NameIndex, match_name, name_pattern, pattern_prefix, pattern_trigrams,
+    trigrams
+)
+from .projection import parse_fields, split_fields
+from .record import STAT_SLOTS, STATS, PokemonRecord
+from .stats_query import score_range
 
 POKEMON_ID_KEY = "pokemon:id:"
 POKEMON_NAME_KEY = "pokemon:name:"
-POKEMON_TYPE_KEY = "pokemon:type:"
-POKEMON_STATS_KEY = "pokemon:stats:"
-POKEMON_LEGEND_KEY = "pokemon:legendary:"
-POKEMON_GEN_KEY = "pokemon:gen:"
+# type, generation and legendary indexes are sets of ids (the old
+# pokemon:type:, pokemon:gen: and pokemon:legendary: keys were lists)
+POKEMON_TYPE_KEY = "pokemon:type_ids:"
+# sorted sets of id scored by stat value (the old pokemon:stats: lists
+# held every id unscored)
+POKEMON_STATS_KEY = "pokemon:stat_scores:"
+POKEMON_LEGEND_KEY = "pokemon:legendary_ids:"
+POKEMON_GEN_KEY = "pokemon:gen_ids:"
+POKEMON_VERSION_KEY = "pokemon:version"
+# sorted set of "<lower case name>:<id>" for prefix scans, and sets of ids
+# per name trigram for substring search
+POKEMON_NAMES_KEY = "pokemon:names"
+POKEMON_NAME_TRIGRAM_KEY = "pokemon:name_trigram:"
+# the hash layout keeps each pokemon as a flat hash here instead of a JSON
+# document under POKEMON_ID_KEY
+POKEMON_HASH_KEY = "pokemon:hash:"
+# temporary sorted sets of a stats query with more than one predicate
+POKEMON_STATS_QUERY_KEY = "pokemon:stats_query:"
+
+LAYOUT_JSON = 'json'
+LAYOUT_HASH = 'hash'
+
+# in document order, stats flattened to 'stats.<stat>'
+HASH_FIELDS = ('id', 'name', 'type') + tuple(
+    'stats.' + stat for stat in STATS
+) + ('gen', 'legendary')
+HASH_STAT_SLOTS = {
+    'stats.' + stat: slot for stat, slot in zip(STATS, STAT_SLOTS)
+}
+
+DEFAULT_IMPORT_BATCH_SIZE = 100
+DEFAULT_HYDRATE_BATCH_SIZE = 200
+DEFAULT_VERSION_CHECK_INTERVAL = 1.0
+
+
+def _outside(low, high):
+    # ZREMRANGEBYSCORE (min, max) pairs for the scores outside a
+    # score_range, the other side of an exclusive bound is inclusive
+    def flip(bound):
+        bound = str(bound)
+        return bound[1:] if bound.startswith('(') else '(' + bound
+
+    bounds = []
+    if low != '-inf':
+        bounds.append(('-inf', flip(low)))
+    if high != '+inf':
+        bounds.append((flip(high), '+inf'))
+    return bounds
 
 
 def _build_key(base, ident):
@@ -35,187 +89,527 @@ def _check_attr(entry, t, exp):
         raise exp
 
 
-class Pokedex(object):
+def parse_pokemon_line(line):
 
-    def __init__(self, redis_url):
-        self.redis = redis.Redis.from_url(url=redis_url)
+    def check_type(type_a, type_b):
+        if not type_a:
+            raise ValueError("Invalid Type 1")
 
-    def import_data(self, data_file):
+        if type_b:
+            return (type_a, type_b)
 
-        with open(data_file, 'r') as f:
-            f.readline()  # not interested in first line
+        return (type_a,)
 
-            # id,Name,Type 1,Type 2,Total,HP,Attack,Defense,Sp.Atk,Sp.Def,Speed,Generation,Legendary
-            l = 2
-            for line in f:
-                try:
-                    pokemon = self._parse_pokemon_line(line)
-                except ValueError as ve:
-                    print("Invalid entry at line {}: {}".format(l, ve.message))
-                else:
-                    self._import_pokemon(pokemon)
-                    l += 1
+    data = line.split(',')
+    if len(data) != 13:
+        raise ValueError(
+            "Not enough attributes"
+        )
+    return PokemonRecord(
+        _check_attr(data[0], str, ValueError("No Id")),
+        _check_attr(data[1], str, ValueError("No name")),
+        check_type(data[2], data[3]),
+        (
+            _check_attr(data[4], int, ValueError("Invalid total")),
+            _check_attr(data[5], int, ValueError("Invalid HP")),
+            _check_attr(data[6], int, ValueError("Invalid attack")),
+            _check_attr(data[7], int, ValueError("Invalid defence")),
+            _check_attr(data[8], int, ValueError("Invalid sp.atk")),
+            _check_attr(data[9], int, ValueError("Invalid sp.def")),
+            _check_attr(data[10], int, ValueError("Invalid speed"))
+        ),
+        _check_attr(data[11], int, ValueError("Invalid generation Id")),
+        _check_attr(data[12], bool, ValueError("Invalid legendary"))
+    )
+
+
+def read_pokemon_file(data_file):
+    with open(data_file, 'r', encoding='utf-8') as f:
+        f.readline()  # not interested in first line
+
+        # id,Name,Type 1,Type 2,Total,HP,Attack,Defense,Sp.Atk,Sp.Def,Speed,Generation,Legendary
+        for l, line in enumerate(f, 2):
+            try:
+                yield parse_pokemon_line(line)
+            except ValueError as ve:
+                print("Invalid entry at line {}: {}".format(l, ve))
+
+
+def _trigram_key(trigram):
+    # not _build_key, leading/trailing spaces are part of the trigram
+    return "{}{}".format(POKEMON_NAME_TRIGRAM_KEY, trigram)
+
+
+def _pokemon_to_hash(pokemon):
+    fields = {
+        'id': pokemon.id,
+        'name': pokemon.name,
+        'type': ','.join(p_type for p_type in pokemon.type if p_type),
+        'gen': pokemon.gen,
+        'legendary': int(pokemon.legendary)
+    }
+    for stat, val in pokemon.stats().items():
+        fields['stats.' + stat] = val
+    return fields
+
+
+def _hash_fields(projection):
+    # the hash fields a projection needs, the id is always read so a
+    # missing pokemon can be told apart from one without those fields
+    if projection is None:
+        return HASH_FIELDS
+
+    fields = ['id']
+    for field in HASH_FIELDS[1:]:
+        name, _, stat = field.partition('.')
+        if name in projection and (
+                not stat or projection[name] is None or
+                stat in projection[name]):
+            fields.append(field)
+    return fields
+
+
+def _pokemon_from_hash(fields, values):
+    # HMGET values back into a record, None for a missing pokemon
+    if values[0] is None:
+        return None
+
+    pokemon = PokemonRecord()
+    for field, value in zip(fields, values):
+        if value is None:
+            continue
+        value = value.decode('utf-8')
+        if field.startswith('stats.'):
+            setattr(pokemon, HASH_STAT_SLOTS[field], int(value))
+        elif field == 'type':
+            pokemon.type = tuple(value.split(','))
+        elif field == 'gen':
+            pokemon.gen = int(value)
+        elif field == 'legendary':
+            pokemon.legendary = value == '1'
+        else:
+            setattr(pokemon, field, value)
+    return pokemon
 
-    def _parse_pokemon_line(self, line):
 
-        def check_type(type_a, type_b):
-            if not type_a:
-                raise ValueError("Invalid Type 1")
+def _with_field(fields, field):
+    fields = split_fields(fields)
+    return None if fields is None else fields + (field,)
+
 
-            if type_b:
-                return [type_a, type_b]
+def _sort_ids(ids):
+    # set members come back in no particular order, numeric ids are
+    # returned in pokedex order
+    return sorted(
+        ids, key=lambda p_id: (not p_id.isdigit(), len(p_id), p_id)
+    )
 
-            return [type_a]
 
-        data = line.split(',')
-        if len(data) != 13:
-            raise ValueError(
-                "Not enough attributes"
+class Pokedex(object):
+
+    def __init__(self, redis_url,
+                 import_batch_size=DEFAULT_IMPORT_BATCH_SIZE,
+                 hydrate_batch_size=DEFAULT_HYDRATE_BATCH_SIZE,
+                 cache=None,
+                 version_check_interval=DEFAULT_VERSION_CHECK_INTERVAL,
+                 layout=LAYOUT_JSON):
+        self.redis = redis.Redis.from_url(url=redis_url)
+        self.import_batch_size = import_batch_size
+        self.hydrate_batch_size = hydrate_batch_size
+
+        # LAYOUT_HASH reads only the fields a query or battle needs and
+        # skips JSON decoding, both sides of a deployment must agree
+        if layout not in (LAYOUT_JSON, LAYOUT_HASH):
+            raise ValueError("Unknown layout {}".format(layout))
+        self.layout = layout
+
+        # optional read-through cache of decoded pokemon and index lists,
+        # dropped whenever the dataset version in redis moves on
+        self.cache = cache
+        self.version_check_interval = version_check_interval
+        self._version = None
+        self._version_checked = 0
+
+        # (NameIndex, ids) over every name, built on the first fuzzy search
+        self._fuzzy_index = None
+
+    def import_data(self, data_file, batch_size=None):
+        batch_size = batch_size or self.import_batch_size
+        start = time.time()
+        imported = 0
+        batch = []
+        seen = set()
+
+        for pokemon in read_pokemon_file(data_file):
+            batch.append(pokemon)
+            if len(batch) >= batch_size:
+                imported += self._import_batch(batch, seen)
+                batch = []
+
+        if batch:
+            imported += self._import_batch(batch, seen)
+
+        self.redis.incr(POKEMON_VERSION_KEY)
+        if self.cache is not None:
+            self.cache.clear()
+        self._fuzzy_index = None
+        self._version_checked = 0
+
+        elapsed = time.time() - start
+        print("Imported {} pokemon in {:.2f}s ({:.0f} rows/s)".format(
+            imported, elapsed, imported / elapsed if elapsed else 0
+        ))
+        return imported
+
+    def _parse_pokemon_line(self, line):
+        return parse_pokemon_line(line)
+
+    def _pokemon_key(self, p_id):
+        if self.layout == LAYOUT_HASH:
+            return _build_key(POKEMON_HASH_KEY, p_id)
+        return _build_key(POKEMON_ID_KEY, p_id)
+
+    def _existing(self, p_ids):
+        keys = [self._pokemon_key(p_id) for p_id in p_ids]
+        if self.layout == LAYOUT_JSON:
+            return self.redis.mget(keys)
+
+        pipe = self.redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.exists(key)
+        return pipe.execute()
+
+    def _import_batch(self, pokemons, seen=None):
+        # One MGET to find the pokemon already present and one MULTI/EXEC
+        # for every write in the batch. seen has the ids earlier batches of
+        # the same import took.
+        seen = set() if seen is None else seen
+        batch = {}
+        for pokemon in pokemons:
+            if pokemon.id in batch or pokemon.id in seen:
+                print("Pokemon id: {} ({}) already in pokedex, skipping".format(
+                    pokemon.id, pokemon.name)
+                )
+                continue
+            batch[pokemon.id] = pokemon
+        seen.update(batch)
+
+        if not batch:
+            return 0
+
+        existing = self._existing(list(batch))
+
+        pipe = self.redis.pipeline(transaction=True)
+        imported = 0
+        for pokemon, exists in zip(batch.values(), existing):
+            if exists:
+                print("Pokemon id: {} ({}) already in pokedex, indexing only"
+                      .format(pokemon.id, pokemon.name))
+            else:
+                self._write_document(pipe, pokemon)
+                imported += 1
+            self._write_indexes(pipe, pokemon)
+
+        pipe.execute()
+        return imported
+
+    def _write_document(self, client, pokemon):
+        # ASSUMPTION: pokemon details don't change, an existing document
+        # is never rewritten
+        if self.layout == LAYOUT_HASH:
+            client.hmset(
+                self._pokemon_key(pokemon.id), _pokemon_to_hash(pokemon)
             )
-        return {
-            'id': _check_attr(data[0], str, ValueError("No Id")),
-            'name': _check_attr(data[1], str, ValueError("No name")),
-            'type': check_type(data[2], data[3]),
-            'stats': {
-                'total': _check_attr(data[4], int, ValueError("Invalid total")),
-                'hp': _check_attr(data[5], int, ValueError("Invalid HP")),
-                'attack': _check_attr(data[6], int, ValueError("Invalid attack")),
-                'defence': _check_attr(data[7], int, ValueError("Invalid defence")),
-                'sp.atk': _check_attr(data[8], int, ValueError("Invalid sp.atk")),
-                'sp.def': _check_attr(data[9], int, ValueError("Invalid sp.def")),
-                'speed': _check_attr(data[10], int, ValueError("Invalid speed"))
-            },
-            'gen': _check_attr(data[11], int, ValueError("Invalid generation Id")),
-            'legendary': _check_attr(data[12], bool, ValueError("Invalid legendary"))
-        }
-
-    def _reset_lists(self):
-        def delete_list(redis, key):
-            while redis.llen(key) > 0:
-                redis.ltrim(key, 0, -99)
-
-        for key in self.redis.keys(_build_key(POKEMON_TYPE_KEY, '*')):
-            delete_list(self.redis, key)
-
-        for key in self.redis.keys(_build_key(POKEMON_STATS_KEY, '*')):
-            delete_list(self.redis, key)
-
-        for key in self.redis.keys(_build_key(POKEMON_GEN_KEY, '*')):
-            delete_list(self.redis, key)
-
-        for key in self.redis.keys(_build_key(POKEMON_LEGEND_KEY, '*')):
-            delete_list(self.redis, key)
-
-    def _import_pokemon(self, pokemon):
-        p_id = pokemon['id']
-        if self.redis.get(_build_key(POKEMON_ID_KEY, pokemon['id'])):
-            print("Pokemon id: {} ({}) already in pokedex, skipping".format(
-                p_id, pokemon['name'])
+        else:
+            client.set(
+                self._pokemon_key(pokemon.id), json.dumps(pokemon.to_dict())
             )
-            return  # ASSUMPTION: pokemon details don't change
 
-        self.redis.set(
-            _build_key(POKEMON_ID_KEY, p_id), json.dumps(pokemon)
+    def _write_indexes(self, client, pokemon):
+        # written for every pokemon imported, present or not: the store may
+        # hold documents from before these keys existed or from an import
+        # that failed half way, and every one of these writes is idempotent
+        p_id = pokemon.id
+        client.set(
+            _build_key(POKEMON_NAME_KEY, pokemon.name), p_id
         )
-        self.redis.set(
-            _build_key(POKEMON_NAME_KEY, pokemon['name']), p_id
+        client.zadd(
+            POKEMON_NAMES_KEY,
+            {"{}:{}".format(pokemon.name.lower(), p_id): 0}
         )
-        self.redis.lpush(
-            _build_key(POKEMON_GEN_KEY, pokemon['gen']), p_id
+        for trigram in trigrams(pokemon.name):
+            client.sadd(_trigram_key(trigram), p_id)
+        client.sadd(
+            _build_key(POKEMON_GEN_KEY, pokemon.gen), p_id
         )
-        self.redis.lpush(
-            _build_key(POKEMON_LEGEND_KEY, pokemon['legendary']), p_id
+        client.sadd(
+            _build_key(POKEMON_LEGEND_KEY, pokemon.legendary), p_id
         )
-        for p_type in pokemon['type']:
+        for p_type in pokemon.type:
             if p_type:
-                self.redis.lpush(
+                client.sadd(
                     _build_key(POKEMON_TYPE_KEY, p_type), p_id
                 )
-        for stat, val in pokemon['stats'].items():
-            self.redis.lpush(_build_key(POKEMON_STATS_KEY, stat), p_id)
+        for stat, val in pokemon.stats().items():
+            client.zadd(_build_key(POKEMON_STATS_KEY, stat), {p_id: val})
+
+    def _check_version(self):
+        now = time.time()
+        if now - self._version_checked < self.version_check_interval:
+            return
+
+        self._version_checked = now
+        version = self.redis.get(POKEMON_VERSION_KEY)
+        if version != self._version:
+            if self.cache is not None:
+                self.cache.clear()
+            self._fuzzy_index = None
+            self._version = version
+
+    def data_version(self):
+        # changes on every import, also one run by another process
+        self._check_version()
+        return self._version
+
+    def _cache_get(self, key):
+        if self.cache is None:
+            return None
+        self._check_version()
+        return self.cache.get(key)
+
+    def _cache_set(self, key, value):
+        if self.cache is not None:
+            self.cache.set(key, value)
+
+    def _get_pokemon_from_sets(self, keys, fields=None):
+        # one key is a plain SMEMBERS, more are intersected by redis so
+        # only the common ids are transferred and hydrated
+        cache_key = '&'.join(keys)
+        ids = self._cache_get(cache_key)
+        if ids is None:
+            if len(keys) == 1:
+                ids = self.redis.smembers(keys[0])
+            else:
+                ids = self.redis.sinter(keys)
+            ids = _sort_ids(p_id.decode('ASCII') for p_id in ids)
+            self._cache_set(cache_key, ids)
 
-    def _get_pokemon_from_list(self, key):
-        ids = self.redis.lrange(key, 0, -1)
         if not ids:
             return []
 
-        return [self.get_pokemon_by_id(p_id.decode('ASCII')) for p_id in ids]
+        return self.get_pokemon_by_ids(ids, fields)
+
+    def _read_hashes(self, keys, projection):
+        # {key: pokemon}, one pipeline of HMGETs per chunk, for only the
+        # fields the projection needs
+        fields = _hash_fields(projection)
+        found = {}
+        for i in range(0, len(keys), self.hydrate_batch_size):
+            chunk = keys[i:i + self.hydrate_batch_size]
+            pipe = self.redis.pipeline(transaction=False)
+            for key in chunk:
+                pipe.hmget(key, fields)
+            for key, values in zip(chunk, pipe.execute()):
+                pokemon = _pokemon_from_hash(fields, values)
+                if pokemon is not None:
+                    found[key] = pokemon
+                    # partial documents are not cached
+                    if projection is None:
+                        self._cache_set(key, pokemon)
+        return found
+
+    def _read_documents(self, keys):
+        found = {}
+        for i in range(0, len(keys), self.hydrate_batch_size):
+            chunk = keys[i:i + self.hydrate_batch_size]
+            for key, result in zip(chunk, self.redis.mget(chunk)):
+                if result:
+                    found[key] = PokemonRecord.from_dict(
+                        json.loads(result.decode('ASCII'))
+                    )
+                    self._cache_set(key, found[key])
+        return found
+
+    def get_pokemon_by_id(self, p_id, fields=None):
+        projection = parse_fields(fields)
+        key = self._pokemon_key(p_id)
+        pokemon = self._cache_get(key)
+        if pokemon is None:
+            if self.layout == LAYOUT_HASH:
+                hash_fields = _hash_fields(projection)
+                pokemon = _pokemon_from_hash(
+                    hash_fields, self.redis.hmget(key, hash_fields)
+                )
+                if pokemon is None:
+                    return None
+                if projection is None:
+                    self._cache_set(key, pokemon)
+            else:
+                result = self.redis.get(key)
+                if not result:
+                    return None
+                pokemon = PokemonRecord.from_dict(
+                    json.loads(result.decode('ASCII'))
+                )
+                self._cache_set(key, pokemon)
+
+        return pokemon.project(projection)
+
+    def get_pokemon_by_ids(self, p_ids, fields=None):
+        # one MGET (or HMGET pipeline) per chunk rather than one round trip
+        # per pokemon, ids that are not in the pokedex are left out
+        projection = parse_fields(fields)
+        keys = [self._pokemon_key(p_id) for p_id in p_ids]
+
+        found = {}
+        missing = []
+        for key in keys:
+            pokemon = self._cache_get(key)
+            if pokemon is None:
+                missing.append(key)
+            else:
+                found[key] = pokemon
+
+        if missing and self.layout == LAYOUT_HASH:
+            found.update(self._read_hashes(missing, projection))
+        elif missing:
+            found.update(self._read_documents(missing))
+
+        return [found[key].project(projection) for key in keys if key in found]
+
+    def _search_names(self, pattern):
+        keys = pattern_trigrams(pattern)
+        if keys:
+            # candidates share every trigram of the pattern, the glob
+            # itself is checked once they are hydrated
+            return _sort_ids(
+                p_id.decode('ASCII')
+                for p_id in self.redis.sinter([_trigram_key(k) for k in keys])
+            )
 
-    def get_pokemon_by_id(self, p_id):
-        result = self.redis.get(
-            _build_key(POKEMON_ID_KEY, p_id)
-        )
-        if not result:
-            return None
-        return json.loads(result.decode('ASCII'))
+        prefix = pattern_prefix(pattern).encode('utf-8')
+        if prefix:
+            entries = self.redis.zrangebylex(
+                POKEMON_NAMES_KEY, b'[' + prefix, b'[' + prefix + b'\xff'
+            )
+        else:
+            entries = self.redis.zrange(POKEMON_NAMES_KEY, 0, -1)
+
+        ids = []
+        for entry in entries:
+            name, p_id = entry.decode('utf-8').rsplit(':', 1)
+            if match_name(pattern, name):
+                ids.append(p_id)
+        return _sort_ids(ids)
+
+    def get_pokemon_by_name(self, name, fields=None):
+        projection = parse_fields(fields)
+        pattern = name_pattern(name)
+        cache_key = "{}:{}".format(POKEMON_NAMES_KEY, pattern)
+        ids = self._cache_get(cache_key)
+        if ids is None:
+            ids = self._search_names(pattern)
+            self._cache_set(cache_key, ids)
 
-    def get_pokemon_by_name(self, name):
-        ids = [self.redis.get(ident).decode("ASCII")
-               for ident in self.redis.scan_iter(
-            match=_build_key(POKEMON_NAME_KEY, name)
-        )]
         if not ids:
             return []
-        return [self.get_pokemon_by_id(p_id) for p_id in ids]
+        # the name is needed for the final match, whatever was asked for
+        pokemon = self.get_pokemon_by_ids(ids, _with_field(fields, 'name'))
+        return [p.project(projection) for p in pokemon
+                if match_name(pattern, p.name)]
+
+    def get_pokemon_by_fuzzy_name(self, name, limit, fields=None):
+        projection = parse_fields(fields)
+        # names are few and small, so the similarity index is kept in
+        # process and rebuilt when the dataset version changes
+        self._check_version()
+        if self._fuzzy_index is None:
+            names = self.redis.zrange(POKEMON_NAMES_KEY, 0, -1)
+            entries = [entry.decode('utf-8').rsplit(':', 1) for entry in names]
+            self._fuzzy_index = (
+                NameIndex([name for name, _ in entries]),
+                [p_id for _, p_id in entries]
+            )
 
-    def get_pokemon_of_type(self, p_type):
-        return self._get_pokemon_from_list(
-            _build_key(POKEMON_TYPE_KEY, p_type.lower().strip())
+        index, ids = self._fuzzy_index
+        matches = index.fuzzy(name, limit)
+        pokemon = {p.id: p for p in self.get_pokemon_by_ids(
+            [ids[row] for row, _ in matches], _with_field(fields, 'id')
+        )}
+        return [{'score': round(score, 3),
+                 'pokemon': pokemon[ids[row]].project(projection)}
+                for row, score in matches if ids[row] in pokemon]
+
+    def get_pokemon_of_type(self, p_type, fields=None):
+        return self._get_pokemon_from_sets(
+            [_build_key(POKEMON_TYPE_KEY, p_type.lower().strip())], fields
         )
 
-    def get_pokemon_by_generation(self, gen):
-        return self._get_pokemon_from_list(
-            _build_key(POKEMON_GEN_KEY, gen.lower().strip())
+    def get_pokemon_by_generation(self, gen, fields=None):
+        return self._get_pokemon_from_sets(
+            [_build_key(POKEMON_GEN_KEY, gen.lower().strip())], fields
         )
 
-    def get_pokemon_by_legendary(self, is_legend):
-        return self._get_pokemon_from_list(
-            _build_key(POKEMON_LEGEND_KEY, is_legend)
+    def get_pokemon_by_legendary(self, is_legend, fields=None):
+        return self._get_pokemon_from_sets(
+            [_build_key(POKEMON_LEGEND_KEY, is_legend)], fields
         )
 
-    def get_pokemon_by_stat(self, stat):
-        return self._get_pokemon_from_list(
-            _build_key(POKEMON_STATS_KEY, stat)
-        )
+    def get_pokemon_by_stat(self, stat, fields=None):
+        key = _build_key(POKEMON_STATS_KEY, stat)
+        ids = self._cache_get(key)
+        if ids is None:
+            ids = [p_id.decode('ASCII')
+                   for p_id in self.redis.zrange(key, 0, -1)]
+            self._cache_set(key, ids)
 
-    def get_pokemon_by_type(self, p_types):
-        result = []
-        for p_type in p_types:
-            result.append(self.get_pokemon_of_type(p_type))
+        return self.get_pokemon_by_ids(ids, fields)
 
-        if not result or not any(result):
+    def get_pokemon_by_type(self, p_types, fields=None):
+        if not p_types:
             return []
 
-        ids = [{a['id'] for a in b} for b in result]
-
-        ids = ids[0].intersection(*ids[1:])
-        return [a for a in result[0] if a['id'] in ids]
-
-    def _filter_by_stat(self, pokemon, stat, op, value):
-        if op == '>':
-            return pokemon['stats'][stat] > value
-        if op == '>=' or op == '=>':
-            return pokemon['stats'][stat] >= value
-        if op == '<':
-            return pokemon['stats'][stat] < value
-        if op == '<=' or op == '=>':
-            return pokemon['stats'][stat] <= value
-        if op == '=':
-            return pokemon['stats'][stat] == value
+        return self._get_pokemon_from_sets(
+            [_build_key(POKEMON_TYPE_KEY, p_type) for p_type in p_types],
+            fields
+        )
 
-    def get_pokemon_by_stats(self, stats):
+    def _stats_query(self, keys, scores):
+        # each stat set is copied, trimmed to its range and the copies are
+        # intersected, in one MULTI so nobody sees the temporary keys
+        query = POKEMON_STATS_QUERY_KEY + uuid.uuid4().hex
+        ranges = ["{}:{}".format(query, i) for i in range(len(keys))]
+        pipe = self.redis.pipeline(transaction=True)
+        for key, tmp, low, high in zip(keys, ranges, scores[::2],
+                                       scores[1::2]):
+            pipe.zunionstore(tmp, [key])
+            for outside in _outside(low, high):
+                pipe.zremrangebyscore(tmp, *outside)
+        pipe.zinterstore(query, ranges)
+        pipe.zrange(query, 0, -1)
+        pipe.delete(query, *ranges)
+        return pipe.execute()[-2]
+
+    def get_pokemon_by_stats(self, stats, fields=None):
         # [(stat, op, value)]
-        result = []
-        for stat, op, value in stats:
-            result.append(
-                [p for p in self.get_pokemon_by_stat(stat)
-                 if self._filter_by_stat(p, stat, op, value)]
-            )
-
-        if not result or not any(result):
+        # each predicate is a ZRANGEBYSCORE on the stat's sorted set, more
+        # than one is intersected inside redis so only matches come back
+        if not stats:
             return []
 
-        ids = [{a['id'] for a in b} for b in result]
+        keys = []
+        scores = []
+        for stat, op, value in stats:
+            keys.append(_build_key(POKEMON_STATS_KEY, stat))
+            scores.extend(score_range(op, value))
+
+        if len(keys) == 1:
+            ids = self.redis.zrangebyscore(keys[0], *scores)
+        else:
+            ids = self._stats_query(keys, scores)
 
-        ids = ids[0].intersection(*ids[1:])
-        return [a for a in result[0] if a['id'] in ids]
+        # pokedex order rather than the score order redis returns, the
+        # same as every other query and the memory pokedex
+        return self.get_pokemon_by_ids(
+            _sort_ids(p_id.decode('ASCII') for p_id in ids), fields
+        )
@@ -0,0 +1,55 @@
+POKEMON_FIELDS = ('id', 'name', 'type', 'stats', 'gen', 'legendary')
+
+
+def split_fields(fields):
+    # "name, stats.attack" or a list of them -> sorted tuple, None for
+    # the whole document
+    if fields is None:
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    return tuple(sorted({
+        field.strip().lower() for field in fields if field.strip()
+    }))
+
+
+def parse_fields(fields):
+    # {field: None for all of it or {stat, ...}}, single stats are
+    # selected as 'stats.<stat>'
+    fields = split_fields(fields)
+    if fields is None:
+        return None
+    if not fields:
+        raise ValueError("No fields")
+
+    projection = {}
+    for field in fields:
+        field, _, sub = field.partition('.')
+        if field not in POKEMON_FIELDS or (sub and field != 'stats'):
+            raise ValueError("Unknown field {}".format(field))
+
+        if not sub:
+            projection[field] = None
+        elif projection.get(field, ()) is not None:
+            projection.setdefault(field, set()).add(sub)
+    return projection
+
+
+def project(pokemon, projection):
+    if projection is None:
+        return pokemon
+
+    result = {}
+    for field, value in pokemon.items():
+        if field not in projection:
+            continue
+        if projection[field] is not None:
+            value = {k: v for k, v in value.items() if k in projection[field]}
+        result[field] = value
+    return result
+
+
+def project_all(pokemons, projection):
+    if projection is None:
+        return pokemons
+    return [project(pokemon, projection) for pokemon in pokemons]
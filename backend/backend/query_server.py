@@ -1,29 +1,135 @@
 import re
+from functools import partial
 
-from .base_server import BaseServer
+from .base_server import BaseServer, encode_result
+from .projection import split_fields
+from .single_flight import SingleFlight
 
 STATS_REGEX = re.compile("([a-zA-Z0-9]+)([<>=]{1,2})(\\d+)")
+# request options that select part of a result rather than a query
+PAGE_OPTIONS = ('limit', 'cursor', 'stream')
+QUERY_OPTIONS = frozenset(['fields'])
+LIST_OPTIONS = QUERY_OPTIONS | frozenset(PAGE_OPTIONS)
 
 
-class QueryServer(BaseServer):
+def normalize_query(q_type, arg):
+    # query arguments are case insensitive and ignore surrounding whitespace
+    return q_type, arg.strip().lower()
+
+
+def parse_page(limit=None, cursor=None, stream=False):
+    # the cursor is the opaque position of the next result, as returned
+    # with the previous page
+    start = int(cursor) if cursor else 0
+    limit = int(limit) if limit is not None else None
+    if start < 0 or (limit is not None and limit < 1):
+        raise ValueError("Bad page")
+    return start, limit
+
 
-    def __init__(self, query_queue, pokedex):
-        super(QueryServer, self).__init__(query_queue)
+def paginate(result, start, limit):
+    # (page, cursor of the next page or None)
+    end = start + limit if limit else len(result)
+    return result[start:end], str(end) if end < len(result) else None
+
+
+class QueryServer(BaseServer):
+    fuzzy_limit = 10
+    stream_chunk_size = 100
+    requests = {
+        'ID': (1, QUERY_OPTIONS),
+        'NAME': (1, QUERY_OPTIONS),
+        'FUZZY': (1, QUERY_OPTIONS),
+        'TYPE': (1, LIST_OPTIONS),
+        'GEN': (1, LIST_OPTIONS),
+        'LEGEND': (1, LIST_OPTIONS),
+        'STATS': (1, LIST_OPTIONS)
+    }
+
+    def __init__(self, query_queue, pokedex, response_cache=None):
+        # response_cache is keyed by the normalized query and the pokedex
+        # data version
+        super(QueryServer, self).__init__(query_queue, response_cache)
         self.query_queue = query_queue
         self.pokedex = pokedex
+        self.single_flight = SingleFlight()
 
         self.q_func = {
             'ID': self._get_by_id,
             'NAME': self._get_by_name,
+            'FUZZY': self._get_by_fuzzy_name,
             'TYPE': self._get_by_type,
             'GEN': self._get_by_gen,
             'LEGEND': self._get_by_legendary,
             'STATS': self._get_by_stats
         }
 
-    def _request_received(self, q_type, arg):
+    def _respond(self, content_type, args, options):
+        page = {
+            key: options.pop(key) for key in PAGE_OPTIONS if key in options
+        }
+        if page:
+            return self._respond_page(content_type, args, options, page)
+
+        if set(options) - {'fields'}:
+            return super(QueryServer, self)._respond(
+                content_type, args, options
+            )
+
+        # identical queries arriving together share one encoded body, the
+        # waiters neither encode it again nor go through the cache
+        key = normalize_query(*args) + (split_fields(options.get('fields')),)
+        return self.single_flight.do(
+            (content_type,) + key, self._respond_query,
+            content_type, args, key
+        )
+
+    def _respond_query(self, content_type, args, key):
+        q_type, arg = args
+        request = partial(self._run_query, q_type, arg, key[-1])
+        if self.response_cache is None:
+            code, result = request()
+            return encode_result(code, result, content_type)
+        return self._cached(
+            self.pokedex.data_version(), key, content_type, request
+        )
+
+    def _respond_page(self, content_type, args, options, page):
+        try:
+            start, limit = parse_page(**page)
+        except (TypeError, ValueError):
+            return encode_result(403, "Bad input", content_type)
+
+        code, result = self._request_received(*args, **options)
+        if code != 200 or not isinstance(result, list):
+            return encode_result(code, result, content_type)
+
+        if not page.get('stream'):
+            result, cursor = paginate(result, start, limit)
+            return encode_result(code, result, content_type, cursor=cursor)
+
+        # one message per chunk, the last one says there is no more
+        size = limit or self.stream_chunk_size
+        chunks = range(start, max(len(result), start + 1), size)
+        return [
+            encode_result(
+                code, result[i:i + size], content_type,
+                more=i + size < len(result)
+            ) for i in chunks
+        ]
+
+    def _request_received(self, q_type, arg, fields=None):
+        # identical queries arriving together (from several worker
+        # threads) are answered by a single pokedex lookup
+        fields = split_fields(fields)
+        return self.single_flight.do(
+            normalize_query(q_type, arg) + (fields,),
+            self._run_query, q_type, arg, fields
+        )
+
+    def _run_query(self, q_type, arg, fields=None):
         try:
-            result = self.q_func[q_type](arg)
+            result = self.q_func[q_type](arg, fields)
         except ValueError:
             return 403, "Bad input"
         except Exception:
@@ -34,27 +140,36 @@ class QueryServer(BaseServer):
             else:
                 return 200, result
 
-    def _get_by_id(self, arg):
+    def _get_by_id(self, arg, fields=None):
+        arg = arg.strip()
+        if not arg:
+            raise ValueError("Bad input")
+
+        return self.pokedex.get_pokemon_by_id(arg, fields=fields)
+
+    def _get_by_name(self, arg, fields=None):
         arg = arg.strip()
         if not arg:
             raise ValueError("Bad input")
 
-        return self.pokedex.get_pokemon_by_id(arg)
+        return self.pokedex.get_pokemon_by_name(arg, fields=fields)
 
-    def _get_by_name(self, arg):
+    def _get_by_fuzzy_name(self, arg, fields=None):
         arg = arg.strip()
         if not arg:
             raise ValueError("Bad input")
 
-        return self.pokedex.get_pokemon_by_name(arg)
+        return self.pokedex.get_pokemon_by_fuzzy_name(
+            arg, self.fuzzy_limit, fields=fields
+        )
 
-    def _get_by_gen(self, arg):
+    def _get_by_gen(self, arg, fields=None):
         arg = arg.strip()
         if not arg:
             raise ValueError("Bad input")
-        return self.pokedex.get_pokemon_by_generation(arg)
+        return self.pokedex.get_pokemon_by_generation(arg, fields=fields)
 
-    def _get_by_legendary(self, arg):
+    def _get_by_legendary(self, arg, fields=None):
         if arg.lower().strip() in ['0', 'f', 'false']:
             arg = False
         elif arg.lower().strip() in ['1', 't', 'true']:
@@ -62,18 +177,18 @@ class QueryServer(BaseServer):
         else:
             raise ValueError("Bad input")
 
-        return self.pokedex.get_pokemon_by_legendary(arg)
+        return self.pokedex.get_pokemon_by_legendary(arg, fields=fields)
 
-    def _get_by_type(self, arg):
+    def _get_by_type(self, arg, fields=None):
         p_types = [a for a in arg.split(',') if a.strip()]
         if p_types:
-            return self.pokedex.get_pokemon_by_type(p_types)
+            return self.pokedex.get_pokemon_by_type(p_types, fields=fields)
         else:
             raise ValueError("Bad input")
 
         return None
 
-    def _get_by_stats(self, arg):
+    def _get_by_stats(self, arg, fields=None):
         stats = []
         for match in STATS_REGEX.finditer(arg):
             if not match:
@@ -82,6 +197,6 @@ class QueryServer(BaseServer):
             stats.append((match.group(1), match.group(2), int(match.group(3))))
 
         if stats:
-            return self.pokedex.get_pokemon_by_stats(stats)
+            return self.pokedex.get_pokemon_by_stats(stats, fields=fields)
 
         return None
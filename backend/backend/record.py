@@ -0,0 +1,76 @@
+from .projection import project
+
+STATS = ('total', 'hp', 'attack', 'defence', 'sp.atk', 'sp.def', 'speed')
+# one attribute per stat, 'sp.atk' is not a name
+STAT_SLOTS = tuple(stat.replace('.', '_') for stat in STATS)
+NO_STATS = (None,) * len(STATS)
+
+
+# One pokemon as attributes rather than a nested dict, a fraction of the
+# size and read without any hashing. Records are shared by every caller
+# and never changed, the document a client sees is only built by
+# to_dict() when the record is serialized, with the fields of projection.
+# Fields that were not read (a partial hash read) are None.
+class PokemonRecord(object):
+    __slots__ = ('id', 'name', 'type', 'gen', 'legendary',
+                 'projection') + STAT_SLOTS
+
+    def __init__(self, p_id=None, name=None, p_type=None, stats=NO_STATS,
+                 gen=None, legendary=None, projection=None):
+        # stats in STATS order
+        self.id = p_id
+        self.name = name
+        self.type = p_type
+        (self.total, self.hp, self.attack, self.defence, self.sp_atk,
+         self.sp_def, self.speed) = stats
+        self.gen = gen
+        self.legendary = legendary
+        self.projection = projection
+
+    @classmethod
+    def from_dict(cls, pokemon, projection=None):
+        stats = pokemon.get('stats') or {}
+        p_type = pokemon.get('type')
+        return cls(
+            pokemon.get('id'), pokemon.get('name'),
+            None if p_type is None else tuple(p_type),
+            tuple(stats.get(stat) for stat in STATS),
+            pokemon.get('gen'), pokemon.get('legendary'), projection
+        )
+
+    def stats(self):
+        return {stat: getattr(self, slot)
+                for stat, slot in zip(STATS, STAT_SLOTS)
+                if getattr(self, slot) is not None}
+
+    def project(self, projection):
+        # the same values seen through another projection
+        if projection is None:
+            return self
+        record = PokemonRecord.__new__(PokemonRecord)
+        for slot in PokemonRecord.__slots__:
+            setattr(record, slot, getattr(self, slot))
+        record.projection = projection
+        return record
+
+    def to_dict(self):
+        pokemon = {
+            'id': self.id,
+            'name': self.name,
+            'type': None if self.type is None else list(self.type),
+            'stats': self.stats() or None,
+            'gen': self.gen,
+            'legendary': self.legendary
+        }
+        return project({field: value for field, value in pokemon.items()
+                        if value is not None}, self.projection)
+
+    def __eq__(self, other):
+        if not isinstance(other, PokemonRecord):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'PokemonRecord({!r})'.format(self.to_dict())
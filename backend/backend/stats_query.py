@@ -0,0 +1,71 @@
+from bisect import bisect_left, bisect_right
+
+OPERATORS = ('>', '>=', '=>', '<', '<=', '=<', '=')
+
+
+def score_range(op, value):
+    # (min, max) redis score bounds for a predicate, '(' marks exclusive
+    if op not in OPERATORS:
+        raise ValueError("Unknown operator {}".format(op))
+
+    if op == '>':
+        return '({}'.format(value), '+inf'
+    if op in ('>=', '=>'):
+        return value, '+inf'
+    if op == '<':
+        return '-inf', '({}'.format(value)
+    if op in ('<=', '=<'):
+        return '-inf', value
+    return value, value
+
+
+class SortedStatIndex(object):
+
+    def __init__(self, columns):
+        # per stat: row numbers ordered by value, plus the values in that
+        # order so each predicate is one bisect range scan
+        self.rows = {}
+        self.values = {}
+        for stat, column in columns.items():
+            rows = sorted(range(len(column)), key=column.__getitem__)
+            self.rows[stat] = rows
+            self.values[stat] = [column[row] for row in rows]
+
+    def scan(self, stat, op, value):
+        if op not in OPERATORS:
+            raise ValueError("Unknown operator {}".format(op))
+
+        rows = self.rows.get(stat.lower().strip())
+        if rows is None:
+            return []
+
+        values = self.values[stat.lower().strip()]
+        lo, hi = 0, len(values)
+        if op == '>':
+            lo = bisect_right(values, value)
+        elif op in ('>=', '=>'):
+            lo = bisect_left(values, value)
+        elif op == '<':
+            hi = bisect_left(values, value)
+        elif op in ('<=', '=<'):
+            hi = bisect_right(values, value)
+        else:
+            lo = bisect_left(values, value)
+            hi = bisect_right(values, value)
+        return rows[lo:hi]
+
+    def query(self, stats):
+        # narrowest predicate first, then keep the rows every other range
+        # agrees on; rows come back in row (import) order
+        scans = sorted(
+            (self.scan(stat, op, value) for stat, op, value in stats), key=len
+        )
+        if not scans or not scans[0]:
+            return []
+
+        rows = set(scans[0])
+        for scan in scans[1:]:
+            rows.intersection_update(scan)
+            if not rows:
+                return []
+        return sorted(rows)
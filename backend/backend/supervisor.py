@@ -0,0 +1,109 @@
+import multiprocessing
+import signal
+import sys
+import time
+
+
+def _run_worker(target, args):
+    # the supervisor owns ctrl-c, a worker only stops on SIGTERM and does
+    # so by unwinding, so connections and thread pools are closed cleanly
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    target(*args)
+
+
+class Supervisor(object):
+    poll_interval = 1.0
+    shutdown_timeout = 10.0
+    # a worker that exits is restarted after restart_delay, doubled after
+    # every early exit in a row up to max_restart_delay. One that ran for
+    # stable_time before exiting starts over at restart_delay.
+    restart_delay = 1.0
+    max_restart_delay = 60.0
+    stable_time = 30.0
+
+    def __init__(self, processes, target, args=()):
+        self.processes = processes
+        self.target = target
+        self.args = args
+
+        self.workers = {}
+        self.stopping = False
+        # per slot: when its worker started, the delay before its last
+        # restart and when a dead one is due to be restarted
+        self.started = {}
+        self.delays = {}
+        self.restart_at = {}
+        # fork, so whatever the parent loaded before starting (the imported
+        # pokedex) is shared with the workers
+        self._context = multiprocessing.get_context('fork')
+
+    def _start(self, slot):
+        worker = self._context.Process(
+            target=_run_worker, args=(self.target, self.args),
+            name="backend-worker-{}".format(slot)
+        )
+        worker.start()
+        self.workers[slot] = worker
+        self.started[slot] = time.time()
+        print("Started worker {} (pid {})".format(slot, worker.pid))
+
+    def stop(self, signum=None, frame=None):
+        self.stopping = True
+
+    def check_workers(self):
+        now = time.time()
+        for slot, worker in list(self.workers.items()):
+            if worker.is_alive():
+                continue
+            if slot not in self.restart_at:
+                delay = self._restart_delay(slot, now)
+                self.restart_at[slot] = now + delay
+                print("Worker {} (pid {}) exited with {}, restarting in "
+                      "{:.0f}s".format(slot, worker.pid, worker.exitcode,
+                                       delay))
+            if now >= self.restart_at[slot]:
+                del self.restart_at[slot]
+                self._start(slot)
+
+    def _restart_delay(self, slot, now):
+        # a worker that keeps dying (MQ down and connect() giving up) is
+        # not restarted every poll_interval forever
+        delay = self.delays.get(slot)
+        if delay is None or now - self.started[slot] >= self.stable_time:
+            delay = self.restart_delay
+        else:
+            delay = min(delay * 2, self.max_restart_delay)
+        self.delays[slot] = delay
+        return delay
+
+    def shutdown(self):
+        for worker in self.workers.values():
+            if worker.is_alive():
+                worker.terminate()
+
+        deadline = time.time() + self.shutdown_timeout
+        for slot, worker in self.workers.items():
+            worker.join(max(deadline - time.time(), 0))
+            if worker.is_alive():
+                print("Worker {} (pid {}) did not stop, killing".format(
+                    slot, worker.pid
+                ))
+                worker.kill()
+                worker.join()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        for slot in range(self.processes):
+            self._start(slot)
+
+        try:
+            while not self.stopping:
+                time.sleep(self.poll_interval)
+                if not self.stopping:
+                    self.check_workers()
+        finally:
+            print("Stopping {} workers".format(len(self.workers)))
+            self.shutdown()
@@ -0,0 +1,114 @@
+from itertools import repeat
+
+import numpy as np
+
+from .battle_engine import simulate
+
+ELO_START = 1500.0
+ELO_K = 32.0
+
+
+def fight(stats, first, second, rounds, seed=None):
+    # +1 where row first[i] of stats wins, -1 where second[i] does and 0
+    # for a draw, module level so it can be handed to a process pool.
+    # seed is anything np.random.default_rng takes, a Generator included.
+    hp_1, hp_2, _ = simulate(
+        stats[first], stats[second], rounds, np.random.default_rng(seed)
+    )
+    return np.sign(hp_1 - hp_2)
+
+
+def _count(rows, size):
+    return np.bincount(rows, minlength=size)
+
+
+class Standings(object):
+    # Wins, losses and draws per entrant and an Elo rating. Each add() is
+    # one round in which nobody fights twice, so rating its battles all at
+    # once gives the same ratings as going through them one by one.
+
+    def __init__(self, size):
+        self.size = size
+        self.wins = np.zeros(size, dtype=np.int64)
+        self.losses = np.zeros(size, dtype=np.int64)
+        self.draws = np.zeros(size, dtype=np.int64)
+        self.rating = np.full(size, ELO_START)
+        self.played = 0
+
+    def add(self, first, second, results):
+        expected = 1 / (
+            1 + 10 ** ((self.rating[second] - self.rating[first]) / 400)
+        )
+        change = ELO_K * ((results + 1) / 2 - expected)
+        self.rating += np.bincount(first, change, self.size)
+        self.rating -= np.bincount(second, change, self.size)
+
+        won, lost, drawn = results > 0, results < 0, results == 0
+        self.wins += _count(first[won], self.size)
+        self.wins += _count(second[lost], self.size)
+        self.losses += _count(first[lost], self.size)
+        self.losses += _count(second[won], self.size)
+        self.draws += _count(first[drawn], self.size)
+        self.draws += _count(second[drawn], self.size)
+        self.played += len(results)
+
+    def ranking(self):
+        # rows best first, by rating and then wins
+        return np.lexsort((-self.wins, -self.rating))
+
+
+def schedule(size):
+    # Round robin by the circle method, (first, second) for each of the
+    # rounds in which every entrant fights once. One entrant is fixed and
+    # the rest rotate past it, with an odd size the fixed one is a bye.
+    n = size + size % 2
+    rotation = (np.arange(n - 1)[:, None] + np.arange(n - 1)) % (n - 1)
+    seats = np.hstack([np.full((n - 1, 1), n - 1), rotation])
+    first, second = seats[:, :n // 2], seats[:, :n // 2 - 1:-1]
+    if n == size:
+        return list(zip(first, second))
+    return [(f[1:], s[1:]) for f, s in zip(first, second)]
+
+
+def round_robin(stats, rounds, chunk_size, map_chunks=map, seed=None):
+    # Every entrant fights every other once, yields the standings after
+    # each chunk of whole rounds as map_chunks returns it. Each chunk has
+    # its own stream spawned from seed, wherever it ends up being fought.
+    played = schedule(len(stats))
+    per_chunk = max(1, chunk_size // max(len(stats) // 2, 1))
+    chunks = [played[i:i + per_chunk]
+              for i in range(0, len(played), per_chunk)]
+    results = map_chunks(
+        fight, repeat(stats),
+        [np.concatenate([first for first, _ in chunk]) for chunk in chunks],
+        [np.concatenate([second for _, second in chunk]) for chunk in chunks],
+        repeat(rounds), np.random.SeedSequence(seed).spawn(len(chunks))
+    )
+
+    standings = Standings(len(stats))
+    for chunk, result in zip(chunks, results):
+        start = 0
+        for first, second in chunk:
+            standings.add(first, second, result[start:start + len(first)])
+            start += len(first)
+        yield standings
+
+
+def bracket(stats, rounds, seed=None):
+    # Single elimination in seed order, the odd one out of a round gets a
+    # bye and a draw is settled by a coin toss. Yields (standings, first,
+    # second, winners) after every round.
+    rng = np.random.default_rng(seed)
+    alive = np.arange(len(stats))
+    standings = Standings(len(stats))
+    while len(alive) > 1:
+        paired = len(alive) - len(alive) % 2
+        first, second = alive[0:paired:2], alive[1:paired:2]
+        results = fight(stats, first, second, rounds, rng)
+        standings.add(first, second, results)
+
+        tosses = rng.random(len(results)) > 0.5
+        first_wins = (results > 0) | ((results == 0) & tosses)
+        winners = np.where(first_wins, first, second)
+        alive = np.concatenate([winners, alive[paired:]])
+        yield standings, first, second, winners
@@ -0,0 +1,76 @@
+# The api and the backend each keep a copy of this module:
+# api/wire.py and backend/backend/wire.py must stay
+# the same file, api/test/unit/test_shared_modules.py checks they do
+
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+# short names for configuration
+FORMATS = {'json': JSON, 'msgpack': MSGPACK}
+
+
+def _document(value):
+    # records (pokemon) are only turned into documents as they are encoded
+    to_dict = getattr(value, 'to_dict', None)
+    if to_dict is None:
+        raise TypeError("Cannot encode {!r}".format(type(value)))
+    return to_dict()
+
+
+def _json_loads(body):
+    return json.loads(body.decode('utf-8'))
+
+
+# content_type -> (encode, decode), bodies are always bytes
+CODECS = {
+    JSON: (
+        lambda body: json.dumps(body, default=_document).encode('utf-8'),
+        _json_loads
+    )
+}
+if msgpack is not None:
+    CODECS[MSGPACK] = (
+        lambda body: msgpack.packb(
+            body, use_bin_type=True, default=_document
+        ),
+        # battle results are keyed by round number
+        lambda body: msgpack.unpackb(body, raw=False, strict_map_key=False)
+    )
+
+
+def response_type(content_type):
+    # replies use the codec the request came in, JSON when it named none
+    # or one this side does not have
+    return content_type if content_type in CODECS else JSON
+
+
+def encode(body, content_type=JSON):
+    return CODECS[response_type(content_type)][0](body)
+
+
+def decode(body, content_type=JSON):
+    return CODECS[response_type(content_type)][1](body)
+
+
+def encode_request(q_type, args, options=None, content_type=JSON):
+    return encode(
+        {'type': q_type, 'args': list(args), 'options': options or {}},
+        content_type
+    )
+
+
+def decode_request(body, content_type=None):
+    # ([q_type, *args], options), requests without a known content_type
+    # are the original colon separated text
+    if content_type not in CODECS:
+        return body.decode('utf-8').split(":"), {}
+
+    request = decode(body, content_type)
+    args = [request['type']] + list(request.get('args') or [])
+    return args, request.get('options') or {}
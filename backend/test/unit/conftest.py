@@ -1,3 +1,4 @@
+import fakeredis
 import pytest
 import mock
 
@@ -21,6 +22,14 @@ def mock_redis():
         yield patched_redis
 
 
+@pytest.fixture
+def fake_redis():
+    # a redis that runs the commands, for the tests a MagicMock can't check
+    server = fakeredis.FakeRedis()
+    with mock.patch("redis.Redis.from_url", return_value=server):
+        yield server
+
+
 @pytest.fixture
 def mock_pokedex():
     yield mock.MagicMock()
@@ -2,6 +2,7 @@
 import pika
 import pytest
 from mock import patch, MagicMock
+from backend import wire
 from backend.base_server import BaseServer
 
 
@@ -24,7 +25,9 @@ def mock_basic_properties():
 
 @pytest.fixture
 def base_server(fake_queue_name):
-    yield BaseServer(fake_queue_name)
+    server = BaseServer(fake_queue_name)
+    server.requests = {'AA': (1, frozenset(['x'])), 'BB': (None, frozenset())}
+    yield server
 
 
 def test_setup(base_server, fake_queue_name):
@@ -40,7 +43,12 @@ def test_setup(base_server, fake_queue_name):
 
 @pytest.mark.parametrize(
     'body, succeed', [
-        (b'AA:b', True)
+        (b'AA:b', True),
+        (b'BB', True),
+        (b'BB:b:c', True),
+        (b'AA', False),
+        (b'AA:b:c', False),
+        (b'CC:b', False)
     ]
 )
 def test_handle_request(
@@ -55,13 +63,14 @@ def test_handle_request(
     base_server.handle_request(ch, method, props, body)
 
     if not succeed:
-        expected_body = '{"code": 403, "data": "Bad input"}'
+        expected_body = b'{"code": 403, "data": "Bad input"}'
+        assert not mock_request_received.called
     else:
-        expected_body = '{"code": 200, "data": "OK"}'
+        expected_body = b'{"code": 200, "data": "OK"}'
 
     mock_basic_properties.assert_called_with(
         correlation_id=props.correlation_id,
-        content_encoding='application/json'
+        content_type='application/json'
     )
     ch.basic_publish.assert_called_with(
         exchange='', routing_key=props.reply_to,
@@ -71,3 +80,171 @@ def test_handle_request(
     ch.basic_ack.assert_called_with(
         delivery_tag=method.delivery_tag
     )
+
+
+def test_setup_workers(base_server, fake_queue_name):
+    channel = MagicMock()
+    base_server.setup(channel, prefetch_count=8, workers=4)
+    channel.basic_qos.assert_called_with(prefetch_count=8)
+    assert base_server.executor._max_workers == 4
+    base_server.shutdown()
+
+
+def test_handle_request_workers(
+    base_server, mock_request_received, mock_basic_properties
+):
+    base_server.setup(MagicMock(), workers=2)
+
+    ch = MagicMock()
+    method = MagicMock()
+    props = MagicMock()
+
+    base_server.handle_request(ch, method, props, b'AA:b')
+    base_server.shutdown()
+
+    mock_request_received.assert_called_with('AA', 'b')
+    # nothing touches the channel off the connection thread
+    assert not ch.basic_publish.called
+    assert not ch.basic_ack.called
+
+    publish = ch.connection.add_callback_threadsafe.call_args[0][0]
+    publish()
+    ch.basic_publish.assert_called_with(
+        exchange='', routing_key=props.reply_to,
+        properties=mock_basic_properties.return_value,
+        body=b'{"code": 200, "data": "OK"}'
+    )
+    ch.basic_ack.assert_called_with(delivery_tag=method.delivery_tag)
+
+
+def test_handle_request_error(
+    base_server, mock_request_received, mock_basic_properties
+):
+    mock_request_received.side_effect = KeyError('boom')
+    ch = MagicMock()
+    method = MagicMock()
+    props = MagicMock()
+
+    base_server.handle_request(ch, method, props, b'AA:b')
+
+    ch.basic_publish.assert_called_with(
+        exchange='', routing_key=props.reply_to,
+        properties=mock_basic_properties.return_value,
+        body=b'{"code": 500, "data": "Server error"}'
+    )
+    ch.basic_ack.assert_called_with(delivery_tag=method.delivery_tag)
+
+
+def test_handle_request_envelope(
+    base_server, mock_request_received, mock_basic_properties
+):
+    ch = MagicMock()
+    method = MagicMock()
+    props = MagicMock()
+    props.content_type = wire.MSGPACK
+
+    base_server.handle_request(ch, method, props, wire.encode_request(
+        'AA', ['Flab\u00e9b\u00e9'], {'x': 1}, wire.MSGPACK
+    ))
+
+    mock_request_received.assert_called_with('AA', 'Flab\u00e9b\u00e9', x=1)
+    mock_basic_properties.assert_called_with(
+        correlation_id=props.correlation_id,
+        content_type=wire.MSGPACK
+    )
+    body = ch.basic_publish.call_args[1]['body']
+    assert wire.decode(body, wire.MSGPACK) == {'code': 200, 'data': 'OK'}
+
+
+def test_handle_request_stream(base_server, mock_basic_properties):
+    base_server._respond = MagicMock(return_value=[b'1', b'2'])
+    ch = MagicMock()
+    method = MagicMock()
+    props = MagicMock()
+
+    base_server.handle_request(ch, method, props, b'AA:b')
+
+    assert [c[1]['body'] for c in ch.basic_publish.call_args_list] == [
+        b'1', b'2'
+    ]
+    ch.basic_ack.assert_called_once_with(delivery_tag=method.delivery_tag)
+
+
+def test_handle_request_generator(base_server, mock_basic_properties):
+    base_server._respond = MagicMock(return_value=(b for b in [b'1', b'2']))
+    ch = MagicMock()
+    method = MagicMock()
+    props = MagicMock()
+
+    base_server.handle_request(ch, method, props, b'AA:b')
+
+    assert [c[1]['body'] for c in ch.basic_publish.call_args_list] == [
+        b'1', b'2'
+    ]
+    ch.basic_ack.assert_called_once_with(delivery_tag=method.delivery_tag)
+
+
+def test_handle_request_generator_workers(
+    base_server, mock_basic_properties
+):
+    base_server._respond = MagicMock(return_value=(b for b in [b'1', b'2']))
+    base_server.setup(MagicMock(), workers=1)
+    ch = MagicMock()
+    method = MagicMock()
+
+    base_server.handle_request(ch, method, MagicMock(), b'AA:b')
+    base_server.shutdown()
+
+    # one callback per body as it is produced, the last one acks
+    callbacks = ch.connection.add_callback_threadsafe.call_args_list
+    assert len(callbacks) == 2
+    callbacks[0][0][0]()
+    assert ch.basic_publish.call_args[1]['body'] == b'1'
+    assert not ch.basic_ack.called
+    callbacks[1][0][0]()
+    assert ch.basic_publish.call_args[1]['body'] == b'2'
+    ch.basic_ack.assert_called_once_with(delivery_tag=method.delivery_tag)
+
+
+def test_handle_request_generator_error(base_server, mock_basic_properties):
+    def bodies():
+        yield b'1'
+        raise KeyError('boom')
+
+    base_server._respond = MagicMock(return_value=bodies())
+    ch = MagicMock()
+    method = MagicMock()
+
+    base_server.handle_request(ch, method, MagicMock(), b'AA:b')
+
+    assert [c[1]['body'] for c in ch.basic_publish.call_args_list] == [
+        b'1', b'{"code": 500, "data": "Server error"}'
+    ]
+    ch.basic_ack.assert_called_once_with(delivery_tag=method.delivery_tag)
+
+
+@pytest.mark.parametrize(
+    'args, options', [
+        (['b'], {'bogus': 1}),
+        (['b'], {'x': 1, 'bogus': 1}),
+        (['b'], ['x']),
+        ([], {}),
+        (['b', 'c'], {'x': 1})
+    ]
+)
+def test_handle_request_envelope_bad_input(
+    base_server, mock_request_received, mock_basic_properties, args, options
+):
+    ch = MagicMock()
+    method = MagicMock()
+    props = MagicMock()
+    props.content_type = wire.JSON
+
+    base_server.handle_request(ch, method, props, wire.encode(
+        {'type': 'AA', 'args': args, 'options': options}
+    ))
+
+    assert not mock_request_received.called
+    body = ch.basic_publish.call_args[1]['body']
+    assert wire.decode(body) == {'code': 403, 'data': 'Bad input'}
+    ch.basic_ack.assert_called_with(delivery_tag=method.delivery_tag)
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+from mock import MagicMock
+from backend.battle_engine import outcome, simulate, stat_rows
+from backend.record import PokemonRecord
+
+
+def _stats(*rows):
+    # (hp, attack, defence, speed) per pokemon
+    return np.array(rows, dtype=np.int64)
+
+
+def test_stat_rows():
+    pokemon = [PokemonRecord.from_dict(p) for p in [
+        {'stats': {'hp': 1, 'attack': 2, 'defence': 3, 'speed': 4}},
+        {'stats': {'hp': 5, 'attack': 6, 'defence': 7, 'speed': 8,
+                   'total': 9}}
+    ]]
+    assert stat_rows(pokemon).tolist() == [[1, 2, 3, 4], [5, 6, 7, 8]]
+    assert stat_rows([]).shape == (0, 4)
+
+
+@pytest.mark.parametrize(
+    "poke_1, poke_2, rounds, expected", [
+        # the README example, A is faster and hits first every round
+        ((300, 50, 20, 10), (200, 30, 10, 5), 1, (290, 160, 1)),
+        ((300, 50, 20, 10), (200, 30, 10, 5), 8, (260, 0, 5)),
+        ((200, 30, 10, 5), (300, 50, 20, 10), 8, (0, 260, 5)),
+        # the slower side never gets its hit in the round it is knocked out
+        ((10, 50, 0, 1), (40, 50, 0, 2), 8, (0, 40, 1)),
+        # attack below defence heals
+        ((100, 10, 50, 1), (100, 10, 50, 2), 2, (180, 180, 2))
+    ]
+)
+def test_simulate(poke_1, poke_2, rounds, expected):
+    rng = MagicMock()
+    hp_1, hp_2, fought = simulate(
+        _stats(poke_1), _stats(poke_2), rounds, rng
+    )
+    assert (hp_1[0], hp_2[0], fought[0]) == expected
+    assert not rng.random.called
+
+
+def test_simulate_many():
+    poke_1 = _stats((300, 50, 20, 10), (10, 50, 0, 1))
+    poke_2 = _stats((200, 30, 10, 5), (40, 50, 0, 2))
+    hp_1, hp_2, fought = simulate(poke_1, poke_2, 8, MagicMock())
+
+    assert hp_1.tolist() == [260, 0]
+    assert hp_2.tolist() == [0, 40]
+    assert fought.tolist() == [5, 1]
+
+
+@pytest.mark.parametrize(
+    "toss, expected", [
+        (0.9, (50, 0)),
+        (0.1, (0, 50))
+    ]
+)
+def test_simulate_equal_speed(toss, expected):
+    rng = MagicMock()
+    rng.random.side_effect = lambda n: np.full(n, toss)
+
+    hp_1, hp_2, _ = simulate(
+        _stats((50, 100, 0, 5)), _stats((50, 100, 0, 5)), 8, rng
+    )
+    assert (hp_1[0], hp_2[0]) == expected
+
+
+@pytest.mark.parametrize(
+    "poke_1, poke_2, rounds, expected", [
+        ((300, 50, 20, 10), (200, 30, 10, 5), 1, (290, 160, 1)),
+        ((300, 50, 20, 10), (200, 30, 10, 5), 8, (260, 0, 5)),
+        ((200, 30, 10, 5), (300, 50, 20, 10), 8, (0, 260, 5)),
+        ((10, 50, 0, 1), (40, 50, 0, 2), 8, (0, 40, 1)),
+        # knocked out by the faster side's last hit of the round
+        ((40, 50, 0, 2), (100, 10, 0, 1), 8, (30, 0, 2)),
+        ((100, 10, 50, 1), (100, 10, 50, 2), 2, (180, 180, 2)),
+        # left to the coin tosses
+        ((50, 100, 0, 5), (50, 100, 0, 5), 8, (0, 50, 0))
+    ]
+)
+def test_outcome(poke_1, poke_2, rounds, expected):
+    hp_1, hp_2, fought = outcome(_stats(poke_1), _stats(poke_2), rounds)
+    assert (hp_1[0], hp_2[0], fought[0]) == expected
+
+
+def test_outcome_matches_simulate():
+    rng = np.random.default_rng(0)
+    poke_1 = rng.integers(1, 40, (5000, 4))
+    poke_2 = rng.integers(1, 40, (5000, 4))
+    decided = poke_1[:, 3] != poke_2[:, 3]
+
+    for expected, found in zip(simulate(poke_1, poke_2, 8, rng),
+                               outcome(poke_1, poke_2, 8)):
+        assert expected[decided].tolist() == found[decided].tolist()
+
+
+def test_outcome_broadcasts():
+    stats = _stats((300, 50, 20, 10), (200, 30, 10, 5))
+    hp_1, hp_2, fought = outcome(stats[:, None], stats[None], 8)
+
+    assert (hp_1[0, 1], hp_2[0, 1]) == (260, 0)
+    assert (hp_1[1, 0], hp_2[1, 0]) == (0, 260)
+    assert fought.tolist() == [[0, 5], [5, 0]]
@@ -1,5 +1,12 @@
 import pytest
-from backend.battle_server import BattleServer
+from mock import MagicMock
+from backend import wire
+from backend.battle_server import (
+    BATCH_FIELDS, BATTLE_FIELDS, TOURNAMENT_FIELDS, BattleServer
+)
+from backend.cache import LRUCache
+from backend.matchups import MatchupTable
+from backend.record import PokemonRecord
 
 
 @pytest.fixture
@@ -48,10 +55,10 @@ def dummy_pokemon_setup(mock_pokedex):
         }
     }
 
-    def mock_get_by_id(pid):
+    def mock_get_by_id(pid, fields=None):
         if pid not in pokemon:
             return None
-        return pokemon[pid]
+        return PokemonRecord.from_dict(pokemon[pid])
 
     mock_pokedex.get_pokemon_by_id = mock_get_by_id
     yield pokemon
@@ -282,3 +289,392 @@ def test_request_received_equal_speed(
         dummy_pokemon_setup['1']['stats']['health'] = 400
 
     assert False
+
+
+def test_request_received_reads_battle_fields(battle_server, mock_pokedex):
+    mock_pokedex.get_pokemon_by_id.return_value = None
+
+    battle_server._request_received('BATTLE', '1', '2')
+
+    mock_pokedex.get_pokemon_by_id.assert_any_call('1', fields=BATTLE_FIELDS)
+    mock_pokedex.get_pokemon_by_id.assert_any_call('2', fields=BATTLE_FIELDS)
+
+
+def test_request_received_leaves_pokemon_unchanged(battle_server,
+                                                   mock_pokedex):
+    # the records may be the pokedex's cached ones
+    pokemon = {'1': _battle_stats('1', 300, 50, 20, 10, 'POKE_A'),
+               '2': _battle_stats('2', 200, 30, 10, 5, 'POKE_B')}
+    mock_pokedex.get_pokemon_by_id = lambda pid, fields=None: pokemon[pid]
+
+    code, result = battle_server._request_received('BATTLE', '1', '2')
+
+    assert code == 200
+    assert result[1][0]['hp'] == 160
+    assert (pokemon['1'].hp, pokemon['2'].hp) == (300, 200)
+
+
+def _battle_stats(p_id, hp, attack, defence, speed, name=None):
+    return PokemonRecord(
+        p_id, name, stats=(None, hp, attack, defence, None, None, speed)
+    )
+
+
+def test_request_received_battles(battle_server, mock_pokedex):
+    mock_pokedex.get_pokemon_by_ids.return_value = [
+        _battle_stats('1', 300, 50, 20, 10),
+        _battle_stats('2', 200, 30, 10, 5),
+        _battle_stats('3', 200, 20, 30, 1)
+    ]
+
+    code, result = battle_server._request_received(
+        'BATTLES', '1,2', ' 2 , 1', ['3', 3]
+    )
+
+    mock_pokedex.get_pokemon_by_ids.assert_called_once_with(
+        ['1', '2', '3'], fields=BATCH_FIELDS
+    )
+    assert code == 200
+    assert result == {
+        'winner': ['1', '1', None],
+        'hp_1': [260, 0, 280],
+        'hp_2': [0, 260, 280],
+        'rounds': [5, 5, 8]
+    }
+
+
+@pytest.mark.parametrize(
+    "pairs", [
+        [],
+        ['1'],
+        ['1,2,3'],
+        ['1,'],
+        [1]
+    ]
+)
+def test_request_received_battles_bad_input(
+    battle_server, mock_pokedex, pairs
+):
+    assert battle_server._request_received('BATTLES', *pairs) == (
+        403, "Bad input"
+    )
+    assert not mock_pokedex.get_pokemon_by_ids.called
+
+
+def test_request_received_battles_too_many(battle_server, mock_pokedex):
+    battle_server.max_battles = 1
+    assert battle_server._request_received('BATTLES', '1,2', '1,2')[0] == 403
+
+
+def test_request_received_battles_not_found(battle_server, mock_pokedex):
+    mock_pokedex.get_pokemon_by_ids.return_value = [
+        _battle_stats('1', 300, 50, 20, 10)
+    ]
+    assert battle_server._request_received('BATTLES', '1,2') == (
+        404, "Could not find pokemon"
+    )
+
+
+@pytest.mark.parametrize(
+    'ident, expected', [
+        (('AA', '1', '2'), {'combatants': ['POKE_A', 'POKE_B'],
+                            'winner': 0, 'hp': [160, 45], 'rounds': 8}),
+        (('AA', '3', '2'), {'combatants': ['POKE_C', 'POKE_B'],
+                            'winner': 1, 'hp': [0, 250], 'rounds': 4})
+    ]
+)
+def test_request_received_outcome(
+    battle_server, mock_pokedex, dummy_pokemon_setup,
+    ident, expected
+):
+    assert battle_server._request_received(*ident, log=False) == (
+        200, expected
+    )
+
+
+def test_request_received_outcome_not_found(
+    battle_server, mock_pokedex, dummy_pokemon_setup
+):
+    assert battle_server._request_received('AA', '1', '5', log=False) == (
+        404, "Could not find pokemon"
+    )
+
+
+@pytest.fixture
+def matchup_server(tmpdir, fake_queue_name, mock_pokedex,
+                   dummy_pokemon_setup):
+    mock_pokedex.data_version.return_value = 1
+    mock_pokedex.get_pokemon_by_stat.return_value = [
+        PokemonRecord.from_dict(dict(pokemon, id=p_id))
+        for p_id, pokemon in dummy_pokemon_setup.items()
+    ]
+    matchups = MatchupTable(str(tmpdir.join("matchups")), BattleServer.rounds)
+    yield BattleServer(fake_queue_name, mock_pokedex, matchups)
+
+
+def test_request_received_outcome_from_table(matchup_server, mock_pokedex):
+    mock_pokedex.get_pokemon_by_id = MagicMock()
+
+    code, result = matchup_server._request_received(
+        'AA', '2', '3', log=False
+    )
+
+    assert code == 200
+    assert result == {'combatants': ['POKE_B', 'POKE_C'],
+                      'winner': 0, 'hp': [250, 0], 'rounds': 4}
+    assert not mock_pokedex.get_pokemon_by_id.called
+
+
+def test_request_received_outcome_equal_speed(matchup_server, mock_pokedex):
+    # not in the table, fought out instead
+    code, result = matchup_server._request_received(
+        'AA', '2', '4', log=False
+    )
+
+    assert code == 200
+    assert result['combatants'] == ['POKE_B', 'POKE_D']
+    assert result['rounds'] == 8
+
+
+def test_request_received_log_from_table(matchup_server, mock_pokedex):
+    mock_pokedex.get_pokemon_by_id = MagicMock()
+
+    code, result = matchup_server._request_received('AA', '1', '3')
+
+    assert code == 200
+    assert result['combatants'] == ['POKE_A', 'POKE_C']
+    assert result[3][1] == {'attacker': 0, 'defender': 1,
+                            'damage': 35, 'hp': 0}
+    assert not mock_pokedex.get_pokemon_by_id.called
+
+
+@pytest.fixture
+def entrants(mock_pokedex):
+    pokemon = [
+        _battle_stats('1', 300, 50, 20, 10, 'POKE_A'),
+        _battle_stats('2', 200, 30, 10, 5, 'POKE_B'),
+        _battle_stats('3', 100, 20, 10, 1, 'POKE_C')
+    ]
+    mock_pokedex.get_pokemon_by_type.return_value = pokemon
+    yield pokemon
+
+
+def _tournament(battle_server, *args, **options):
+    return wire.decode(battle_server._respond(
+        wire.JSON, ['TOURNAMENT'] + list(args), options
+    ))
+
+
+def test_tournament(battle_server, mock_pokedex, entrants):
+    result = _tournament(battle_server, 'type', 'fire')
+
+    mock_pokedex.get_pokemon_by_type.assert_called_once_with(
+        ['fire'], fields=tuple(sorted(TOURNAMENT_FIELDS))
+    )
+    assert result['code'] == 200
+    assert result['data']['played'] == result['data']['battles'] == 3
+    assert [(p['id'], p['wins'], p['losses'], p['draws'])
+            for p in result['data']['standings']] == [
+        ('1', 2, 0, 0), ('2', 1, 1, 0), ('3', 0, 2, 0)
+    ]
+    assert result['data']['standings'][0]['name'] == 'POKE_A'
+    assert result['data']['standings'][0]['rating'] > 1500
+
+
+def test_tournament_stream(battle_server, mock_pokedex, entrants):
+    battle_server.tournament_chunk_size = 1
+
+    messages = [
+        wire.decode(body) for body in battle_server._respond(
+            wire.JSON, ['TOURNAMENT', 'TYPE', 'fire'], {'stream': True}
+        )
+    ]
+
+    # one message per round of the schedule
+    assert [(m['data'][0]['played'], m['more']) for m in messages] == [
+        (1, True), (2, True), (3, False)
+    ]
+
+
+def test_tournament_bracket(battle_server, mock_pokedex, entrants):
+    messages = [
+        wire.decode(body) for body in battle_server._respond(
+            wire.JSON, ['TOURNAMENT', 'TYPE', 'fire'],
+            {'format': 'bracket', 'stream': True}
+        )
+    ]
+
+    assert [(m['data'][0]['matches'], m['more']) for m in messages] == [
+        ([['1', '2', '1']], True),
+        ([['1', '3', '1']], False)
+    ]
+    assert messages[-1]['data'][0]['champion'] == '1'
+
+
+@pytest.mark.parametrize(
+    "args, options", [
+        (['TYPE'], {}),
+        (['ID', '1'], {}),
+        (['TYPE', 'fire'], {'format': 'swiss'})
+    ]
+)
+def test_tournament_bad_input(battle_server, mock_pokedex, entrants,
+                              args, options):
+    assert _tournament(battle_server, *args, **options) == {
+        'code': 403, 'data': "Bad input"
+    }
+
+
+def test_tournament_not_found(battle_server, mock_pokedex):
+    mock_pokedex.get_pokemon_by_type.return_value = []
+    assert _tournament(battle_server, 'TYPE', 'nope')['code'] == 404
+
+
+@pytest.mark.parametrize(
+    "max_entrants, entries, message", [
+        (10, 1, "Not enough pokemon"),
+        (2, 3, "Too many pokemon")
+    ]
+)
+def test_tournament_entrants(battle_server, mock_pokedex, entrants,
+                             max_entrants, entries, message):
+    battle_server.max_entrants = max_entrants
+    del entrants[entries:]
+
+    assert _tournament(battle_server, 'TYPE', 'fire') == {
+        'code': 403, 'data': message
+    }
+
+
+@pytest.mark.parametrize(
+    "args, options, valid", [
+        (['BATTLE', '1', '2'], {'log': False, 'seed': 1}, True),
+        (['BATTLES', '1,2', '3,4'], {'seed': 1}, True),
+        (['TOURNAMENT', 'TYPE', 'fire'],
+         {'format': 'bracket', 'stream': True, 'seed': 1}, True),
+        (['BATTLE', '1'], {}, False),
+        (['BATTLE', '1', '2', '3'], {}, False),
+        (['BATTLE', '1', '2'], {'bogus': 1}, False),
+        (['BATTLES', '1,2'], {'log': False}, False),
+        (['TOURNAMENT', 'TYPE', 'fire'], {'fields': 'id'}, False),
+        (['TOURNAMENT', 'fire'], {}, False),
+        (['TYPE', 'fire'], {}, False)
+    ]
+)
+def test_valid_request(battle_server, args, options, valid):
+    assert battle_server._valid_request(args, options) is valid
+
+
+def test_setup_tournament_pool(fake_queue_name, mock_pokedex, entrants):
+    battle_server = BattleServer(fake_queue_name, mock_pokedex, processes=2)
+    battle_server.setup(MagicMock(), workers=1)
+    try:
+        assert battle_server.pool._mp_context.get_start_method() == \
+            'forkserver'
+        # the pool's processes are started from a worker thread
+        result = battle_server.executor.submit(
+            _tournament, battle_server, 'type', 'fire', seed=1
+        ).result(60)
+    finally:
+        battle_server.shutdown()
+
+    assert result == _tournament(
+        BattleServer(fake_queue_name, mock_pokedex), 'type', 'fire', seed=1
+    )
+
+
+def _tie_battle(battle_server, **options):
+    # '1' and '4' have the same speed, every round is a coin toss
+    return battle_server._request_received('BATTLE', '1', '4', **options)
+
+
+def test_request_received_seed(
+    battle_server, mock_pokedex, dummy_pokemon_setup
+):
+    dummy_pokemon_setup['4'] = dict(dummy_pokemon_setup['1'], name='POKE_E')
+    mock_pokedex.get_pokemon_by_id = lambda pid, fields=None: \
+        PokemonRecord.from_dict(dummy_pokemon_setup[pid])
+
+    results = [_tie_battle(battle_server, seed=seed) for seed in range(10)]
+
+    assert results == [
+        _tie_battle(battle_server, seed=str(seed)) for seed in range(10)
+    ]
+    # both sides got to go first
+    assert len({result[1][1][0]['attacker'] for result in results}) == 2
+
+
+@pytest.mark.parametrize("seed", ['x', '-1', [1]])
+def test_request_received_bad_seed(
+    battle_server, mock_pokedex, dummy_pokemon_setup, seed
+):
+    assert _tie_battle(battle_server, seed=seed) == (403, "Bad input")
+    assert battle_server._request_received('BATTLES', '1,2', seed=seed) == (
+        403, "Bad input"
+    )
+
+
+def test_rng_per_thread(battle_server):
+    assert battle_server._rng() is battle_server._rng()
+    assert battle_server._rng(1) is not battle_server._rng(1)
+
+
+def test_request_received_battles_seed(battle_server, mock_pokedex):
+    mock_pokedex.get_pokemon_by_ids.return_value = [
+        _battle_stats('1', 200, 60, 20, 5), _battle_stats('2', 200, 60, 20, 5)
+    ]
+    pairs = ['1,2'] * 20
+
+    result = battle_server._request_received('BATTLES', *pairs, seed=5)
+
+    assert result == battle_server._request_received(
+        'BATTLES', *pairs, seed=5
+    )
+    assert set(result[1]['winner']) == {'1', '2'}
+
+
+def test_respond_caches_seeded_battles(fake_queue_name, mock_pokedex,
+                                       dummy_pokemon_setup):
+    battle_server = BattleServer(
+        fake_queue_name, mock_pokedex, response_cache=LRUCache(10)
+    )
+    mock_pokedex.data_version.return_value = 1
+    get_by_id = mock_pokedex.get_pokemon_by_id = MagicMock(
+        side_effect=lambda pid, fields=None: PokemonRecord.from_dict(
+            dummy_pokemon_setup[pid]
+        )
+    )
+
+    def respond(**options):
+        return battle_server._respond(
+            wire.JSON, ['BATTLE', '1', '2'], options
+        )
+
+    body = respond(seed='3')
+    assert respond(seed=3) == body
+    assert get_by_id.call_count == 2
+
+    # not cached without a seed, and separately for the outcome only
+    assert respond() == body
+    assert get_by_id.call_count == 4
+    respond(seed=3, log=False)
+    assert get_by_id.call_count == 6
+    assert len(battle_server.response_cache) == 2
+
+
+def test_tournament_seed(battle_server, mock_pokedex, entrants):
+    entrants[:] = [_battle_stats(entrant.id, 300, 50, 20, 10, entrant.name)
+                   for entrant in entrants]
+
+    standings = [
+        _tournament(battle_server, 'TYPE', 'fire', seed=seed)['data']
+        for seed in range(5)
+    ]
+
+    assert standings == [
+        _tournament(battle_server, 'TYPE', 'fire', seed=seed)['data']
+        for seed in range(5)
+    ]
+    assert _tournament(battle_server, 'TYPE', 'fire', seed='x') == {
+        'code': 403, 'data': "Bad input"
+    }
@@ -0,0 +1,88 @@
+import pytest
+from mock import patch
+from backend.cache import LRUCache
+
+
+@pytest.fixture
+def mock_time():
+    with patch("time.time") as patched:
+        patched.return_value = 100
+        yield patched
+
+
+def test_get_set():
+    cache = LRUCache(2)
+    assert cache.get('a') is None
+    assert cache.get('a', 1) == 1
+
+    cache.set('a', [])
+    assert cache.get('a') == []
+    assert 'a' in cache
+    assert 'b' not in cache
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert len(cache) == 2
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+
+
+@pytest.mark.parametrize(
+    "ttl, elapsed, expired", [
+        (None, 1000, False),
+        (10, 5, False),
+        (10, 10, False),
+        (10, 11, True)
+    ]
+)
+def test_ttl(mock_time, ttl, elapsed, expired):
+    cache = LRUCache(2, ttl)
+    cache.set('a', 1)
+    mock_time.return_value += elapsed
+
+    assert (cache.get('a') is None) == expired
+    assert len(cache) == (0 if expired else 1)
+
+
+def test_clear():
+    cache = LRUCache(2)
+    cache.set('a', 1)
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_max_bytes():
+    cache = LRUCache(10, max_bytes=10)
+    cache.set('a', 'x' * 4)
+    cache.set('b', 'x' * 4)
+    cache.get('a')
+    cache.set('c', 'x' * 4)
+
+    assert cache.size_bytes == 8
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert 'c' in cache
+
+    cache.set('a', 'x' * 6)
+    assert cache.size_bytes == 10
+    assert 'c' in cache
+
+
+def test_max_bytes_too_large():
+    cache = LRUCache(10, max_bytes=10)
+    cache.set('a', 'x' * 4)
+    cache.set('b', 'x' * 11)
+
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert cache.size_bytes == 4
+
+    cache.clear()
+    assert cache.size_bytes == 0
@@ -0,0 +1,108 @@
+import os
+
+import pytest
+from backend.matchups import MATCHUP_FIELDS, MatchupTable
+from backend.record import PokemonRecord
+
+
+def _pokemon(p_id, name, hp, attack, defence, speed):
+    return PokemonRecord(
+        p_id, name, stats=(None, hp, attack, defence, None, None, speed)
+    )
+
+
+@pytest.fixture
+def roster(mock_pokedex):
+    pokemon = [
+        _pokemon('2', 'POKE_B', 200, 30, 10, 5),
+        _pokemon('1', 'POKE_A', 300, 50, 20, 10),
+        _pokemon('3', 'POKE_C', 200, 30, 10, 5)
+    ]
+    mock_pokedex.data_version.return_value = 1
+    mock_pokedex.get_pokemon_by_stat.return_value = pokemon
+    yield pokemon
+
+
+@pytest.fixture
+def matchups(tmpdir, mock_pokedex, roster):
+    table = MatchupTable(str(tmpdir.join("matchups")), 8)
+    assert table.load(mock_pokedex) == 3
+    yield table
+
+
+def test_load(matchups, mock_pokedex, tmpdir):
+    mock_pokedex.get_pokemon_by_stat.assert_called_once_with(
+        'hp', fields=MATCHUP_FIELDS
+    )
+    assert matchups.rows == {'1': 0, '2': 1, '3': 2}
+    assert matchups.names == ['POKE_A', 'POKE_B', 'POKE_C']
+    assert matchups.table.shape == (3, 3)
+    assert len(tmpdir.join("matchups").listdir()) == 1
+
+
+def test_lookup(matchups):
+    assert matchups.lookup('1', '2') == (260, 0, 5)
+    assert matchups.lookup('2', '1') == (0, 260, 5)
+
+
+@pytest.mark.parametrize(
+    "pid_1, pid_2", [
+        ('1', '4'),
+        ('4', '1'),
+        # equal speed, decided by the coin tosses
+        ('2', '3'),
+        ('1', '1')
+    ]
+)
+def test_lookup_undecided(matchups, pid_1, pid_2):
+    assert matchups.lookup(pid_1, pid_2) is None
+
+
+def test_pokemon(matchups):
+    assert matchups.pokemon('1').to_dict() == {
+        'name': 'POKE_A',
+        'stats': {'hp': 300, 'attack': 50, 'defence': 20, 'speed': 10}
+    }
+    assert matchups.pokemon('4') is None
+
+
+def test_load_reuses_table(matchups, mock_pokedex, tmpdir):
+    path = tmpdir.join("matchups").listdir()[0]
+    mtime = os.path.getmtime(str(path))
+
+    other = MatchupTable(str(tmpdir.join("matchups")), 8)
+    other.load(mock_pokedex)
+
+    assert tmpdir.join("matchups").listdir() == [path]
+    assert os.path.getmtime(str(path)) == mtime
+    assert other.lookup('1', '2') == (260, 0, 5)
+
+
+def test_load_new_table_for_changed_stats(matchups, mock_pokedex, roster,
+                                          tmpdir):
+    roster[1].attack = 10
+    matchups.load(mock_pokedex)
+
+    assert len(tmpdir.join("matchups").listdir()) == 2
+    assert matchups.lookup('1', '2') == (220, 200, 8)
+
+
+def test_load_empty(tmpdir, mock_pokedex):
+    mock_pokedex.get_pokemon_by_stat.return_value = []
+    matchups = MatchupTable(str(tmpdir.join("matchups")), 8)
+
+    assert matchups.load(mock_pokedex) == 0
+    assert matchups.lookup('1', '2') is None
+
+
+def test_current(matchups, mock_pokedex, roster):
+    assert matchups.current(mock_pokedex) is matchups
+    assert mock_pokedex.get_pokemon_by_stat.call_count == 1
+
+    roster[1].attack = 10
+    mock_pokedex.data_version.return_value = 2
+    matchups.current(mock_pokedex)
+
+    assert mock_pokedex.get_pokemon_by_stat.call_count == 2
+    assert matchups.version == 2
+    assert matchups.lookup('1', '2') == (220, 200, 8)
@@ -0,0 +1,151 @@
+import pytest
+from backend.memory_pokedex import MemoryPokedex
+from backend.record import PokemonRecord
+
+DATA = (
+    "#,Name,Type 1,Type 2,Total,HP,Attack,Defense,Sp. Atk,Sp. Def,"
+    "Speed,Generation,Legendary\n"
+    "1,Bulbasaur,Grass,Poison,318,45,49,49,65,65,45,1,False\n"
+    "4,Charmander,Fire,,309,39,52,43,60,50,65,1,False\n"
+    "6,Charizard,Fire,Flying,534,78,84,78,109,85,100,1,False\n"
+    "6,CharizardMega Charizard X,Fire,Dragon,634,78,130,111,130,85,100,1,False\n"
+    "146,Moltres,Fire,Flying,580,90,100,90,125,85,90,1,True\n"
+    "172,Pichu,Electric,,205,20,40,15,35,35,60,2,False\n"
+)
+
+BULBASAUR = {
+    'id': '1', 'name': 'Bulbasaur', 'type': ['Grass', 'Poison'],
+    'stats': {'total': 318, 'hp': 45, 'attack': 49, 'defence': 49,
+              'sp.atk': 65, 'sp.def': 65, 'speed': 45},
+    'gen': 1, 'legendary': False
+}
+
+
+def _names(pokemon):
+    return [p.name for p in pokemon]
+
+
+@pytest.fixture
+def pokedex(tmpdir):
+    data_file = tmpdir.join("pokemons.csv")
+    data_file.write(DATA)
+    pokedex = MemoryPokedex()
+    pokedex.import_data(str(data_file))
+    yield pokedex
+
+
+def test_import_data(pokedex, tmpdir):
+    assert len(pokedex.ids) == 5
+    assert pokedex.version == 1
+
+    data_file = tmpdir.join("other.csv")
+    data_file.write(DATA)
+    assert pokedex.import_data(str(data_file)) == 5
+    assert pokedex.version == 2
+    assert pokedex.data_version() == 2
+
+
+@pytest.mark.parametrize(
+    "p_id, expected", [
+        ('1', PokemonRecord.from_dict(BULBASAUR)),
+        (' 1 ', PokemonRecord.from_dict(BULBASAUR)),
+        ('2', None)
+    ]
+)
+def test_get_pokemon_by_id(pokedex, p_id, expected):
+    assert pokedex.get_pokemon_by_id(p_id) == expected
+
+
+def test_get_pokemon_by_id_skips_duplicates(pokedex):
+    assert pokedex.get_pokemon_by_id('6').name == 'Charizard'
+
+
+def test_get_pokemon_by_ids(pokedex):
+    assert _names(pokedex.get_pokemon_by_ids(['4', '2', '1'])) == [
+        'Charmander', 'Bulbasaur'
+    ]
+
+
+@pytest.mark.parametrize(
+    "name, expected", [
+        ('bulbasaur', ['Bulbasaur']),
+        ('CHAR', ['Charmander', 'Charizard']),
+        ('chu', ['Pichu']),
+        ('Bulba*', ['Bulbasaur']),
+        ('*chu', ['Pichu']),
+        ('char*', ['Charmander', 'Charizard']),
+        ('missing', [])
+    ]
+)
+def test_get_pokemon_by_name(pokedex, name, expected):
+    assert _names(pokedex.get_pokemon_by_name(name)) == expected
+
+
+@pytest.mark.parametrize(
+    "p_types, expected", [
+        (['fire'], ['Charmander', 'Charizard', 'Moltres']),
+        (['Fire', 'Flying'], ['Charizard', 'Moltres']),
+        (['Fire', 'Grass'], []),
+        (['Unknown'], [])
+    ]
+)
+def test_get_pokemon_by_type(pokedex, p_types, expected):
+    assert _names(pokedex.get_pokemon_by_type(p_types)) == expected
+
+
+@pytest.mark.parametrize(
+    "gen, expected", [
+        ('1', ['Bulbasaur', 'Charmander', 'Charizard', 'Moltres']),
+        ('2', ['Pichu']),
+        ('a', [])
+    ]
+)
+def test_get_pokemon_by_generation(pokedex, gen, expected):
+    assert _names(pokedex.get_pokemon_by_generation(gen)) == expected
+
+
+@pytest.mark.parametrize(
+    "is_legend, expected", [
+        (True, ['Moltres']),
+        (False, ['Bulbasaur', 'Charmander', 'Charizard', 'Pichu'])
+    ]
+)
+def test_get_pokemon_by_legendary(pokedex, is_legend, expected):
+    assert _names(pokedex.get_pokemon_by_legendary(is_legend)) == expected
+
+
+@pytest.mark.parametrize(
+    "stats, expected", [
+        ([('hp', '>', 70)], ['Charizard', 'Moltres']),
+        ([('hp', '>=', 78), ('speed', '<', 100)], ['Moltres']),
+        ([('attack', '=', 40)], ['Pichu']),
+        ([('attack', '=<', 49)], ['Bulbasaur', 'Pichu']),
+        ([('unknown', '>', 1)], [])
+    ]
+)
+def test_get_pokemon_by_stats(pokedex, stats, expected):
+    assert _names(pokedex.get_pokemon_by_stats(stats)) == expected
+
+
+def test_get_pokemon_fields(pokedex):
+    assert pokedex.get_pokemon_by_id(
+        '6', fields='name,stats.speed'
+    ).to_dict() == {'name': 'Charizard', 'stats': {'speed': 100}}
+    assert [p.to_dict() for p in pokedex.get_pokemon_by_type(
+        ['Fire'], fields=['id']
+    )] == [{'id': '4'}, {'id': '6'}, {'id': '146'}]
+    assert pokedex.get_pokemon_by_fuzzy_name(
+        'Charzard', 1, fields='id'
+    )[0]['pokemon'].to_dict() == {'id': '6'}
+
+    with pytest.raises(ValueError):
+        pokedex.get_pokemon_by_name('char', fields='nope')
+
+
+def test_get_pokemon_by_fuzzy_name(pokedex):
+    result = pokedex.get_pokemon_by_fuzzy_name('Charzard', 2)
+
+    assert [r['pokemon'].name for r in result] == [
+        'Charizard', 'Charmander'
+    ]
+    assert result[0]['score'] > result[1]['score']
@@ -0,0 +1,79 @@
+import pytest
+from backend.name_index import (
+    NameIndex, name_pattern, pattern_prefix, pattern_trigrams, trigrams
+)
+
+NAMES = ['Bulbasaur', 'Pikachu', 'Raichu', 'Pichu', 'Flabébé', 'Mew', 'Mewtwo']
+
+
+@pytest.fixture
+def index():
+    yield NameIndex(NAMES)
+
+
+@pytest.mark.parametrize(
+    "text, expected", [
+        ('', set()),
+        ('ab', set()),
+        ('Mew', {'mew'}),
+        ('Pichu', {'pic', 'ich', 'chu'})
+    ]
+)
+def test_trigrams(text, expected):
+    assert trigrams(text) == expected
+
+
+@pytest.mark.parametrize(
+    "name, pattern, prefix, grams", [
+        ('chu', '*chu*', '', {'chu'}),
+        (' Bulba* ', 'bulba*', 'bulba', {'bul', 'ulb', 'lba'}),
+        ('*chu', '*chu', '', {'chu'}),
+        ('p?chu', 'p?chu', 'p', {'chu'}),
+        ('[pr]aichu', '[pr]aichu', '', {'aic', 'ich', 'chu'})
+    ]
+)
+def test_pattern_helpers(name, pattern, prefix, grams):
+    assert name_pattern(name) == pattern
+    assert pattern_prefix(pattern) == prefix
+    assert pattern_trigrams(pattern) == grams
+
+
+@pytest.mark.parametrize(
+    "name, expected", [
+        ('chu', ['Pikachu', 'Raichu', 'Pichu']),
+        ('*chu', ['Pikachu', 'Raichu', 'Pichu']),
+        ('pi*', ['Pikachu', 'Pichu']),
+        ('MEW', ['Mew', 'Mewtwo']),
+        ('mew', ['Mew', 'Mewtwo']),
+        ('mew?', []),
+        ('bébé', ['Flabébé']),
+        ('u', ['Bulbasaur', 'Pikachu', 'Raichu', 'Pichu']),
+        ('[pr]?chu', ['Pichu']),
+        ('missing', [])
+    ]
+)
+def test_search(index, name, expected):
+    assert [NAMES[row] for row in index.search(name)] == expected
+
+
+@pytest.mark.parametrize(
+    "name, limit, expected", [
+        ('Pikachoo', 1, ['Pikachu']),
+        ('raichu', 1, ['Raichu']),
+        ('mewto', 2, ['Mewtwo', 'Mew']),
+        ('Flabebe', 1, ['Flabébé']),
+        ('zzzz', 5, []),
+        ('', 5, [])
+    ]
+)
+def test_fuzzy(index, name, limit, expected):
+    result = index.fuzzy(name, limit)
+
+    assert [NAMES[row] for row, _ in result] == expected
+    scores = [score for _, score in result]
+    assert scores == sorted(scores, reverse=True)
+    assert all(0 < score <= 1 for score in scores)
+
+
+def test_fuzzy_exact_match_scores_one(index):
+    assert index.fuzzy('Pichu', 1) == [(3, 1.0)]
@@ -1,16 +1,34 @@
 import pytest
 import json
 from mock import call
-from backend.pokedex import Pokedex
+from backend.cache import LRUCache
+from backend.name_index import name_pattern
+from backend.pokedex import (
+    HASH_FIELDS, LAYOUT_HASH, Pokedex, _hash_fields, _pokemon_from_hash,
+    _pokemon_to_hash
+)
+from backend.projection import parse_fields
+from backend.record import PokemonRecord
 
 from conftest import has_call
 
 POKEMON_ID_KEY = "pokemon:id:"
 POKEMON_NAME_KEY = "pokemon:name:"
-POKEMON_TYPE_KEY = "pokemon:type:"
-POKEMON_STATS_KEY = "pokemon:stats:"
-POKEMON_LEGEND_KEY = "pokemon:legendary:"
-POKEMON_GEN_KEY = "pokemon:gen:"
+POKEMON_TYPE_KEY = "pokemon:type_ids:"
+POKEMON_STATS_KEY = "pokemon:stat_scores:"
+POKEMON_LEGEND_KEY = "pokemon:legendary_ids:"
+POKEMON_GEN_KEY = "pokemon:gen_ids:"
+POKEMON_VERSION_KEY = "pokemon:version"
+POKEMON_NAMES_KEY = "pokemon:names"
+POKEMON_NAME_TRIGRAM_KEY = "pokemon:name_trigram:"
+POKEMON_HASH_KEY = "pokemon:hash:"
+
+CHARIZARD = {
+    'id': '6', 'name': 'Charizard', 'type': ['Fire', 'Flying'],
+    'stats': {'total': 534, 'hp': 78, 'attack': 84, 'defence': 78,
+              'sp.atk': 109, 'sp.def': 85, 'speed': 100},
+    'gen': 1, 'legendary': False
+}
 
 
 def _build_key(base, ident):
@@ -24,6 +42,27 @@ def pokedex(mock_redis):
     yield Pokedex("")
 
 
+@pytest.fixture
+def cached_pokedex(mock_redis):
+    yield Pokedex("", cache=LRUCache(100), version_check_interval=60)
+
+
+@pytest.fixture
+def hash_pokedex(mock_redis):
+    yield Pokedex("", layout=LAYOUT_HASH)
+
+
+def _hash_values(pokemon, fields):
+    flat = _pokemon_to_hash(PokemonRecord.from_dict(pokemon))
+    return [str(flat[f]).encode('utf-8') if f in flat else None
+            for f in fields]
+
+
+def _docs(pokemon):
+    # what a client gets back
+    return [p.to_dict() for p in pokemon]
+
+
 @pytest.mark.parametrize(
     "line,will_parse,error", [
         ("1,Bulbasaur,Grass,Poison,318,45,49,49,65,65,45,1,False", True, None),
@@ -90,7 +129,7 @@ def test_parse_legendary(pokedex, check, is_legendary):
     line = "1,name,type,type,1,2,3,4,5,6,7,8,{}".format(check)
 
     pokemon = pokedex._parse_pokemon_line(line)
-    assert pokemon['legendary'] == is_legendary
+    assert pokemon.legendary == is_legendary
 
 
 @pytest.mark.parametrize(
@@ -108,102 +147,248 @@ def test_parse_legendary(pokedex, check, is_legendary):
 @pytest.mark.parametrize(
     "exists", [True, False]
 )
-def test_import_pokemon(pokedex, mock_redis, pokemon, exists):
-    mock_redis.get.return_value = exists
-    pokedex._import_pokemon(pokemon)
-    mock_redis.get.assert_called_with(
-        _build_key(POKEMON_ID_KEY, pokemon['id'])
+def test_import_batch_writes(pokedex, mock_redis, pokemon, exists):
+    mock_redis.mget.return_value = [exists]
+    pipe = mock_redis.pipeline.return_value
+    pokedex._import_batch([PokemonRecord.from_dict(pokemon)])
+    mock_redis.mget.assert_called_once_with(
+        [_build_key(POKEMON_ID_KEY, pokemon['id'])]
     )
-    if exists:
-        assert not mock_redis.set.called
-        assert not mock_redis.lpush.called
-    else:
+    # an existing document is left alone, its indexes are written anyway
+    assert has_call(
+        pipe.set,
+        call(
+            _build_key(POKEMON_ID_KEY, pokemon['id']),
+            json.dumps(pokemon)
+        )
+    ) != exists
+    assert has_call(
+        pipe.set,
+        call(
+            _build_key(POKEMON_NAME_KEY, pokemon['name']),
+            pokemon['id']
+        )
+    )
+    assert has_call(
+        pipe.zadd,
+        call(
+            POKEMON_NAMES_KEY,
+            {"{}:{}".format(pokemon['name'].lower(), pokemon['id']): 0}
+        )
+    )
+    for trigram in ['bul', 'ulb', 'lba', 'bas', 'asa', 'sau', 'aur']:
         assert has_call(
-            mock_redis.set,
-            call(
-                _build_key(POKEMON_ID_KEY, pokemon['id']),
-                json.dumps(pokemon)
-            )
+            pipe.sadd,
+            call(POKEMON_NAME_TRIGRAM_KEY + trigram, pokemon['id'])
+        )
+    assert has_call(
+        pipe.sadd,
+        call(
+            _build_key(POKEMON_GEN_KEY, pokemon['gen']),
+            pokemon['id']
         )
+    )
+    assert has_call(
+        pipe.sadd,
+        call(
+            _build_key(POKEMON_LEGEND_KEY, pokemon['legendary']),
+            pokemon['id']
+        )
+    )
+    for p_type in pokemon['type']:
         assert has_call(
-            mock_redis.set,
+            pipe.sadd,
             call(
-                _build_key(POKEMON_NAME_KEY, pokemon['name']),
+                _build_key(POKEMON_TYPE_KEY, p_type.lower().strip()),
                 pokemon['id']
             )
         )
+    for stat, value in pokemon['stats'].items():
         assert has_call(
-            mock_redis.lpush,
+            pipe.zadd,
             call(
-                _build_key(POKEMON_GEN_KEY, pokemon['gen']),
-                pokemon['id']
+                _build_key(POKEMON_STATS_KEY, stat.lower().strip()),
+                {pokemon['id']: value}
             )
         )
+
+
+@pytest.mark.parametrize(
+    "existing", [
+        [None, None],
+        [b'1', None],
+        [b'1', b'2']
+    ]
+)
+def test_import_batch(pokedex, mock_redis, existing):
+    pokemons = [
+        {'id': '1', 'name': 'Bulbasaur', 'type': ['grass'],
+         'stats': {'hp': 2}, 'gen': 1, 'legendary': False},
+        {'id': '2', 'name': 'Ivysaur', 'type': ['grass'],
+         'stats': {'hp': 3}, 'gen': 1, 'legendary': False},
+        {'id': '2', 'name': 'IvysaurMega', 'type': ['grass'],
+         'stats': {'hp': 4}, 'gen': 1, 'legendary': False}
+    ]
+    mock_redis.mget.return_value = existing
+    pipe = mock_redis.pipeline.return_value
+
+    imported = pokedex._import_batch(
+        [PokemonRecord.from_dict(pokemon) for pokemon in pokemons]
+    )
+
+    mock_redis.mget.assert_called_once_with(
+        [_build_key(POKEMON_ID_KEY, '1'), _build_key(POKEMON_ID_KEY, '2')]
+    )
+    assert not mock_redis.set.called
+    assert not mock_redis.sadd.called
+    assert imported == existing.count(None)
+    for pokemon, exists in zip(pokemons, existing):
         assert has_call(
-            mock_redis.lpush,
-            call(
-                _build_key(POKEMON_LEGEND_KEY, pokemon['legendary']),
-                pokemon['id']
-            )
+            pipe.set,
+            call(_build_key(POKEMON_ID_KEY, pokemon['id']),
+                 json.dumps(pokemon))
+        ) != bool(exists)
+        assert has_call(
+            pipe.sadd, call(_build_key(POKEMON_GEN_KEY, 1), pokemon['id'])
         )
-        for p_type in pokemon['type']:
-            assert has_call(
-                mock_redis.lpush,
-                call(
-                    _build_key(POKEMON_TYPE_KEY, p_type.lower().strip()),
-                    pokemon['id']
-                )
-            )
-        for stat, value in pokemon['stats'].items():
-            assert has_call(
-                mock_redis.lpush,
-                call(
-                    _build_key(POKEMON_STATS_KEY, stat.lower().strip()),
-                    pokemon['id']
-                )
-            )
+    assert not has_call(
+        pipe.set,
+        call(_build_key(POKEMON_NAME_KEY, 'IvysaurMega'), '2')
+    )
+    assert pipe.execute.call_count == 1
+
+
+def test_import_batch_seen(pokedex, mock_redis):
+    # a duplicate id in a later batch of the same import is skipped
+    seen = {'1'}
+    mock_redis.mget.return_value = [None]
+    pokemon = PokemonRecord('1', 'BulbasaurMega', ('grass',), gen=1,
+                            legendary=False)
+
+    assert pokedex._import_batch([pokemon], seen) == 0
+    assert not mock_redis.mget.called
+    assert not mock_redis.pipeline.called
+
+
+def test_import_over_existing_documents(fake_redis, tmpdir):
+    # documents written before the index keys existed are indexed
+    lines = [
+        "1,Bulbasaur,Grass,Poison,318,45,49,49,65,65,45,1,False",
+        "4,Charmander,Fire,,309,39,52,43,60,50,65,1,False"
+    ]
+    for line in lines:
+        pokemon = Pokedex("")._parse_pokemon_line(line)
+        fake_redis.set(_build_key(POKEMON_ID_KEY, pokemon.id),
+                       json.dumps(pokemon.to_dict()))
+    data_file = tmpdir.join("pokemons.csv")
+    data_file.write("header\n" + "\n".join(lines) + "\n")
+    pokedex = Pokedex("")
+
+    assert pokedex.import_data(str(data_file)) == 0
+
+    assert [p.id for p in pokedex.get_pokemon_of_type('Fire')] == ['4']
+    assert [p.id for p in pokedex.get_pokemon_by_generation('1')] == [
+        '1', '4'
+    ]
+    assert [p.id for p in pokedex.get_pokemon_by_name('char')] == ['4']
+    assert [p.id for p in pokedex.get_pokemon_by_stats(
+        [('hp', '>=', 0)]
+    )] == ['1', '4']
+
+
+@pytest.mark.parametrize(
+    "batch_size, executes", [
+        (1, 3),
+        (2, 2),
+        (3, 1),
+        (100, 1)
+    ]
+)
+def test_import_data_batches(
+    pokedex, mock_redis, tmpdir, batch_size, executes
+):
+    data_file = tmpdir.join("pokemons.csv")
+    data_file.write(
+        "#,Name,Type 1,Type 2,Total,HP,Attack,Defense,Sp. Atk,Sp. Def,"
+        "Speed,Generation,Legendary\n"
+        "1,Bulbasaur,Grass,Poison,318,45,49,49,65,65,45,1,False\n"
+        "2,Ivysaur,Grass,Poison,405,60,62,63,80,80,60,1,False\n"
+        "bad line\n"
+        "4,Charmander,Fire,,309,39,52,43,60,50,65,1,False\n"
+    )
+    mock_redis.mget.side_effect = lambda keys: [None for _ in keys]
+    pipe = mock_redis.pipeline.return_value
+
+    imported = pokedex.import_data(str(data_file), batch_size=batch_size)
+
+    assert imported == 3
+    assert pipe.execute.call_count == executes
+    mock_redis.pipeline.assert_called_with(transaction=True)
 
 
 def test_get_pokemon_by_id(pokedex, mock_redis):
-    mock_redis.get.return_value = b'{"a": 123}'
+    mock_redis.get.return_value = b'{"id": "1", "name": "a"}'
     result = pokedex.get_pokemon_by_id("1")
-    assert result == {"a": 123}
+    assert result.to_dict() == {"id": "1", "name": "a"}
     assert has_call(
         mock_redis.get, call(_build_key(POKEMON_ID_KEY, "1"))
     )
 
 
 @pytest.mark.parametrize(
-    "name, ids", [
-        ('name', []),
-        ('name', ['a']),
-        ('name', ['a', 'b'])
+    "name, ids, expected", [
+        ('name', [], []),
+        ('nam', [b'1'], ['1']),
+        ('Name', [b'2', b'1'], ['1', '2']),
+        ('*ame?', [b'1', b'2'], ['1', '2']),
+        ('*ame', [b'1', b'2'], []),
+        ('missing', [b'1'], [])
     ]
 )
-def test_get_pokemon_by_name(pokedex, mock_redis, name, ids):
-    mock_redis.get.return_value = b'1'
-    mock_redis.scan_iter.return_value = ids
+def test_get_pokemon_by_name_trigrams(pokedex, mock_redis, name, ids, expected):
+    mock_redis.sinter.return_value = set(ids)
+    mock_redis.mget.side_effect = lambda keys: [
+        '{{"id": "{0}", "name": "Name{0}"}}'.format(k.split(':')[-1]).encode()
+        for k in keys
+    ]
 
     result = pokedex.get_pokemon_by_name(name)
-    assert has_call(
-        mock_redis.scan_iter,
-        call(match=_build_key(POKEMON_NAME_KEY, name))
+
+    keys = mock_redis.sinter.call_args[0][0]
+    assert sorted(keys) == sorted(
+        POKEMON_NAME_TRIGRAM_KEY + t
+        for t in ['nam', 'ame', 'iss', 'mis', 'ing', 'sin', 'ssi']
+        if t in name.lower()
     )
-    if not ids:
-        assert not mock_redis.get.called
-        assert result == []
+    assert not mock_redis.scan_iter.called
+    assert [p.id for p in result] == expected
+
+
+@pytest.mark.parametrize(
+    "name, lex_range, expected", [
+        ('N*', (b'[n', b'[n\xff'), ['1', '12']),
+        ('na*', (b'[na', b'[na\xff'), ['1', '12']),
+        ('?a', None, ['1', '3']),
+        ('*', None, ['1', '3', '12'])
+    ]
+)
+def test_search_names_short(
+    pokedex, mock_redis, name, lex_range, expected
+):
+    entries = [b'na:1', b'na\xc3\xa9:12', b'xa:3']
+    mock_redis.zrangebylex.return_value = entries[:2]
+    mock_redis.zrange.return_value = entries
+
+    result = pokedex._search_names(name_pattern(name))
+
+    assert not mock_redis.sinter.called
+    if lex_range:
+        mock_redis.zrangebylex.assert_called_once_with(
+            POKEMON_NAMES_KEY, *lex_range
+        )
     else:
-        assert result == [1 for _ in range(len(ids))]
-        assert mock_redis.get.call_count == len(ids) * 2
-        for ident in ids:
-            assert has_call(
-                mock_redis.get,
-                call(ident)
-            )
-            assert has_call(
-                mock_redis.get,
-                call(_build_key(POKEMON_ID_KEY, '1'))
-            )
+        mock_redis.zrange.assert_called_once_with(POKEMON_NAMES_KEY, 0, -1)
+    assert result == expected
 
 
 @pytest.mark.parametrize(
@@ -214,181 +399,216 @@ def test_get_pokemon_by_name(pokedex, mock_redis, name, ids):
     ]
 )
 def test_get_pokemon_of_type(pokedex, mock_redis, p_type, ids):
-    mock_redis.get.return_value = b'1'
-    mock_redis.lrange.return_value = ids
+    mock_redis.mget.return_value = [b'{"id": "1"}' for _ in ids]
+    mock_redis.smembers.return_value = set(ids)
 
     result = pokedex.get_pokemon_of_type(p_type)
-    assert has_call(
-        mock_redis.lrange,
-        call(_build_key(POKEMON_TYPE_KEY, p_type), 0, -1)
+    mock_redis.smembers.assert_called_once_with(
+        _build_key(POKEMON_TYPE_KEY, p_type)
     )
+    assert not mock_redis.get.called
     if not ids:
-        assert not mock_redis.get.called
+        assert not mock_redis.mget.called
         assert result == []
     else:
-        for ident in ids:
-            assert has_call(
-                mock_redis.get,
-                call(_build_key(POKEMON_ID_KEY, 'a'))
-            )
+        mock_redis.mget.assert_called_once_with(
+            [_build_key(POKEMON_ID_KEY, p_id.decode('ASCII'))
+             for p_id in ids]
+        )
+        assert _docs(result) == [{'id': '1'} for _ in ids]
 
 
 @pytest.mark.parametrize(
-    "data, expected", [
-        ({'type_a': []}, []),
-        ({'type_a': [{'id': 1}, {'id': 2}]}, [{'id': 1}, {'id': 2}]),
-        ({'type_a': [{'id': 1}]}, [{'id': 1}]),
-        ({'type_a': [{'id': 1}], 'type_b': []}, []),
-        ({'type_a': [], 'type_b': [{'id': 1}]}, []),
-        ({'type_a': [{'id': 1}], 'type_b': [{'id': 1}]}, [{'id': 1}]),
-        ({'type_a': [{'id': 1}, {'id': 2}], 'type_b': [{'id': 1}]}, [{'id': 1}]),
-        ({'type_a': [{'id': 1}], 'type_b': [{'id': 1}, {'id': 2}]}, [{'id': 1}]),
-        ({'type_a': [{'id': 1}, {'id': 2}], 'type_b': [{'id': 1}, {'id': 2}]}, [{'id': 1}, {'id': 2}])
+    "batch_size, ids, calls", [
+        (2, [], 0),
+        (2, ['1'], 1),
+        (2, ['1', '2'], 1),
+        (2, ['1', '2', '3'], 2),
+        (1, ['1', '2', '3'], 3)
     ]
 )
-def test_get_pokemon_by_type(
-    pokedex, mock_redis,
-    data, expected
-):
-    def mock_get_pokemon_of_type(ptype):
-        return data[ptype]
+def test_get_pokemon_by_ids(pokedex, mock_redis, batch_size, ids, calls):
+    pokedex.hydrate_batch_size = batch_size
+    mock_redis.mget.side_effect = lambda keys: [
+        None if k.endswith('2') else b'{"id": 1}' for k in keys
+    ]
+
+    result = pokedex.get_pokemon_by_ids(ids)
+
+    assert mock_redis.mget.call_count == calls
+    assert _docs(result) == [{'id': 1} for p_id in ids if p_id != '2']
+
+
+def test_get_pokemon_by_ids_fields(cached_pokedex, mock_redis):
+    mock_redis.get.return_value = b'1'
+    mock_redis.mget.return_value = [
+        b'{"id": "6", "name": "Charizard", "stats": {"hp": 78, "speed": 100}}'
+    ]
+
+    assert _docs(cached_pokedex.get_pokemon_by_ids(
+        ['6'], fields='name,stats.hp'
+    )) == [{'name': 'Charizard', 'stats': {'hp': 78}}]
 
-    pokedex.get_pokemon_of_type = mock_get_pokemon_of_type
+    # projections share the cached record's values, not its fields
+    pokemon = cached_pokedex.get_pokemon_by_ids(['6'], fields='stats')[0]
+    assert pokemon.to_dict() == {'stats': {'hp': 78, 'speed': 100}}
+    assert cached_pokedex.get_pokemon_by_id('6').to_dict() == {
+        'id': '6', 'name': 'Charizard', 'stats': {'hp': 78, 'speed': 100}
+    }
 
-    actual = pokedex.get_pokemon_by_type(data.keys())
 
-    assert actual == expected
+def test_get_pokemon_by_name_fields(pokedex, mock_redis):
+    mock_redis.sinter.return_value = {b'25'}
+    mock_redis.mget.return_value = [b'{"id": "25", "name": "Pikachu"}']
+
+    assert _docs(pokedex.get_pokemon_by_name('pika', fields='id')) == [
+        {'id': '25'}
+    ]
+
+    with pytest.raises(ValueError):
+        pokedex.get_pokemon_by_name('pika', fields='nope')
 
 
 @pytest.mark.parametrize(
-    "stats, data, expected", [
-        (
-            [('s1', '=', 10)],
-            {'s1': [{'id': 1, 'stats': {'s1': 10}}]},
-            [{'id': 1, 'stats': {'s1': 10}}]
-        ),
-        (
-            [('s1', '=', 10)],
-            {'s1': [{'id': 1, 'stats': {'s1': 20}}]},
-            []
-        ),
-        (
-            [('s1', '>', 10)],
-            {'s1': [{'id': 1, 'stats': {'s1': 10}}]},
-            []
-        ),
-        (
-            [('s1', '>', 10)],
-            {'s1': [{'id': 1, 'stats': {'s1': 9}}]},
-            []
-        ),
-        (
-            [('s1', '>', 10)],
-            {'s1': [{'id': 1, 'stats': {'s1': 11}}]},
-            [{'id': 1, 'stats': {'s1': 11}}]
-        ),
-        (
-            [('s1', '<', 10)],
-            {'s1': [{'id': 1, 'stats': {'s1': 9}}]},
-            [{'id': 1, 'stats': {'s1': 9}}]
-        ),
-        (
-            [('s1', '<', 10)],
-            {'s1': [{'id': 1, 'stats': {'s1': 10}}]},
-            []
-        ),
-        (
-            [('s1', '<', 10)],
-            {'s1': [{'id': 1, 'stats': {'s1': 11}}]},
-            []
-        ),
-        (
-            [('s1', '<=', 10)],
-            {'s1': [{'id': 1, 'stats': {'s1': 10}}]},
-            [{'id': 1, 'stats': {'s1': 10}}]
-        ),
-        (
-            [('s1', '<=', 10)],
-            {'s1': [{'id': 1, 'stats': {'s1': 9}}]},
-            [{'id': 1, 'stats': {'s1': 9}}]
-        ),
-        (
-            [('s1', '<=', 10)],
-            {'s1': [{'id': 1, 'stats': {'s1': 11}}]},
-            []
-        ),
-        (
-            [('s1', '=>', 10)],
-            {'s1': [{'id': 1, 'stats': {'s1': 10}}]},
-            [{'id': 1, 'stats': {'s1': 10}}]
-        ),
-        (
-            [('s1', '=>', 10)],
-            {'s1': [{'id': 1, 'stats': {'s1': 11}}]},
-            [{'id': 1, 'stats': {'s1': 11}}]
-        ),
-        (
-            [('s1', '=>', 10)],
-            {'s1': [{'id': 1, 'stats': {'s1': 9}}]},
-            []
-        ),
-        (
-            [('s1', '=', 10)],
-            {'s1': [{'id': 1, 'stats': {'s1': 10, 's2': 20}}],
-             's2': [{'id': 1, 'stats': {'s1': 10, 's2': 20}}]},
-            [{'id': 1, 'stats': {'s1': 10, 's2': 20}}]
-        ),
-        (
-            [('s2', '=', 10)],
-            {'s1': [{'id': 1, 'stats': {'s1': 10, 's2': 20}}],
-             's2': [{'id': 1, 'stats': {'s1': 10, 's2': 20}}]},
-            []
-        ),
-        (
-            [('s2', '=', 20)],
-            {'s1': [{'id': 1, 'stats': {'s1': 10, 's2': 20}}],
-             's2': [{'id': 1, 'stats': {'s1': 10, 's2': 20}}]},
-            [{'id': 1, 'stats': {'s1': 10, 's2': 20}}]
-        ),
-        (
-            [('s1', '=', 10), ('s2', '=', 20)],
-            {'s1': [{'id': 1, 'stats': {'s1': 10, 's2': 20}}],
-             's2': [{'id': 1, 'stats': {'s1': 10, 's2': 20}}]},
-            [{'id': 1, 'stats': {'s1': 10, 's2': 20}}]
-        ),
-        (
-            [('s1', '=', 20), ('s2', '=', 20)],
-            {'s1': [{'id': 1, 'stats': {'s1': 10, 's2': 20}}],
-             's2': [{'id': 1, 'stats': {'s1': 10, 's2': 20}}]},
-            []
-        ),
-        (
-            [('s1', '=', 10), ('s2', '>', 20)],
-            {'s1': [{'id': 1, 'stats': {'s1': 10, 's2': 20}}],
-             's2': [{'id': 1, 'stats': {'s1': 10, 's2': 20}}]},
-            []
-        ),
-        (
-            [('s1', '=', 10), ('s2', '=', 20)],
-            {'s1': [{'id': 1, 'stats': {'s1': 10, 's2': 20}}],
-             's2': []},
-            []
-        ),
+    "p_types, ids", [
+        (['Fire'], []),
+        (['Fire'], [b'6', b'4']),
+        (['Fire', 'Flying'], []),
+        (['Fire', 'Flying'], [b'6']),
+        (['Fire', ' flying', 'Dragon'], [b'150', b'6'])
+    ]
+)
+def test_get_pokemon_by_type(pokedex, mock_redis, p_types, ids):
+    mock_redis.smembers.return_value = set(ids)
+    mock_redis.sinter.return_value = set(ids)
+    mock_redis.mget.side_effect = lambda keys: [
+        '{{"id": "{}"}}'.format(k.split(':')[-1]).encode() for k in keys
+    ]
+
+    actual = pokedex.get_pokemon_by_type(p_types)
+
+    keys = [_build_key(POKEMON_TYPE_KEY, p_type) for p_type in p_types]
+    if len(p_types) == 1:
+        mock_redis.smembers.assert_called_once_with(keys[0])
+        assert not mock_redis.sinter.called
+    else:
+        mock_redis.sinter.assert_called_once_with(keys)
+        assert not mock_redis.smembers.called
+
+    assert _docs(actual) == [
+        {'id': p_id} for p_id in sorted((i.decode() for i in ids), key=int)
+    ]
+    assert mock_redis.mget.called == bool(ids)
+
+
+def test_get_pokemon_by_stat(pokedex, mock_redis):
+    mock_redis.zrange.return_value = [b'2', b'1']
+    mock_redis.mget.return_value = [b'{"id": "2"}', b'{"id": "1"}']
+
+    assert _docs(pokedex.get_pokemon_by_stat('HP')) == [
+        {'id': '2'}, {'id': '1'}
+    ]
+    mock_redis.zrange.assert_called_with(
+        _build_key(POKEMON_STATS_KEY, 'hp'), 0, -1
+    )
+
 
+@pytest.mark.parametrize(
+    "stats, scores", [
+        ([('s1', '=', 10)], [10, 10]),
+        ([('s1', '>', 10)], ['(10', '+inf']),
+        ([('s1', '=>', 10)], [10, '+inf']),
+        ([('s1', '<', 10)], ['-inf', '(10']),
+        ([('S1', '<=', 10)], ['-inf', 10]),
     ]
 )
-def test_get_pokemon_by_stats(
-    pokedex, mock_redis,
-    stats, data, expected
-):
-    def mock_get_pokemon_by_stat(stat):
-        return data[stat]
+def test_get_pokemon_by_stats_single(pokedex, mock_redis, stats, scores):
+    mock_redis.zrangebyscore.return_value = [b'1']
+    mock_redis.mget.return_value = [b'{"id": "1"}']
+
+    assert _docs(pokedex.get_pokemon_by_stats(stats)) == [{'id': '1'}]
+    mock_redis.zrangebyscore.assert_called_once_with(
+        _build_key(POKEMON_STATS_KEY, 's1'), *scores
+    )
+    assert not mock_redis.pipeline.called
+
+
+@pytest.mark.parametrize(
+    "ids, expected", [
+        ([], []),
+        ([b'1'], [{'id': '1'}])
+    ]
+)
+def test_get_pokemon_by_stats_multiple(pokedex, mock_redis, ids, expected):
+    pipe = mock_redis.pipeline.return_value
+    pipe.execute.return_value = [0, 0, 0, 0, 0, 0, len(ids), ids, 4]
+    mock_redis.mget.return_value = [b'{"id": "1"}']
 
-    pokedex.get_pokemon_by_stat = mock_get_pokemon_by_stat
+    actual = pokedex.get_pokemon_by_stats(
+        [('attack', '>', 100), ('speed', '>=', 90), ('hp', '<', 80)]
+    )
+
+    assert _docs(actual) == expected
+    mock_redis.pipeline.assert_called_once_with(transaction=True)
+    tmps = [args[0] for args, _ in pipe.zunionstore.call_args_list]
+    assert [args[1] for args, _ in pipe.zunionstore.call_args_list] == [
+        [_build_key(POKEMON_STATS_KEY, 'attack')],
+        [_build_key(POKEMON_STATS_KEY, 'speed')],
+        [_build_key(POKEMON_STATS_KEY, 'hp')]
+    ]
+    assert pipe.zremrangebyscore.call_args_list == [
+        call(tmps[0], '-inf', '100'),
+        call(tmps[1], '-inf', '(90'),
+        call(tmps[2], '80', '+inf')
+    ]
+    query = pipe.zinterstore.call_args[0][0]
+    pipe.zinterstore.assert_called_once_with(query, tmps)
+    pipe.delete.assert_called_once_with(query, *tmps)
+    assert not mock_redis.zrangebyscore.called
+    assert mock_redis.mget.called == bool(ids)
+
+
+@pytest.mark.parametrize(
+    "stats, expected", [
+        ([('attack', '>', 50), ('speed', '>=', 65)], ['4', '6', '146']),
+        ([('attack', '>=', 52), ('speed', '<', 100)], ['4', '146']),
+        ([('hp', '=', 78), ('attack', '<=', 84), ('speed', '=<', 100)],
+         ['6']),
+        ([('hp', '<', 40), ('attack', '>', 100)], []),
+        # pokedex order, not by speed
+        ([('speed', '>', 0)], ['1', '4', '6', '146']),
+        ([('speed', '>', 0), ('hp', '>', 40)], ['1', '6', '146'])
+    ]
+)
+def test_get_pokemon_by_stats_redis(fake_redis, stats, expected):
+    pokedex = Pokedex("")
+    for line in [
+        "1,Bulbasaur,Grass,Poison,318,45,49,49,65,65,45,1,False",
+        "4,Charmander,Fire,,309,39,52,43,60,50,65,1,False",
+        "6,Charizard,Fire,Flying,534,78,84,78,109,85,100,1,False",
+        "146,Moltres,Fire,Flying,580,90,100,90,125,85,90,1,True"
+    ]:
+        pokedex._import_batch([pokedex._parse_pokemon_line(line)])
+
+    assert [p.id for p in pokedex.get_pokemon_by_stats(stats)] == expected
+    # the temporary sets are gone
+    assert not fake_redis.keys("pokemon:stats_query:*")
+
+
+def test_get_pokemon_by_stats_order(pokedex, mock_redis):
+    mock_redis.zrangebyscore.return_value = [b'6', b'146', b'4']
 
-    actual = pokedex.get_pokemon_by_stats(stats)
+    pokedex.get_pokemon_by_stats([('attack', '>', 50)])
 
-    assert actual == expected
+    mock_redis.mget.assert_called_once_with(
+        [_build_key(POKEMON_ID_KEY, p_id) for p_id in ['4', '6', '146']]
+    )
+
+
+def test_get_pokemon_by_stats_bad_operator(pokedex, mock_redis):
+    with pytest.raises(ValueError):
+        pokedex.get_pokemon_by_stats([('s1', '<>', 1)])
+    assert not mock_redis.zrangebyscore.called
 
 
 @pytest.mark.parametrize(
@@ -403,21 +623,23 @@ def test_get_pokemon_by_generation(
     pokedex, mock_redis,
     gen, expected
 ):
-    mock_redis.lrange.return_value = [b'1' for _ in range(len(expected))]
-    mock_redis.get.return_value = b'{"id": 1}'
+    mock_redis.smembers.return_value = {
+        str(i + 1).encode() for i in range(len(expected))
+    }
+    mock_redis.mget.return_value = [b'{"id": 1}' for _ in expected]
 
     actual = pokedex.get_pokemon_by_generation(gen)
 
-    mock_redis.lrange.assert_called_with(
-        _build_key(POKEMON_GEN_KEY, gen), 0, -1
+    mock_redis.smembers.assert_called_with(
+        _build_key(POKEMON_GEN_KEY, gen)
     )
-    assert actual == expected
+    assert _docs(actual) == expected
     if expected:
-        mock_redis.get.assert_called_with(
-            _build_key(POKEMON_ID_KEY, 1)
+        mock_redis.mget.assert_called_once_with(
+            [_build_key(POKEMON_ID_KEY, i + 1) for i in range(len(expected))]
         )
     else:
-        assert not mock_redis.get.called
+        assert not mock_redis.mget.called
 
 
 @pytest.mark.parametrize(
@@ -434,18 +656,210 @@ def test_get_pokemon_by_legendary(
     pokedex, mock_redis,
     is_legend, expected
 ):
-    mock_redis.lrange.return_value = [b'1' for _ in range(len(expected))]
-    mock_redis.get.return_value = b'{"id": 1}'
+    mock_redis.smembers.return_value = {
+        str(i + 1).encode() for i in range(len(expected))
+    }
+    mock_redis.mget.return_value = [b'{"id": 1}' for _ in expected]
 
     actual = pokedex.get_pokemon_by_legendary(is_legend)
 
-    mock_redis.lrange.assert_called_with(
-        _build_key(POKEMON_LEGEND_KEY, is_legend), 0, -1
+    mock_redis.smembers.assert_called_with(
+        _build_key(POKEMON_LEGEND_KEY, is_legend)
     )
-    assert actual == expected
+    assert _docs(actual) == expected
     if expected:
-        mock_redis.get.assert_called_with(
-            _build_key(POKEMON_ID_KEY, 1)
+        mock_redis.mget.assert_called_once_with(
+            [_build_key(POKEMON_ID_KEY, i + 1) for i in range(len(expected))]
         )
     else:
-        assert not mock_redis.get.called
+        assert not mock_redis.mget.called
+
+
+def test_cached_get_pokemon_by_id(cached_pokedex, mock_redis):
+    mock_redis.get.side_effect = lambda key: {
+        POKEMON_VERSION_KEY: b'1',
+        _build_key(POKEMON_ID_KEY, '1'): b'{"id": "1", "stats": {"hp": 1}}'
+    }.get(key)
+
+    first = cached_pokedex.get_pokemon_by_id('1')
+    second = cached_pokedex.get_pokemon_by_id('1')
+
+    # records are never changed, so the cached one is handed out as is
+    assert second is first
+    assert second.to_dict() == {'id': '1', 'stats': {'hp': 1}}
+    assert mock_redis.get.call_count == 2  # version + one pokemon lookup
+
+
+def test_cached_list_hydration(cached_pokedex, mock_redis):
+    mock_redis.get.side_effect = lambda key: (
+        b'1' if key == POKEMON_VERSION_KEY else b'{"id": "2"}'
+    )
+    mock_redis.smembers.return_value = {b'1', b'2'}
+    mock_redis.mget.side_effect = lambda keys: [
+        '{{"id": "{}"}}'.format(k.split(':')[-1]).encode() for k in keys
+    ]
+
+    cached_pokedex.get_pokemon_by_id('2')
+    assert _docs(cached_pokedex.get_pokemon_of_type('grass')) == [
+        {'id': '1'}, {'id': '2'}
+    ]
+    assert _docs(cached_pokedex.get_pokemon_of_type('grass')) == [
+        {'id': '1'}, {'id': '2'}
+    ]
+
+    assert mock_redis.smembers.call_count == 1
+    mock_redis.mget.assert_called_once_with([_build_key(POKEMON_ID_KEY, '1')])
+
+
+def test_cache_invalidated_on_version_change(cached_pokedex, mock_redis):
+    versions = [b'1', b'2']
+    mock_redis.get.side_effect = lambda key: (
+        versions[0] if key == POKEMON_VERSION_KEY else b'{"id": "1"}'
+    )
+
+    cached_pokedex.get_pokemon_by_id('1')
+    cached_pokedex.get_pokemon_by_id('1')
+    assert mock_redis.get.call_count == 2
+
+    versions.pop(0)
+    cached_pokedex._version_checked = 0
+    cached_pokedex.get_pokemon_by_id('1')
+    assert mock_redis.get.call_count == 4
+
+
+def test_import_data_bumps_version(cached_pokedex, mock_redis, tmpdir):
+    data_file = tmpdir.join("pokemons.csv")
+    data_file.write("header\n")
+    cached_pokedex.cache.set('a', 1)
+
+    cached_pokedex.import_data(str(data_file))
+
+    mock_redis.incr.assert_called_once_with(POKEMON_VERSION_KEY)
+    assert len(cached_pokedex.cache) == 0
+
+
+def test_data_version(cached_pokedex, mock_redis, tmpdir):
+    versions = [b'1', b'2']
+    mock_redis.get.side_effect = lambda key: versions[0]
+
+    assert cached_pokedex.data_version() == b'1'
+    versions.pop(0)
+    assert cached_pokedex.data_version() == b'1'
+
+    # an import here is picked up without waiting for the check interval
+    data_file = tmpdir.join("pokemons.csv")
+    data_file.write("header\n")
+    cached_pokedex.import_data(str(data_file))
+    assert cached_pokedex.data_version() == b'2'
+
+
+def test_get_pokemon_by_fuzzy_name(pokedex, mock_redis):
+    mock_redis.zrange.return_value = [
+        b'charizard:6', b'charmander:4', b'pikachu:25'
+    ]
+    mock_redis.mget.side_effect = lambda keys: [
+        '{{"id": "{}"}}'.format(k.split(':')[-1]).encode() for k in keys
+    ]
+
+    result = pokedex.get_pokemon_by_fuzzy_name('Charzard', 5)
+    pokedex.get_pokemon_by_fuzzy_name('Charmandr', 5)
+
+    assert [r['pokemon'].to_dict() for r in result] == [
+        {'id': '6'}, {'id': '4'}
+    ]
+    assert result[0]['score'] > result[1]['score']
+    mock_redis.zrange.assert_called_once_with(POKEMON_NAMES_KEY, 0, -1)
+
+
+def test_unknown_layout(mock_redis):
+    with pytest.raises(ValueError):
+        Pokedex("", layout='xml')
+
+
+@pytest.mark.parametrize(
+    "fields, expected", [
+        (None, list(HASH_FIELDS)),
+        ('name', ['id', 'name']),
+        ('id,stats.hp,stats.speed', ['id', 'stats.hp', 'stats.speed']),
+        ('legendary,stats',
+         ['id'] + list(HASH_FIELDS[3:-2]) + ['legendary'])
+    ]
+)
+def test_hash_fields(fields, expected):
+    assert list(_hash_fields(parse_fields(fields))) == expected
+
+
+def test_pokemon_hash_round_trip():
+    values = _hash_values(CHARIZARD, HASH_FIELDS)
+    assert _pokemon_from_hash(HASH_FIELDS, values).to_dict() == CHARIZARD
+    assert _pokemon_from_hash(HASH_FIELDS, [None] * len(HASH_FIELDS)) is None
+
+
+def test_import_batch_hash_writes(hash_pokedex, mock_redis):
+    pipe = mock_redis.pipeline.return_value
+    pipe.execute.return_value = [0]
+    charizard = PokemonRecord.from_dict(CHARIZARD)
+
+    assert hash_pokedex._import_batch([charizard]) == 1
+    pipe.exists.assert_called_once_with(_build_key(POKEMON_HASH_KEY, '6'))
+    pipe.hmset.assert_called_once_with(
+        _build_key(POKEMON_HASH_KEY, '6'), _pokemon_to_hash(charizard)
+    )
+    assert not has_call(
+        pipe.set, call(_build_key(POKEMON_ID_KEY, '6'), json.dumps(
+            CHARIZARD
+        ))
+    )
+
+
+def test_import_batch_hash(hash_pokedex, mock_redis):
+    pipe = mock_redis.pipeline.return_value
+    pipe.execute.return_value = [1]
+
+    assert hash_pokedex._import_batch(
+        [PokemonRecord.from_dict(CHARIZARD)]
+    ) == 0
+    pipe.exists.assert_called_once_with(_build_key(POKEMON_HASH_KEY, '6'))
+    assert not mock_redis.mget.called
+    assert not pipe.hmset.called
+
+
+@pytest.mark.parametrize(
+    "fields, expected", [
+        (None, CHARIZARD),
+        ('name,stats.hp', {'name': 'Charizard', 'stats': {'hp': 78}}),
+        ('stats.attack', {'stats': {'attack': 84}})
+    ]
+)
+def test_get_pokemon_by_id_hash(hash_pokedex, mock_redis, fields, expected):
+    mock_redis.hmget.side_effect = lambda key, f: _hash_values(CHARIZARD, f)
+
+    assert hash_pokedex.get_pokemon_by_id(
+        '6', fields=fields
+    ).to_dict() == expected
+    key, read = mock_redis.hmget.call_args[0]
+    assert key == _build_key(POKEMON_HASH_KEY, '6')
+    assert list(read) == list(_hash_fields(parse_fields(fields)))
+    assert not mock_redis.get.called
+
+
+def test_get_pokemon_by_id_hash_missing(hash_pokedex, mock_redis):
+    mock_redis.hmget.return_value = [None, None]
+    assert hash_pokedex.get_pokemon_by_id('6', fields='name') is None
+
+
+def test_get_pokemon_by_ids_hash(hash_pokedex, mock_redis):
+    hash_pokedex.hydrate_batch_size = 2
+    pipe = mock_redis.pipeline.return_value
+    fields = _hash_fields(parse_fields('name'))
+    pipe.execute.side_effect = [
+        [_hash_values(CHARIZARD, fields), [None, None]],
+        [_hash_values(dict(CHARIZARD, name='Other'), fields)]
+    ]
+
+    assert _docs(hash_pokedex.get_pokemon_by_ids(
+        ['6', '7', '8'], fields='name'
+    )) == [{'name': 'Charizard'}, {'name': 'Other'}]
+    assert pipe.hmget.call_count == 3
+    pipe.hmget.assert_called_with(_build_key(POKEMON_HASH_KEY, '8'), fields)
+    assert not mock_redis.mget.called
@@ -0,0 +1,54 @@
+import pytest
+from backend.projection import parse_fields, project, split_fields
+
+POKEMON = {
+    'id': '6', 'name': 'Charizard', 'type': ['Fire', 'Flying'],
+    'stats': {'hp': 78, 'attack': 84, 'sp.atk': 109},
+    'gen': 1, 'legendary': False
+}
+
+
+@pytest.mark.parametrize(
+    "fields, expected", [
+        (None, None),
+        ('', ()),
+        ('name', ('name',)),
+        ('name, ID,,', ('id', 'name')),
+        (['stats.attack', ' name', 'name'], ('name', 'stats.attack'))
+    ]
+)
+def test_split_fields(fields, expected):
+    assert split_fields(fields) == expected
+
+
+@pytest.mark.parametrize(
+    "fields, expected", [
+        (None, None),
+        ('id,name', {'id': None, 'name': None}),
+        ('stats.hp,stats.sp.atk', {'stats': {'hp', 'sp.atk'}}),
+        ('stats.hp,stats', {'stats': None}),
+        ('stats,stats.hp', {'stats': None})
+    ]
+)
+def test_parse_fields(fields, expected):
+    assert parse_fields(fields) == expected
+
+
+@pytest.mark.parametrize("fields", ['', ',', 'nope', 'name.first'])
+def test_parse_fields_invalid(fields):
+    with pytest.raises(ValueError):
+        parse_fields(fields)
+
+
+@pytest.mark.parametrize(
+    "fields, expected", [
+        (None, POKEMON),
+        ('name', {'name': 'Charizard'}),
+        ('id,stats.attack,stats.sp.atk', {
+            'id': '6', 'stats': {'attack': 84, 'sp.atk': 109}
+        }),
+        ('stats.nope', {'stats': {}})
+    ]
+)
+def test_project(fields, expected):
+    assert project(POKEMON, parse_fields(fields)) == expected
@@ -1,5 +1,11 @@
+import threading
+import time
+
 import pytest
-from mock import patch
+from mock import Mock, patch
+from backend import base_server, wire
+from backend import query_server as query_server_module
+from backend.cache import LRUCache
 from backend.query_server import QueryServer
 
 
@@ -21,6 +27,7 @@ def mock_pokedex_functions(mock_pokedex):
     yield {
         'ID': mock_pokedex.get_pokemon_by_id,
         'NAME': mock_pokedex.get_pokemon_by_name,
+        'FUZZY': mock_pokedex.get_pokemon_by_fuzzy_name,
         'TYPE': mock_pokedex.get_pokemon_by_type,
         'GEN': mock_pokedex.get_pokemon_by_generation,
         'LEGEND': mock_pokedex.get_pokemon_by_legendary,
@@ -93,7 +100,9 @@ def test_handle_request(
         assert actual == "Bad input"
         return
 
-    mock_pokedex_functions[q_type].assert_called_with(expected_call)
+    mock_pokedex_functions[q_type].assert_called_with(
+        expected_call, fields=None
+    )
     assert not any(
         [f.called for q, f in mock_pokedex_functions.items() if q != q_type]
     )
@@ -140,7 +149,7 @@ def test_handle_request_type(
         assert actual == "Bad input"
     else:
         mock_pokedex.get_pokemon_by_type.assert_called_with(
-            expected_call
+            expected_call, fields=None
         )
 
         if expected:
@@ -179,7 +188,7 @@ def test_handle_request_stats(
         assert not mock_pokedex.get_pokemon_by_stats.called
     else:
         mock_pokedex.get_pokemon_by_stats.assert_called_with(
-            expected_call
+            expected_call, fields=None
         )
 
     assert not any(
@@ -192,3 +201,276 @@ def test_handle_request_stats(
     else:
         assert code == 404
         assert actual == "Not found"
+
+
+@pytest.mark.parametrize(
+    "arg, expected_call, expected", [
+        ("", None, None),
+        (" ", None, None),
+        ("charzard", 'charzard', []),
+        (" charzard ", 'charzard', [{'score': 0.7, 'pokemon': {'id': '6'}}])
+    ]
+)
+def test_handle_request_fuzzy(
+    query_server,
+    mock_pokedex, mock_query_server_publish, mock_pokedex_functions,
+    arg, expected_call, expected
+):
+    mock_pokedex.get_pokemon_by_fuzzy_name.return_value = expected
+
+    code, actual = query_server._request_received('FUZZY', arg)
+
+    assert not any(
+        [f.called for q, f in mock_pokedex_functions.items() if q != 'FUZZY']
+    )
+    if not expected_call:
+        assert not mock_pokedex.get_pokemon_by_fuzzy_name.called
+        assert code == 403
+        return
+
+    mock_pokedex.get_pokemon_by_fuzzy_name.assert_called_with(
+        expected_call, query_server.fuzzy_limit, fields=None
+    )
+    if expected:
+        assert code == 200
+        assert actual == expected
+    else:
+        assert code == 404
+
+
+def test_request_received_single_flight(
+    query_server, mock_pokedex, mock_pokedex_functions
+):
+    mock_pokedex.get_pokemon_by_type.return_value = [{'id': 1}]
+    keys = []
+
+    def do(key, func, *args):
+        keys.append(key)
+        return func(*args)
+
+    query_server.single_flight.do = do
+
+    assert query_server._request_received('TYPE', ' Dragon ') == (
+        200, [{'id': 1}]
+    )
+    assert keys == [('TYPE', 'dragon', None)]
+
+
+@pytest.mark.parametrize(
+    "args, options, valid", [
+        (['ID', '1'], {}, True),
+        (['NAME', 'pikachu'], {'fields': 'id'}, True),
+        (['TYPE', 'fire'], {'limit': 2, 'cursor': '2', 'fields': 'id'}, True),
+        (['STATS', 'hp>50'], {'stream': True}, True),
+        (['ID', '1'], {'limit': 2}, False),
+        (['TYPE', 'fire'], {'bogus': 1}, False),
+        (['TYPE', 'fire', 'water'], {}, False),
+        (['TYPE'], {}, False),
+        (['BATTLE', '1', '2'], {}, False)
+    ]
+)
+def test_valid_request(query_server, args, options, valid):
+    assert query_server._valid_request(args, options) is valid
+
+
+def test_respond_single_flight_keys(query_server, mock_pokedex):
+    mock_pokedex.get_pokemon_by_type.return_value = [{'id': 1}]
+    keys = []
+
+    def do(key, func, *args):
+        keys.append(key)
+        return func(*args)
+
+    query_server.single_flight.do = do
+
+    query_server._respond(wire.JSON, ['TYPE', ' Dragon '], {})
+    query_server._respond(wire.MSGPACK, ['TYPE', 'dragon'], {'fields': 'id'})
+    assert keys == [
+        (wire.JSON, 'TYPE', 'dragon', None),
+        (wire.MSGPACK, 'TYPE', 'dragon', ('id',))
+    ]
+
+
+@pytest.mark.parametrize("cache", [None, LRUCache(10, max_bytes=1024)])
+def test_respond_single_flight_shares_body(
+    fake_queue_name, mock_pokedex, cache
+):
+    mock_pokedex.data_version.return_value = 1
+    server = QueryServer(fake_queue_name, mock_pokedex, cache)
+    started = threading.Event()
+    release = threading.Event()
+    bodies = []
+
+    def slow(*args, **kwargs):
+        started.set()
+        release.wait(5)
+        return [{'id': 1}]
+
+    def run():
+        bodies.append(server._respond(wire.JSON, ['TYPE', 'dragon'], {}))
+
+    mock_pokedex.get_pokemon_by_type.side_effect = slow
+    encode = Mock(wraps=base_server.encode_result)
+    with patch.object(query_server_module, 'encode_result', encode), \
+            patch.object(base_server, 'encode_result', encode):
+        leader = threading.Thread(target=run)
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=run) for _ in range(4)]
+        for thread in followers:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+
+    assert mock_pokedex.get_pokemon_by_type.call_count == 1
+    assert len(bodies) == 5
+    assert all(body is bodies[0] for body in bodies)
+    assert server.single_flight._calls == {}
+    assert encode.call_count == 1
+
+
+@pytest.fixture
+def cached_query_server(fake_queue_name, mock_pokedex):
+    mock_pokedex.data_version.return_value = 1
+    yield QueryServer(
+        fake_queue_name, mock_pokedex, LRUCache(10, max_bytes=1024)
+    )
+
+
+def test_respond_cached(cached_query_server, mock_pokedex):
+    mock_pokedex.get_pokemon_by_type.return_value = [{'id': 1}]
+
+    body = cached_query_server._respond(wire.JSON, ['TYPE', 'Dragon'], {})
+    assert body == b'{"code": 200, "data": [{"id": 1}]}'
+    assert cached_query_server._respond(
+        wire.JSON, ['TYPE', ' dragon '], {}
+    ) is body
+    assert mock_pokedex.get_pokemon_by_type.call_count == 1
+
+    # cached per wire format
+    body = cached_query_server._respond(wire.MSGPACK, ['TYPE', 'dragon'], {})
+    assert wire.decode(body, wire.MSGPACK)['data'] == [{'id': 1}]
+    assert mock_pokedex.get_pokemon_by_type.call_count == 2
+
+    # a re-import drops every cached body
+    mock_pokedex.data_version.return_value = 2
+    assert cached_query_server._respond(
+        wire.MSGPACK, ['TYPE', 'dragon'], {}
+    ) == body
+    assert mock_pokedex.get_pokemon_by_type.call_count == 3
+    assert len(cached_query_server.response_cache) == 1
+
+
+def test_respond_cached_errors(cached_query_server, mock_pokedex):
+    mock_pokedex.get_pokemon_by_type.side_effect = KeyError('boom')
+
+    body = cached_query_server._respond(wire.JSON, ['TYPE', 'dragon'], {})
+    assert body == b'{"code": 500, "data": "Internal server error"}'
+    assert len(cached_query_server.response_cache) == 0
+
+    assert cached_query_server._respond(wire.JSON, ['TYPE', ''], {}) == (
+        b'{"code": 403, "data": "Bad input"}'
+    )
+    assert len(cached_query_server.response_cache) == 1
+
+
+@pytest.mark.parametrize(
+    "page, expected, cursor", [
+        ({'limit': 2}, [1, 2], '2'),
+        ({'limit': 2, 'cursor': '2'}, [3, 4], '4'),
+        ({'limit': 2, 'cursor': '4'}, [5], None),
+        ({'limit': 10}, [1, 2, 3, 4, 5], None),
+        ({'cursor': '3'}, [4, 5], None),
+        ({'cursor': '5'}, [], None)
+    ]
+)
+def test_respond_page(query_server, mock_pokedex, page, expected, cursor):
+    mock_pokedex.get_pokemon_by_type.return_value = [1, 2, 3, 4, 5]
+
+    body = query_server._respond(wire.JSON, ['TYPE', 'dragon'], page)
+    assert wire.decode(body) == {
+        'code': 200, 'data': expected, 'cursor': cursor
+    }
+
+
+@pytest.mark.parametrize(
+    "page", [
+        {'limit': 0},
+        {'limit': 'a'},
+        {'cursor': '-1'},
+        {'cursor': 'x'}
+    ]
+)
+def test_respond_page_bad_input(query_server, mock_pokedex, page):
+    body = query_server._respond(wire.JSON, ['TYPE', 'dragon'], page)
+    assert wire.decode(body) == {'code': 403, 'data': 'Bad input'}
+    assert not mock_pokedex.get_pokemon_by_type.called
+
+
+def test_respond_page_not_found(query_server, mock_pokedex):
+    mock_pokedex.get_pokemon_by_type.return_value = []
+
+    body = query_server._respond(wire.JSON, ['TYPE', 'dragon'], {'limit': 2})
+    assert wire.decode(body) == {'code': 404, 'data': 'Not found'}
+
+
+@pytest.mark.parametrize(
+    "page, expected", [
+        ({'stream': True, 'limit': 2}, [[1, 2], [3, 4], [5]]),
+        ({'stream': True, 'limit': 5}, [[1, 2, 3, 4, 5]]),
+        ({'stream': True, 'limit': 2, 'cursor': '3'}, [[4, 5]]),
+        ({'stream': True, 'cursor': '5'}, [[]]),
+        ({'stream': True}, [[1, 2, 3, 4, 5]])
+    ]
+)
+def test_respond_stream(query_server, mock_pokedex, page, expected):
+    mock_pokedex.get_pokemon_by_type.return_value = [1, 2, 3, 4, 5]
+
+    bodies = query_server._respond(wire.MSGPACK, ['TYPE', 'dragon'], page)
+    messages = [wire.decode(body, wire.MSGPACK) for body in bodies]
+    assert [m['data'] for m in messages] == expected
+    assert [m['more'] for m in messages] == [True] * (len(expected) - 1) + [
+        False
+    ]
+
+
+@pytest.mark.parametrize(
+    "fields, expected", [
+        ('name', ('name',)),
+        (' Name, id ,', ('id', 'name')),
+        (['stats.attack', 'id'], ('id', 'stats.attack'))
+    ]
+)
+def test_request_received_fields(
+    query_server, mock_pokedex, fields, expected
+):
+    mock_pokedex.get_pokemon_by_id.return_value = {'id': '1'}
+
+    assert query_server._request_received('ID', '1', fields) == (
+        200, {'id': '1'}
+    )
+    mock_pokedex.get_pokemon_by_id.assert_called_with('1', fields=expected)
+
+
+def test_request_received_bad_fields(query_server, mock_pokedex):
+    mock_pokedex.get_pokemon_by_id.side_effect = ValueError("Unknown field")
+
+    assert query_server._request_received('ID', '1', 'nope') == (
+        403, "Bad input"
+    )
+
+
+def test_respond_cached_fields(cached_query_server, mock_pokedex):
+    mock_pokedex.get_pokemon_by_type.return_value = [{'id': 1}]
+
+    cached_query_server._respond(
+        wire.JSON, ['TYPE', 'dragon'], {'fields': 'id'}
+    )
+    cached_query_server._respond(
+        wire.JSON, ['TYPE', 'dragon'], {'fields': ' ID'}
+    )
+    cached_query_server._respond(wire.JSON, ['TYPE', 'dragon'], {})
+
+    assert mock_pokedex.get_pokemon_by_type.call_count == 2
@@ -0,0 +1,55 @@
+import pytest
+from backend.projection import parse_fields
+from backend.record import PokemonRecord
+
+CHARIZARD = {
+    'id': '6', 'name': 'Charizard', 'type': ['Fire', 'Flying'],
+    'stats': {'total': 534, 'hp': 78, 'attack': 84, 'defence': 78,
+              'sp.atk': 109, 'sp.def': 85, 'speed': 100},
+    'gen': 1, 'legendary': False
+}
+
+
+def test_from_dict():
+    pokemon = PokemonRecord.from_dict(CHARIZARD)
+
+    assert pokemon.name == 'Charizard'
+    assert pokemon.type == ('Fire', 'Flying')
+    assert (pokemon.hp, pokemon.sp_atk, pokemon.speed) == (78, 109, 100)
+    assert pokemon.to_dict() == CHARIZARD
+    assert not hasattr(pokemon, '__dict__')
+
+
+def test_partial():
+    # fields that were never read are left out of the document
+    pokemon = PokemonRecord.from_dict({'id': '6', 'stats': {'hp': 78}})
+
+    assert pokemon.name is None
+    assert pokemon.stats() == {'hp': 78}
+    assert pokemon.to_dict() == {'id': '6', 'stats': {'hp': 78}}
+
+
+@pytest.mark.parametrize(
+    "fields, expected", [
+        ('name', {'name': 'Charizard'}),
+        ('id,stats.hp,stats.speed', {'id': '6',
+                                     'stats': {'hp': 78, 'speed': 100}}),
+        ('legendary', {'legendary': False})
+    ]
+)
+def test_project(fields, expected):
+    pokemon = PokemonRecord.from_dict(CHARIZARD)
+    projected = pokemon.project(parse_fields(fields))
+
+    assert projected.to_dict() == expected
+    assert projected.hp == 78
+    assert pokemon.to_dict() == CHARIZARD
+    assert pokemon.project(None) is pokemon
+
+
+def test_eq():
+    assert PokemonRecord.from_dict(CHARIZARD) == \
+        PokemonRecord.from_dict(CHARIZARD)
+    assert PokemonRecord.from_dict(CHARIZARD) != \
+        PokemonRecord.from_dict(dict(CHARIZARD, name='Other'))
+    assert PokemonRecord.from_dict(CHARIZARD) != CHARIZARD
@@ -0,0 +1,56 @@
+import threading
+import time
+
+import pytest
+from backend.single_flight import SingleFlight
+
+
+def test_do_returns_result():
+    single_flight = SingleFlight()
+    assert single_flight.do('k', lambda a: a * 2, 21) == 42
+    assert single_flight._calls == {}
+
+
+def test_concurrent_calls_share_one_execution():
+    single_flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return ['shared']
+
+    def run():
+        results.append(single_flight.do(('TYPE', 'dragon'), slow))
+
+    leader = threading.Thread(target=run)
+    leader.start()
+    started.wait(5)
+
+    followers = [threading.Thread(target=run) for _ in range(4)]
+    for thread in followers:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert calls == [1]
+    assert len(results) == 5
+    assert all(r is results[0] for r in results)
+    assert single_flight._calls == {}
+
+
+def test_error_is_shared_and_cleared():
+    single_flight = SingleFlight()
+
+    def fail():
+        raise KeyError('boom')
+
+    with pytest.raises(KeyError):
+        single_flight.do('k', fail)
+    assert single_flight.do('k', lambda: 1) == 1
@@ -0,0 +1,69 @@
+import pytest
+from backend.stats_query import SortedStatIndex, score_range
+
+COLUMNS = {
+    'hp': [45, 39, 78, 90, 20],
+    'attack': [49, 52, 84, 100, 40],
+    'speed': [45, 65, 100, 90, 60]
+}
+
+
+@pytest.fixture
+def index():
+    yield SortedStatIndex(COLUMNS)
+
+
+@pytest.mark.parametrize(
+    "stat, op, value, expected", [
+        ('hp', '>', 45, [2, 3]),
+        ('hp', '>=', 45, [0, 2, 3]),
+        ('hp', '=>', 45, [0, 2, 3]),
+        ('hp', '<', 45, [1, 4]),
+        ('hp', '<=', 45, [0, 1, 4]),
+        ('hp', '=<', 45, [0, 1, 4]),
+        ('hp', '=', 45, [0]),
+        ('hp', '=', 46, []),
+        ('HP', '>', 1000, []),
+        ('unknown', '>', 1, [])
+    ]
+)
+def test_scan(index, stat, op, value, expected):
+    assert sorted(index.scan(stat, op, value)) == expected
+
+
+@pytest.mark.parametrize(
+    "stats, expected", [
+        ([], []),
+        ([('hp', '>', 40)], [0, 2, 3]),
+        ([('hp', '>', 40), ('speed', '>=', 90)], [2, 3]),
+        ([('attack', '>', 80), ('speed', '>=', 90), ('hp', '<', 80)], [2]),
+        ([('attack', '>', 80), ('unknown', '>', 1)], [])
+    ]
+)
+def test_query(index, stats, expected):
+    assert index.query(stats) == expected
+
+
+def test_query_bad_operator(index):
+    with pytest.raises(ValueError):
+        index.query([('hp', '<>', 1)])
+
+
+@pytest.mark.parametrize(
+    "op, value, expected", [
+        ('>', 10, ('(10', '+inf')),
+        ('>=', 10, (10, '+inf')),
+        ('=>', 10, (10, '+inf')),
+        ('<', 10, ('-inf', '(10')),
+        ('<=', 10, ('-inf', 10)),
+        ('=<', 10, ('-inf', 10)),
+        ('=', 10, (10, 10))
+    ]
+)
+def test_score_range(op, value, expected):
+    assert score_range(op, value) == expected
+
+
+def test_score_range_bad_operator():
+    with pytest.raises(ValueError):
+        score_range('<>', 1)
@@ -0,0 +1,114 @@
+import pytest
+from mock import MagicMock, patch
+from backend.supervisor import Supervisor
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    clock = FakeClock()
+    with patch("backend.supervisor.time.time", clock.time):
+        yield clock
+
+
+@pytest.fixture
+def supervisor():
+    supervisor = Supervisor(3, MagicMock(), ('a',))
+    supervisor._context = MagicMock()
+    supervisor._context.Process.side_effect = lambda **kwargs: MagicMock(
+        name=kwargs['name']
+    )
+    yield supervisor
+
+
+def test_start_workers(supervisor):
+    for slot in range(supervisor.processes):
+        supervisor._start(slot)
+
+    assert len(supervisor.workers) == 3
+    for worker in supervisor.workers.values():
+        worker.start.assert_called_once_with()
+    _, kwargs = supervisor._context.Process.call_args
+    assert kwargs['args'] == (supervisor.target, ('a',))
+
+
+def test_check_workers_restarts_dead(supervisor, clock):
+    for slot in range(supervisor.processes):
+        supervisor._start(slot)
+    dead = supervisor.workers[1]
+    dead.is_alive.return_value = False
+    alive = [supervisor.workers[0], supervisor.workers[2]]
+
+    supervisor.check_workers()
+    assert supervisor.workers[1] is dead
+    assert supervisor.restart_at == {1: clock.now + supervisor.restart_delay}
+
+    clock.now += supervisor.restart_delay
+    supervisor.check_workers()
+
+    assert supervisor.workers[1] is not dead
+    assert supervisor.workers[1].start.called
+    assert supervisor.workers[0] is alive[0]
+    assert supervisor.workers[2] is alive[1]
+    assert supervisor._context.Process.call_count == 4
+    assert supervisor.restart_at == {}
+
+
+def _restart_delays(supervisor, clock, runs):
+    # the delays before each restart of a worker that dies after running
+    # for each of runs seconds
+    supervisor._start(0)
+    delays = []
+    for run in runs:
+        clock.now += run
+        supervisor.workers[0].is_alive.return_value = False
+        supervisor.check_workers()
+        delay = supervisor.restart_at[0] - clock.now
+        delays.append(delay)
+        clock.now += delay
+        supervisor.check_workers()
+    return delays
+
+
+def test_check_workers_backs_off(supervisor, clock):
+    supervisor.max_restart_delay = 16
+    assert _restart_delays(supervisor, clock, [0] * 8) == [
+        1, 2, 4, 8, 16, 16, 16, 16
+    ]
+    assert supervisor._context.Process.call_count == 9
+
+
+def test_check_workers_stable_worker_starts_over(supervisor, clock):
+    assert _restart_delays(
+        supervisor, clock, [0, 0, 0, supervisor.stable_time, 0]
+    ) == [1, 2, 4, 1, 2]
+
+
+@pytest.mark.parametrize("stuck", [False, True])
+def test_shutdown(supervisor, stuck):
+    supervisor.shutdown_timeout = 0
+    supervisor._start(0)
+    worker = supervisor.workers[0]
+    worker.is_alive.return_value = True
+    if not stuck:
+        worker.join.side_effect = lambda *args: setattr(
+            worker.is_alive, 'return_value', False
+        )
+
+    supervisor.shutdown()
+
+    worker.terminate.assert_called_once_with()
+    assert worker.kill.called == stuck
+
+
+def test_stop(supervisor):
+    supervisor.stop()
+    assert supervisor.stopping
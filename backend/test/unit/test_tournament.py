@@ -0,0 +1,134 @@
+import numpy as np
+import pytest
+from mock import MagicMock
+from backend.tournament import (
+    ELO_K, ELO_START, Standings, bracket, fight, round_robin, schedule
+)
+
+
+def _stats(*rows):
+    # (hp, attack, defence, speed) per pokemon
+    return np.array(rows, dtype=np.int64)
+
+
+# strongest first, every battle is decided
+STATS = _stats(
+    (300, 90, 40, 50), (250, 70, 30, 40), (200, 50, 20, 30),
+    (150, 40, 10, 20), (100, 30, 5, 10)
+)
+
+
+def _pairs(played):
+    return sorted(
+        tuple(sorted(pair)) for first, second in played
+        for pair in zip(first.tolist(), second.tolist())
+    )
+
+
+def test_fight():
+    # the last one can only heal itself
+    stats = np.vstack([STATS, _stats((100, 10, 50, 5))])
+    results = fight(stats, np.array([0, 4, 5]), np.array([4, 0, 5]), 8)
+    assert results.tolist() == [1, -1, 0]
+
+
+@pytest.mark.parametrize("size", [2, 3, 4, 7, 10])
+def test_schedule(size):
+    played = schedule(size)
+
+    assert len(played) == size - 1 + size % 2
+    assert _pairs(played) == [
+        (i, j) for i in range(size) for j in range(i + 1, size)
+    ]
+    for first, second in played:
+        entrants = first.tolist() + second.tolist()
+        assert len(entrants) == len(set(entrants))
+
+
+def test_standings_add():
+    standings = Standings(3)
+    standings.add(np.array([0]), np.array([1]), np.array([1]))
+    standings.add(np.array([2]), np.array([0]), np.array([0]))
+
+    assert standings.wins.tolist() == [1, 0, 0]
+    assert standings.losses.tolist() == [0, 1, 0]
+    assert standings.draws.tolist() == [1, 0, 1]
+    assert standings.played == 2
+
+    # the first battle was between equals
+    first = ELO_START + ELO_K / 2
+    assert standings.rating[1] == pytest.approx(ELO_START - ELO_K / 2)
+    expected = 1 / (1 + 10 ** ((first - ELO_START) / 400))
+    assert standings.rating[2] == pytest.approx(
+        ELO_START + ELO_K * (0.5 - expected)
+    )
+    assert standings.rating[0] == pytest.approx(
+        first - ELO_K * (0.5 - expected)
+    )
+    assert standings.ranking().tolist() == [0, 2, 1]
+
+
+def test_round_robin():
+    updates = [
+        (standings.played, standings.wins.tolist())
+        for standings in round_robin(STATS, 8, 4)
+    ]
+
+    # two rounds of two battles per chunk
+    assert [played for played, _ in updates] == [4, 8, 10]
+    assert updates[-1][1] == [4, 3, 2, 1, 0]
+
+
+def test_round_robin_map_chunks():
+    map_chunks = MagicMock(side_effect=map)
+    standings = list(round_robin(STATS, 8, 100, map_chunks))[-1]
+
+    assert map_chunks.call_count == 1
+    assert standings.ranking().tolist() == [0, 1, 2, 3, 4]
+
+
+def test_bracket():
+    rounds = list(bracket(STATS, 8))
+
+    # 0-1 and 2-3 while 4 has a bye, then 0-2 while 4 waits again
+    assert [(first.tolist(), second.tolist(), winners.tolist())
+            for _, first, second, winners in rounds] == [
+        ([0, 2], [1, 3], [0, 2]),
+        ([0], [2], [0]),
+        ([0], [4], [0])
+    ]
+    assert rounds[-1][0].played == 4
+
+
+def _bracket_winners(stats, seeds):
+    return [list(bracket(stats, 8, seed))[-1][3].tolist() for seed in seeds]
+
+
+def test_bracket_draw():
+    # settled by a coin toss, the same one for the same seed
+    healers = _stats((100, 10, 50, 5), (100, 10, 50, 5))
+    winners = _bracket_winners(healers, range(20))
+
+    assert winners == _bracket_winners(healers, range(20))
+    assert sorted(set(w for w, in winners)) == [0, 1]
+
+
+def test_fight_seed():
+    # equal speed, so every round is a coin toss
+    stats = _stats((100, 60, 20, 5), (100, 60, 20, 5))
+    first, second = np.zeros(50, dtype=int), np.ones(50, dtype=int)
+
+    assert fight(stats, first, second, 8, 7).tolist() == \
+        fight(stats, first, second, 8, 7).tolist()
+    assert sorted(set(fight(stats, first, second, 8, 7).tolist())) == [-1, 1]
+
+
+def test_round_robin_seed():
+    stats = _stats(*[(100, 60, 20, 5)] * 6)
+
+    def ratings(seed):
+        return [standings.rating.tolist()
+                for standings in round_robin(stats, 8, 3, seed=seed)]
+
+    assert ratings(3) == ratings(3)
+    assert ratings(3) != ratings(4)
@@ -0,0 +1,62 @@
+import pytest
+from mock import patch
+from backend import wire
+from backend.record import PokemonRecord
+
+
+@pytest.mark.parametrize(
+    "content_type, expected", [
+        (None, wire.JSON),
+        ('text/plain', wire.JSON),
+        (wire.JSON, wire.JSON),
+        (wire.MSGPACK, wire.MSGPACK)
+    ]
+)
+def test_response_type(content_type, expected):
+    assert wire.response_type(content_type) == expected
+
+
+def test_response_type_without_msgpack():
+    with patch.dict(wire.CODECS, clear=True) as codecs:
+        codecs[wire.JSON] = (None, None)
+        assert wire.response_type(wire.MSGPACK) == wire.JSON
+
+
+@pytest.mark.parametrize("content_type", [wire.JSON, wire.MSGPACK])
+def test_encode_decode(content_type):
+    body = {'code': 200, 'data': [{'name': 'Flabébé'}]}
+    encoded = wire.encode(body, content_type)
+    assert isinstance(encoded, bytes)
+    assert wire.decode(encoded, content_type) == body
+
+
+def test_encode_msgpack_round_keys():
+    body = {'combatants': ['a', 'b'], 1: []}
+    assert wire.decode(wire.encode(body, wire.MSGPACK), wire.MSGPACK) == body
+
+
+@pytest.mark.parametrize(
+    "body, content_type, expected", [
+        (b'ID:1', None, (['ID', '1'], {})),
+        (b'BATTLE:1:2', 'text/plain', (['BATTLE', '1', '2'], {})),
+        ('NAME:Flabébé'.encode('utf-8'), None,
+         (['NAME', 'Flabébé'], {})),
+        (b'{"type": "ID", "args": ["1"]}', wire.JSON, (['ID', '1'], {})),
+        (wire.encode_request('BATTLE', ['1', '2'], {'seed': 3}, wire.MSGPACK),
+         wire.MSGPACK, (['BATTLE', '1', '2'], {'seed': 3}))
+    ]
+)
+def test_decode_request(body, content_type, expected):
+    assert wire.decode_request(body, content_type) == expected
+
+
+@pytest.mark.parametrize("content_type", [wire.JSON, wire.MSGPACK])
+def test_encode_records(content_type):
+    record = PokemonRecord('6', 'Charizard', ('Fire', 'Flying'))
+    encoded = wire.encode({'data': [record]}, content_type)
+
+    assert wire.decode(encoded, content_type) == {'data': [{
+        'id': '6', 'name': 'Charizard', 'type': ['Fire', 'Flying']
+    }]}
+    with pytest.raises(TypeError):
+        wire.encode({'data': object()}, content_type)